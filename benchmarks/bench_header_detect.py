@@ -0,0 +1,117 @@
+"""
+BENCHMARK: DETEKSI HEADER & RENAME KOLOM (SALINAN LAMA vs utils_header)
+Jalankan: python benchmarks/bench_header_detect.py [ulangan]
+
+- Korpus header "kotor" dari lapangan ada di benchmarks/header_corpus.json
+  (judul laporan, baris kosong, BOM, tanda kutip, gaya Inggris, header di baris 25, dst).
+- Setiap kasus dicek: baris header & daftar kolom standar yang dikenali harus sesuai.
+- Waktu dibandingkan dengan logika lama main.py (fix_header_position + smart_rename_columns).
+"""
+import json
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils_header import COLUMN_ALIASES, detect_header, fix_header_position, smart_rename_columns  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'header_corpus.json')
+
+
+# --- SALINAN LOGIKA LAMA (main.py sebelum utils_header) ---
+def legacy_normalize_text(text):
+    if not isinstance(text, str): return str(text).lower()
+    return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
+
+
+def legacy_fix_header_position(df):
+    target = COLUMN_ALIASES['nopol']
+    for i in range(min(30, len(df))):
+        vals = [legacy_normalize_text(str(x)) for x in df.iloc[i].values]
+        if any(alias in vals for alias in target):
+            df.columns = df.iloc[i]
+            df = df.iloc[i+1:].reset_index(drop=True)
+            return df
+    return df
+
+
+def legacy_smart_rename_columns(df):
+    new_cols = {}; found_std = set()
+    df.columns = [str(c).strip().replace('"', '').replace("'", "").lower() for c in df.columns]
+    for col in df.columns:
+        clean_col = re.sub(r'[^a-z0-9]', '', col)
+        new_cols[col] = col
+        for std_name, aliases in COLUMN_ALIASES.items():
+            if (clean_col == std_name or clean_col in aliases) and std_name not in found_std:
+                new_cols[col] = std_name; found_std.add(std_name)
+                break
+    df.rename(columns=new_cols, inplace=True)
+    return df, list(found_std)
+
+
+def as_read_csv(rows):
+    """Tiru hasil pd.read_csv(dtype=str): baris pertama jadi header."""
+    width = max(len(r) for r in rows)
+    padded = [[None if v is None else str(v) for v in r] + [None] * (width - len(r)) for r in rows]
+    return pd.DataFrame(padded[1:], columns=[str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(padded[0])])
+
+
+def as_raw(rows):
+    width = max(len(r) for r in rows)
+    return pd.DataFrame([[None if v is None else str(v) for v in r] + [None] * (width - len(r)) for r in rows])
+
+
+def run_new(rows):
+    df, found = smart_rename_columns(fix_header_position(as_read_csv(rows)))
+    return sorted(found)
+
+
+def run_legacy(rows):
+    df, found = legacy_smart_rename_columns(legacy_fix_header_position(as_read_csv(rows)))
+    return sorted(found)
+
+
+def timed(fn, cases, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for c in cases: fn(c['rows'])
+    return (time.perf_counter() - t0) / (repeat * len(cases))
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CORPUS, encoding='utf-8') as f: cases = json.load(f)
+
+    fails = 0
+    print(f"{'KASUS':<34} {'BARU':<6} {'LAMA':<6}")
+    for c in cases:
+        header_at, _, found = detect_header(as_raw(c['rows']))
+        ok_new = header_at == c['header_row'] and sorted(found) == c['found'] and run_new(c['rows']) == c['found']
+        ok_old = run_legacy(c['rows']) == c['found']
+        fails += not ok_new
+        print(f"{c['name']:<34} {'✅' if ok_new else '❌':<6} {'✅' if ok_old else '❌':<6}")
+
+    t_new = timed(run_new, cases, repeat)
+    t_old = timed(run_legacy, cases, repeat)
+    print(f"\n⚡ utils_header : {t_new * 1e6:8.1f} µs / file")
+    print(f"🐢 logika lama  : {t_old * 1e6:8.1f} µs / file ({t_old / t_new:.1f}x)")
+
+    # File lebar: 60 kolom, header di baris 28
+    wide = [[f"ket {i}"] + [None] * 59 for i in range(28)]
+    wide.append(['NO', 'NOMOR POLISI'] + [f"KOLOM {j}" for j in range(58)])
+    wide += [[str(k), f"B {k} XY"] + ['x'] * 58 for k in range(200)]
+    w_new = timed(run_new, [{'rows': wide}], repeat // 4 or 1)
+    w_old = timed(run_legacy, [{'rows': wide}], repeat // 4 or 1)
+    print(f"📐 File lebar   : baru {w_new * 1e3:6.2f} ms | lama {w_old * 1e3:6.2f} ms ({w_old / w_new:.1f}x)")
+
+    if fails:
+        print(f"\n❌ {fails} kasus korpus GAGAL")
+        sys.exit(1)
+    print("\n✅ Semua kasus korpus lolos")
+
+
+if __name__ == "__main__":
+    main()
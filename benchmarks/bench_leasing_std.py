@@ -0,0 +1,86 @@
+"""
+BENCHMARK: STANDARISASI NAMA LEASING (LOOP KAMUS LAMA vs MATCHER TERKOMPILASI)
+Jalankan: python benchmarks/bench_leasing_std.py [jumlah_baris]
+
+- LAMA : loop 'for key in keywords' per baris via df['finance'].apply(...)
+- BARU : regex tunggal + memo (standardize_leasing_name) & versi kolom
+         standardize_leasing_series (hanya nilai unik yang dicocokkan).
+- Hasil ketiganya dicek harus identik sebelum waktu dicetak.
+"""
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils_leasing import (  # noqa: E402
+    LEASING_KEYWORDS, _match_leasing, standardize_leasing_name, standardize_leasing_series
+)
+
+NOISE = ['PT', 'PT.', 'TBK', 'CABANG', 'FINANCE', 'MULTIFINANCE', 'INDONESIA', 'JKT', 'SBY']
+
+
+def legacy_standardize(raw_name):
+    """Salinan logika lama (sebelum dikompilasi) sebagai pembanding."""
+    if not raw_name: return "UNKNOWN"
+    text = str(raw_name).upper().strip()
+    for key, label in LEASING_KEYWORDS.items():
+        if key in text:
+            return label
+    return text
+
+
+def synthetic_names(n, n_unique=400, seed=42):
+    rnd = random.Random(seed)
+    keys = list(LEASING_KEYWORDS)
+    pool = []
+    for _ in range(n_unique):
+        parts = rnd.sample(NOISE, rnd.randint(1, 3))
+        if rnd.random() < 0.9: parts.insert(rnd.randint(0, len(parts)), rnd.choice(keys).title())
+        pool.append(" ".join(parts))
+    pool += [None, '', float('nan')]
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    s = pd.Series(synthetic_names(n), name='finance')
+    print(f"📦 {n:,} baris, {s.nunique(dropna=False):,} nama unik")
+
+    old, t_old = timed(lambda: s.apply(legacy_standardize))
+    _match_leasing.cache_clear()
+    new_apply, t_apply = timed(lambda: s.apply(standardize_leasing_name))
+    _match_leasing.cache_clear()
+    new_series, t_series = timed(lambda: standardize_leasing_series(s))
+
+    assert old.equals(new_apply), "Hasil apply() baru berbeda dari logika lama!"
+    assert old.equals(new_series), "Hasil standardize_leasing_series berbeda dari logika lama!"
+
+    print(f"🐢 LAMA  apply(loop kamus)        : {t_old:7.2f} detik")
+    print(f"⚡ BARU  apply(regex + memo)      : {t_apply:7.2f} detik ({t_old / t_apply:5.1f}x)")
+    print(f"🚀 BARU  standardize_leasing_series: {t_series:7.2f} detik ({t_old / t_series:5.1f}x)")
+
+    # Nama unik tanpa memo: ukur biaya murni matcher per panggilan
+    names = [str(x).upper().strip() for x in s.unique() if x]
+    reps = max(1, 200_000 // max(len(names), 1))
+    _, t_l = timed(lambda: [legacy_standardize(x) for _ in range(reps) for x in names])
+
+    def cold():
+        for _ in range(reps):
+            _match_leasing.cache_clear()
+            for x in names: _match_leasing(x)
+    _, t_c = timed(cold)
+    calls = reps * len(names)
+    print(f"🔬 Per nama (tanpa memo): lama {t_l / calls * 1e6:6.1f} µs | regex {t_c / calls * 1e6:6.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
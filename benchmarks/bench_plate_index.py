@@ -0,0 +1,80 @@
+"""
+BENCHMARK: PLATE INDEX vs ROUND-TRIP SUPABASE
+Jalankan: python benchmarks/bench_plate_index.py [jumlah_baris]
+
+- Selalu mengukur build & lookup index di memori dengan data sintetis.
+- Jika SUPABASE_URL & SUPABASE_KEY tersedia, ikut mengukur query asli
+  `nopol.ilike.%kw%,noka.eq.kw,nosin.eq.kw` (jalur lama handle_message).
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils_index import PlateIndex  # noqa: E402
+
+PREFIXES = ['B', 'D', 'F', 'L', 'N', 'AB', 'AD', 'BK', 'DK', 'KT']
+
+
+def synthetic_rows(n, seed=42):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        nopol = f"{rnd.choice(PREFIXES)} {rnd.randint(1, 9999)} {''.join(rnd.choices(string.ascii_uppercase, k=rnd.randint(1, 3)))}"
+        yield {
+            'nopol': nopol,
+            'noka': ''.join(rnd.choices(string.ascii_uppercase + string.digits, k=17)),
+            'nosin': ''.join(rnd.choices(string.ascii_uppercase + string.digits, k=12)),
+        }
+
+
+def timed(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat): fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    rows = list(synthetic_rows(n))
+
+    idx = PlateIndex()
+    t0 = time.perf_counter()
+    idx.build(rows)
+    print(f"📦 Build {len(idx):,} nopol: {time.perf_counter() - t0:.2f} detik")
+
+    sample = random.Random(7).sample(rows, 200)
+    exact_kw = [r['nopol'].replace(' ', '') for r in sample]
+    sub_kw = [k[1:6] for k in exact_kw]
+    noka_kw = [r['noka'] for r in sample]
+
+    for label, kws in (("EXACT NOPOL", exact_kw), ("SUBSTRING", sub_kw), ("EXACT NOKA", noka_kw)):
+        avg = timed(lambda: [idx.search(k) for k in kws], 5) / len(kws)
+        print(f"⚡ Index {label:<12}: {avg * 1e6:8.1f} µs / lookup")
+
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    if not url or not key:
+        print("ℹ️ SUPABASE_URL/KEY tidak diset: perbandingan round-trip dilewati.")
+        return
+
+    from supabase import create_client
+    client = create_client(url, key)
+    live_kw = exact_kw[:20]
+
+    def old_path(kw):
+        client.table('kendaraan').select("*").or_(f"nopol.ilike.%{kw}%,noka.eq.{kw},nosin.eq.{kw}").limit(20).execute()
+
+    def detail_fetch(kw):
+        # Jalur baru: index lokal + ambil detail by nopol (index pada DB sintetis tidak
+        # berisi nopol asli, jadi yang diukur adalah biaya fetch detail-nya saja)
+        client.table('kendaraan').select("*").in_('nopol', [kw]).execute()
+
+    avg_old = timed(lambda: [old_path(k) for k in live_kw], 1) / len(live_kw)
+    avg_new = timed(lambda: [detail_fetch(k) for k in live_kw], 1) / len(live_kw)
+    print(f"🐢 Round-trip lama (ilike scan) : {avg_old * 1000:8.1f} ms / pencarian")
+    print(f"🚀 Fetch detail by nopol (baru): {avg_new * 1000:8.1f} ms / pencarian")
+
+
+if __name__ == "__main__":
+    main()
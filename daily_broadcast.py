@@ -1,10 +1,12 @@
 import os
-import time
-import requests
-from supabase import create_client
+import asyncio
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
+from utils_broadcast import BroadcastCheckpoint, broadcast_message
+from utils_export import iter_keyset_pages
+from utils_supabase import get_client
+
 # Init
 load_dotenv()
 
@@ -14,13 +16,17 @@ KEY = os.environ.get("SUPABASE_KEY")
 TOKEN = os.environ.get("TELEGRAM_TOKEN") # Sesuai variabel Komandan
 
 # --- BATAS AMAN ANTI-SPAM ---
-BATCH_SIZE = 20      
-SLEEP_TIME = 2.0     
+# Token bucket 20 pesan/detik (konservatif, batas bot Telegram ~30/detik) + hormati 429 retry_after
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 20))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 16))
+# Penerima yang sudah selesai (dan isi pesannya) dicatat di sini per tanggal;
+# jika broadcast terputus, jalankan ulang di hari yang sama
+CHECKPOINT_PATH = os.environ.get("BROADCAST_CHECKPOINT", "broadcast_checkpoint.jsonl")
 
 def get_recap_data():
     """Mengambil Data Log Terbaru (Bukan cuma kemarin)"""
     if not URL or not KEY: return None, None, 0
-    supabase = create_client(URL, KEY)
+    supabase = get_client(URL, KEY)
     
     # Ambil tanggal hari ini untuk display laporan
     today_str = datetime.now().strftime('%Y-%m-%d')
@@ -52,22 +58,18 @@ def get_all_users():
     # Catatan: Sesuaikan kolom 'user_id' di bawah jika di tabel Komandan namanya 'telegram_id'
     if not URL or not KEY: return []
     try:
-        supabase = create_client(URL, KEY)
-        res = supabase.table('users').select('user_id').execute()
+        supabase = get_client(URL, KEY)
+        # Per halaman user_id (API Supabase membatasi 1000 baris per query)
         ids = set()
-        for u in res.data:
-            if u.get('user_id'): ids.add(u['user_id'])
-        return list(ids)
+        for page in iter_keyset_pages(supabase, 'users', 'user_id', key='user_id'):
+            for u in page:
+                if u.get('user_id'): ids.add(u['user_id'])
+        return sorted(ids)
     except: return []
 
-def send_message(chat_id, text):
-    """Kirim pesan via API Telegram"""
-    url = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
-    try:
-        r = requests.post(url, json=payload, timeout=5)
-        return r.status_code == 200
-    except: return False
+def print_progress(done, total, stats):
+    if done % 50 == 0 or done == total:
+        print(f"\r⏳ Progress: {done}/{total} (✅ {stats['sent']} | 🚫 {stats['blocked']} | ❌ {stats['failed'] + stats['error']})", end="")
 
 def main():
     print("🦅 MEMULAI BROADCAST HARIAN...")
@@ -76,36 +78,52 @@ def main():
         print("❌ ERROR: TELEGRAM_TOKEN tidak ditemukan.")
         return
 
-    # 1. SIAPKAN DATA
-    rekap, tgl_kemarin, total = get_recap_data()
-    
-    if not rekap:
-        print(f"✅ Tidak ada update data kendaraan pada {tgl_kemarin}.")
-        return
+    # Satu broadcast per tanggal: jalan ulang di hari yang sama melanjutkan checkpoint
+    checkpoint = BroadcastCheckpoint(CHECKPOINT_PATH, f"daily:{datetime.now().strftime('%Y-%m-%d')}")
+    final_msg = checkpoint.saved_text()
 
-    tgl_display = datetime.strptime(tgl_kemarin, '%Y-%m-%d').strftime('%d %B %Y')
+    if final_msg:
+        # Rekap 24 jam terakhir sudah bergeser: pakai pesan yang sama dengan run pertama
+        print("♻️ Checkpoint hari ini ditemukan, memakai pesan yang tersimpan.")
+    else:
+        # 1. SIAPKAN DATA
+        rekap, tgl_kemarin, total = get_recap_data()
+        
+        if not rekap:
+            print(f"✅ Tidak ada update data kendaraan pada {tgl_kemarin}.")
+            return
+
+        tgl_display = datetime.strptime(tgl_kemarin, '%Y-%m-%d').strftime('%d %B %Y')
 
-    # 2. SUSUN PESAN
-    msg = [f"☀️ <b>SEMANGAT PAGI, MITRA B-ONE!</b> 🦅"]
-    msg.append(f"<i>Laporan Update Data Kendaraan: {tgl_display}</i>\n")
-    for leasing, jml in rekap.items():
-        msg.append(f"📂 <b>{leasing}:</b> +{jml:,} Unit")
-    msg.append(f"\n📈 <b>TOTAL UPDATE: {total:,} UNIT BARU!</b>")
-    msg.append(f"<i>Data sudah siap di sistem. Gasspoll!</i> 🔥")
-    final_msg = "\n".join(msg)
+        # 2. SUSUN PESAN
+        msg = [f"☀️ <b>SEMANGAT PAGI, MITRA B-ONE!</b> 🦅"]
+        msg.append(f"<i>Laporan Update Data Kendaraan: {tgl_display}</i>\n")
+        for leasing, jml in rekap.items():
+            msg.append(f"📂 <b>{leasing}:</b> +{jml:,} Unit")
+        msg.append(f"\n📈 <b>TOTAL UPDATE: {total:,} UNIT BARU!</b>")
+        msg.append(f"<i>Data sudah siap di sistem. Gasspoll!</i> 🔥")
+        final_msg = "\n".join(msg)
 
     # 3. KIRIM PESAN (ANTI-SPAM)
     users = get_all_users()
     print(f"🎯 Target: {len(users)} User")
 
-    sukses = 0
-    for i, uid in enumerate(users):
-        if send_message(uid, final_msg): sukses += 1
-        print(f"\r⏳ Progress: {i+1}/{len(users)}", end="")
-        if (i + 1) % BATCH_SIZE == 0:
-            time.sleep(SLEEP_TIME)
+    checkpoint.text = final_msg
+    checkpoint.open()
+    final_msg = checkpoint.text
+    if checkpoint.done: print(f"♻️ Melanjutkan broadcast: {len(checkpoint.done)} user sudah diproses sebelumnya")
+    try:
+        stats = asyncio.run(broadcast_message(
+            TOKEN, users, final_msg,
+            rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY,
+            checkpoint=checkpoint, on_progress=print_progress
+        ))
+    finally:
+        checkpoint.close()
 
-    print(f"\n✅ SELESAI! Terkirim ke {sukses} user.")
+    print(f"\n✅ SELESAI! Terkirim ke {stats['sent']} user.")
+    if stats['blocked']: print(f"🚫 {stats['blocked']} user memblokir bot.")
+    if stats['error']: print(f"⚠️ {stats['error']} gagal sementara, jalankan ulang untuk mencoba lagi.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -25,21 +25,22 @@ import io
 import zipfile
 import pytz 
 import requests 
+import threading
 from datetime import datetime, timedelta, timezone
 from supabase import create_client, Client
 from dotenv import load_dotenv
 # 👇 [BARU] TAMBAHKAN INI
-from utils_log import catat_log_kendaraan
+from utils_log import catat_log_kendaraan, flush_log_kendaraan
+from utils_supabase import get_client
+from utils_upsert import UpsertExecutor
+from utils_header import fix_header_position, smart_rename_columns
+from utils_export import iter_keyset_pages, iter_rpc_pages
+from utils_leaderboard import LeaderboardEngine, LEADERBOARD_WINDOWS
+from utils_broadcast import BroadcastJob
 
 # DEFINISI ZONA WAKTU
 TZ_JAKARTA = pytz.timezone('Asia/Jakarta')
 
-# [FIX] Import ClientOptions
-try:
-    from supabase.lib.client_options import ClientOptions
-except ImportError:
-    from supabase import ClientOptions
-
 # ##############################################################################
 # BAGIAN 1: KONFIGURASI HALAMAN
 # ##############################################################################
@@ -96,11 +97,8 @@ BOT_TOKEN = os.getenv("TELEGRAM_TOKEN") or MANUAL_TOKEN
 
 @st.cache_resource
 def init_connection():
-    try:
-        opts = ClientOptions(postgrest_client_timeout=600)
-        return create_client(URL, KEY, options=opts)
-    except Exception as e:
-        return create_client(URL, KEY)
+    # Registry bersama: utils_log memakai client yang sama (timeout 600s)
+    return get_client(URL, KEY, timeout=600)
 
 supabase = init_connection()
 
@@ -112,55 +110,139 @@ if 'upload_found_cols' not in st.session_state: st.session_state['upload_found_c
 if 'upload_result' not in st.session_state: st.session_state['upload_result'] = None
 if 'broadcast_logs' not in st.session_state: st.session_state['broadcast_logs'] = {}
 
-# --- DATABASE CRUD FUNCTIONS ---
+# --- DATA LAYER (CACHE + INCREMENTAL) ---
+# Setiap klik tombol di Streamlit menjalankan ulang seluruh script. Query berat
+# di bawah di-cache dengan TTL, hitungan dilakukan di database (RPC di
+# supabase/migrations/*_dashboard_metrics.sql), dan hit count hanya menarik log
+# BARU sejak refresh terakhir. Tombol REFRESH SYSTEM mengosongkan semua cache
+# (reset_data_cache: cache_data + state hit count).
+USERS_TTL = int(os.getenv("DASH_USERS_TTL", 60))
+METRICS_TTL = int(os.getenv("DASH_METRICS_TTL", 30))
+ASSET_COUNT_TTL = int(os.getenv("DASH_ASSET_COUNT_TTL", 600))
+HITS_DELTA_TTL = int(os.getenv("DASH_HITS_DELTA_TTL", 30))     # Tarik log baru
+HITS_FULL_TTL = int(os.getenv("DASH_HITS_FULL_TTL", 1800))     # Hitung ulang penuh (GROUP BY)
+
+def is_rpc_missing(err):
+    text = str(err)
+    return 'PGRST202' in text or 'Could not find the function' in text
+
+def to_jakarta(series):
+    s = pd.to_datetime(series, errors='coerce')
+    if s.dt.tz is None: return s.dt.tz_localize('UTC').dt.tz_convert(TZ_JAKARTA)
+    return s.dt.tz_convert(TZ_JAKARTA)
+
+@st.cache_data(ttl=ASSET_COUNT_TTL, show_spinner=False)
 def get_total_asset_count():
     try: return supabase.table('kendaraan').select('*', count='exact', head=True).execute().count
     except: return 0
 
+@st.cache_data(ttl=USERS_TTL, show_spinner=False)
 def get_all_users():
     try:
-        res = supabase.table('users').select('*').execute()
-        df = pd.DataFrame(res.data)
+        # Per halaman user_id (API Supabase membatasi 1000 baris per query)
+        rows = [r for page in iter_keyset_pages(supabase, 'users', '*', key='user_id') for r in page]
+        df = pd.DataFrame(rows)
         if not df.empty: df['user_id'] = df['user_id'].astype(str)
         return df
     except: return pd.DataFrame()
 
+def reset_data_cache():
+    """Kosongkan semua cache data dashboard, termasuk hit count incremental (cache_resource)."""
+    st.cache_data.clear()
+    _hit_count_state.clear()
+
+def refresh_users():
+    """Panggil setelah data user diubah dari dashboard agar tampilan langsung segar."""
+    get_all_users.clear()
+    get_activity_metrics.clear()
+
+@st.cache_resource
+def _hit_count_state():
+    # Dipakai bersama oleh semua sesi dashboard dalam proses yang sama
+    return {"counts": {}, "watermark": None, "full_at": 0.0, "delta_at": 0.0, "lock": threading.Lock()}
+
+def _count_hit_rows(rows, counts, watermark):
+    """Tambah hitungan dari baris finding_logs, return watermark (created_at, id) terbaru."""
+    for r in rows:
+        if r.get('created_at') and (watermark is None or (r['created_at'], r['id']) > watermark):
+            watermark = (r['created_at'], r['id'])
+        if r.get('user_id') is None: continue
+        k = str(r['user_id']); counts[k] = counts.get(k, 0) + 1
+    return watermark
+
+def _load_hit_counts_full():
+    """Hitung penuh: GROUP BY di database. Return (counts, watermark (created_at, id))."""
+    try:
+        # Satu baris per user: dipaging agar tidak terpotong max_rows (1000) API
+        rows = [r for page in iter_rpc_pages(supabase, 'user_hit_counts', order=('user_id',)) for r in page]
+        counts = {str(r['user_id']): int(r['hits']) for r in rows}
+        return counts, max(((r['last_at'], r['last_id']) for r in rows if r.get('last_at') and r.get('last_id') is not None), default=None)
+    except Exception as e:
+        if not is_rpc_missing(e): raise
+    # RPC belum terpasang: tarik user_id per halaman (cara lama, tapi tidak terpotong 1000 baris)
+    counts = {}; watermark = None
+    for page in iter_keyset_pages(supabase, 'finding_logs', 'id, user_id, created_at', key='id'):
+        watermark = _count_hit_rows(page, counts, watermark)
+    return counts, watermark
+
 def get_hit_counts():
+    """Series user_id (str) -> jumlah hit seumur hidup. Incremental sejak refresh terakhir."""
+    state = _hit_count_state()
+    try:
+        with state['lock']:
+            now = time.time()
+            if not state['full_at'] or now - state['full_at'] > HITS_FULL_TTL:
+                state['counts'], state['watermark'] = _load_hit_counts_full()
+                state['full_at'] = state['delta_at'] = now
+            elif now - state['delta_at'] > HITS_DELTA_TTL:
+                wm = state['watermark']
+                # Keyset (created_at, id): baris bulk insert dengan created_at sama tetap terbaca
+                flt = (lambda q: q.or_(f'created_at.gt."{wm[0]}",and(created_at.eq."{wm[0]}",id.gt.{wm[1]})')) if wm else None
+                for page in iter_keyset_pages(supabase, 'finding_logs', 'id, user_id, created_at', apply_filters=flt, key='id'):
+                    wm = _count_hit_rows(page, state['counts'], wm)
+                state['watermark'] = wm
+                state['delta_at'] = now
+            return pd.Series(state['counts'], dtype='int64')
+    except: return pd.Series(dtype='int64')
+
+@st.cache_data(ttl=METRICS_TTL, show_spinner=False)
+def get_activity_metrics():
+    """(live < 30 menit, aktif hari ini) dari satu query agregat."""
+    now = datetime.now(TZ_JAKARTA)
+    live_since = now - timedelta(minutes=30)
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        row = (supabase.rpc('user_activity_metrics', {"p_live_since": live_since.isoformat(), "p_day_start": today_start.isoformat()}).execute().data or [{}])[0]
+        return int(row.get('live') or 0), int(row.get('dau') or 0)
+    except Exception as e:
+        if not is_rpc_missing(e): print(f"⚠️ Metrik aktivitas: {e}")
+    # RPC belum terpasang: hitung dari data user yang sudah di-cache (tanpa query tambahan)
     try:
-        res = supabase.table('finding_logs').select('user_id').execute()
-        df = pd.DataFrame(res.data)
-        return df['user_id'].astype(str).value_counts() if not df.empty else pd.Series()
-    except: return pd.Series()
+        df = get_all_users()
+        if 'last_seen' not in df.columns: return 0, 0
+        seen = to_jakarta(df['last_seen'])
+        return int((seen >= live_since).sum()), int((seen >= today_start).sum())
+    except: return 0, 0
+
+@st.cache_resource
+def get_leaderboard_engine():
+    return LeaderboardEngine(supabase, ttl=METRICS_TTL)
+
+def get_leaderboard(window, limit=10):
+    """Top-N leaderboard (agregasi di database, lihat utils_leaderboard)."""
+    try: return get_leaderboard_engine().top(window, limit)
+    except Exception as e:
+        print(f"⚠️ Leaderboard: {e}")
+        return []
 
 def get_live_users_count():
-    try:
-        res = supabase.table('users').select('last_seen').execute()
-        df = pd.DataFrame(res.data)
-        if 'last_seen' not in df.columns: return 0
-        TZ = pytz.timezone('Asia/Jakarta')
-        df['last_seen'] = pd.to_datetime(df['last_seen'], errors='coerce')
-        if df['last_seen'].dt.tz is None: df['last_seen'] = df['last_seen'].dt.tz_localize('UTC').dt.tz_convert(TZ)
-        else: df['last_seen'] = df['last_seen'].dt.tz_convert(TZ)
-        now = datetime.now(TZ)
-        limit = now - timedelta(minutes=30)
-        return len(df[df['last_seen'] >= limit])
-    except: return 0
+    return get_activity_metrics()[0]
 
 def get_daily_active_users():
-    try:
-        res = supabase.table('users').select('last_seen').execute()
-        df = pd.DataFrame(res.data)
-        if 'last_seen' not in df.columns: return 0
-        TZ = pytz.timezone('Asia/Jakarta')
-        df['last_seen'] = pd.to_datetime(df['last_seen'], errors='coerce')
-        if df['last_seen'].dt.tz is None: df['last_seen'] = df['last_seen'].dt.tz_localize('UTC').dt.tz_convert(TZ)
-        else: df['last_seen'] = df['last_seen'].dt.tz_convert(TZ)
-        today_start = datetime.now(TZ).replace(hour=0, minute=0, second=0, microsecond=0)
-        return len(df[df['last_seen'] >= today_start])
-    except: return 0
+    return get_activity_metrics()[1]
 
 def update_user_status(uid, stat):
-    try: supabase.table('users').update({'status': stat}).eq('user_id', uid).execute(); return True
+    try: supabase.table('users').update({'status': stat}).eq('user_id', uid).execute(); refresh_users(); return True
     except: return False
 
 def add_user_quota(uid, days):
@@ -185,6 +267,7 @@ def add_user_quota(uid, days):
         new_exp_dt = base + timedelta(days=days)
         new_exp_str = new_exp_dt.isoformat()
         supabase.table('users').update({'expiry_date': new_exp_str}).eq('user_id', uid).execute()
+        refresh_users()
         return True, f"Sukses! Expired baru: {new_exp_dt.strftime('%d-%m-%Y')}"
 
     except Exception as e:
@@ -207,48 +290,67 @@ def send_telegram_message(user_id, text):
         print(f"❌ Net Error ({user_id}): {e}")
         return False
 
+# --- BROADCAST BACKGROUND (TAB EXPIRED / ACTIVE) ---
+# Pengiriman massal berjalan di thread background (httpx async + token bucket),
+# status per penerima ditulis ke tabel broadcast_logs. UI hanya membaca progress.
+# Laju dibuat di bawah 30/detik karena bot utama memakai token yang sama.
+# Hanya SATU job boleh berjalan per proses (semua sesi): dua job paralel berarti
+# dua token bucket dan laju gabungan melewati batas Telegram.
+DASH_BROADCAST_RATE = float(os.getenv("DASH_BROADCAST_RATE", 20))
+BROADCAST_STATUS_LABEL = {'sent': "✅ TERKIRIM", 'blocked': "🚫 DIBLOKIR USER", 'failed': "❌ GAGAL API", 'error': "❌ ERROR"}
+
+@st.cache_resource
+def get_broadcast_jobs():
+    return {}   # job_id -> BroadcastJob (bersama untuk semua sesi, tetap hidup saat rerun)
+
+def start_broadcast(messages, kind):
+    jobs = get_broadcast_jobs()
+    if active_broadcast(): return None   # Sesi lain baru saja memulai broadcast
+    for jid in [j for j, job in jobs.items() if not job.running][:-10]: jobs.pop(jid, None)   # Simpan 10 job terakhir
+    job = BroadcastJob(BOT_TOKEN, messages, client=supabase, kind=kind, rate=DASH_BROADCAST_RATE).start()
+    jobs[job.id] = job
+    st.session_state['broadcast_job'] = job.id
+    st.session_state['broadcast_job_synced'] = False
+    return job
+
+def active_broadcast():
+    """Job yang sedang berjalan dari sesi mana pun (None jika tidak ada)."""
+    return next((job for job in list(get_broadcast_jobs().values()) if job.running), None)
+
+def _broadcast_progress():
+    job = get_broadcast_jobs().get(st.session_state.get('broadcast_job'))
+    if not job: return
+    p = job.progress()
+    for cid, status in list(job.results.items()):
+        st.session_state['broadcast_logs'][cid] = BROADCAST_STATUS_LABEL.get(status, status)
+    st.progress(min(p['done'] / max(p['total'], 1), 1.0),
+                f"📨 {p['kind']}: {p['done']}/{p['total']} | ✅ {p['sent']} | 🚫 {p['blocked']} | ❌ {p['failed'] + p['error']} | ⏱️ {int(p['elapsed'])} detik")
+    if job.running:
+        if st.button("⛔ HENTIKAN BROADCAST", key="btn_cancel_broadcast"): job.cancel()
+    elif not st.session_state.get('broadcast_job_synced'):
+        # Job baru selesai: rerun penuh agar kolom STATUS KIRIM di tabel ikut terisi
+        st.session_state['broadcast_job_synced'] = True
+        st.toast(f"Broadcast {p['kind']} Selesai! ✅ {p['sent']} | ❌ {p['total'] - p['sent']}", icon="📨")
+        st.rerun()
+    elif p['status'] == 'failed': st.error(f"❌ Broadcast gagal: {p['reason']}")
+    elif p['status'] == 'cancelled': st.warning(f"⛔ Broadcast dihentikan ({p['done']}/{p['total']} diproses).")
+
+# Polling progress tanpa me-rerun seluruh halaman (Streamlit >= 1.37)
+render_broadcast_progress = st.fragment(run_every=2)(_broadcast_progress) if hasattr(st, 'fragment') else _broadcast_progress
+
 def delete_user_with_reason(uid, reason):
     try:
         msg = f"⛔ <b>AKUN DINONAKTIFKAN</b>\n\nMaaf, akun One Aspal Anda telah dihapus oleh Admin.\n\n📝 <b>Alasan:</b>\n{reason}\n\nTerima kasih."
         send_telegram_message(uid, msg)
         supabase.table('users').delete().eq('user_id', uid).execute()
+        refresh_users()
         return True
     except: return False
 
 # ##############################################################################
 # BAGIAN 3: ENGINE PINTAR & PARSER
 # ##############################################################################
-COLUMN_ALIASES = {
-    'nopol': ['nopolisi', 'nomorpolisi', 'nopol', 'noplat', 'tnkb', 'licenseplate', 'plat', 'police_no', 'no polisi'],
-    'type': ['type', 'tipe', 'unit', 'model', 'vehicle', 'jenis', 'deskripsiunit', 'merk', 'object', 'kendaraan'],
-    'tahun': ['tahun', 'year', 'thn', 'rakitan', 'th'],
-    'warna': ['warna', 'color', 'colour', 'cat'],
-    'noka': ['noka', 'norangka', 'nomorrangka', 'chassis', 'chasis', 'vin', 'rangka', 'no rangka'],
-    'nosin': ['nosin', 'nomesin', 'nomormesin', 'engine', 'mesin', 'no mesin', 'engine_number'],
-    'finance': ['finance', 'leasing', 'lising', 'multifinance', 'mitra', 'principal', 'client'],
-    'ovd': ['ovd', 'overdue', 'dpd', 'keterlambatan', 'odh', 'hari', 'telat', 'aging'],
-    'branch': ['branch', 'area', 'kota', 'pos', 'cabang', 'lokasi', 'wilayah']
-}
-def normalize_text(t): return ''.join(e for e in str(t) if e.isalnum()).lower()
-def fix_header_position(df):
-    target = [normalize_text(a) for a in COLUMN_ALIASES['nopol']]
-    for i in range(min(30, len(df))):
-        vals = [normalize_text(str(x)) for x in df.iloc[i].values]
-        if any(a in vals for a in target):
-            df.columns = df.iloc[i]; return df.iloc[i+1:].reset_index(drop=True)
-    return df
-def smart_rename_columns(df):
-    new, found = {}, []
-    df.columns = [str(c).strip().replace('\ufeff', '') for c in df.columns]
-    for col in df.columns:
-        clean = normalize_text(col)
-        for std, aliases in COLUMN_ALIASES.items():
-            if clean == std or clean in [normalize_text(a) for a in aliases]:
-                if std not in new.values(): new[col] = std; found.append(std)
-                break
-        if col not in new: new[col] = col
-    df.rename(columns=new, inplace=True); return df.loc[:, ~df.columns.duplicated()], found
-
+# Kamus alias kolom, deteksi header & rename kolom: utils_header.py (sama dengan bot)
 def read_file_robust(file_up):
     try:
         filename = file_up.name.upper()
@@ -352,11 +454,10 @@ tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["🏆 LEADERBOARD", "🛡️ PERSO
 
 # --- TAB 1: LEADERBOARD ---
 with tab1:
-    hits = get_hit_counts()
-    if not df_u.empty and not hits.empty:
-        df_r = df_u.copy(); df_r['h'] = df_r['user_id'].map(hits).fillna(0).astype(int)
-        for i, r in enumerate(df_r[df_r['role']!='pic'].sort_values('h', ascending=False).head(10).iterrows(), 1):
-            st.markdown(f'<div class="leaderboard-row"><div><b>#{i} {r[1]["nama_lengkap"]}</b><br><small>{r[1]["agency"]}</small></div><div class="leaderboard-val">{r[1]["h"]} HITS</div></div>', unsafe_allow_html=True)
+    hits = get_hit_counts()   # Dipakai juga oleh tab PERSONIL (LIFETIME HITS)
+    lb_window = st.radio("PERIODE", list(LEADERBOARD_WINDOWS), index=3, format_func=LEADERBOARD_WINDOWS.get, horizontal=True, label_visibility="collapsed", key="radio_lb_window")
+    for i, r in enumerate(get_leaderboard(lb_window, 10), 1):
+        st.markdown(f'<div class="leaderboard-row"><div><b>#{i} {r["nama_lengkap"]}</b><br><small>{r["agency"]}</small></div><div class="leaderboard-val">{r["hits"]} HITS</div></div>', unsafe_allow_html=True)
 
 # --- TAB 2: MANAJEMEN PERSONIL (USER) ---
 with tab2:
@@ -391,15 +492,18 @@ with tab2:
                  if u['role'] == 'matel':
                     if st.button("⬆️ JADI KORLAP", key="btn_promote", type="primary", use_container_width=True):
                         supabase.table('users').update({'role': 'korlap'}).eq('user_id', uid).execute()
+                        refresh_users()
                         st.success(f"✅ {u['nama_lengkap']} naik pangkat jadi KORLAP!"); time.sleep(1); st.rerun()
                  elif u['role'] == 'korlap':
                     if st.button("⬇️ TURUNKAN MATEL", key="btn_demote", use_container_width=True):
                         supabase.table('users').update({'role': 'matel'}).eq('user_id', uid).execute()
+                        refresh_users()
                         st.warning(f"⚠️ {u['nama_lengkap']} turun pangkat jadi MATEL."); time.sleep(1); st.rerun()
             with b4:
                 if u['role'] != 'pic':
                     if st.button("👮 JADI PIC LEASING", key="btn_pic", use_container_width=True):
                          supabase.table('users').update({'role': 'pic'}).eq('user_id', uid).execute()
+                         refresh_users()
                          st.info(f"ℹ️ {u['nama_lengkap']} dimutasi jadi PIC LEASING."); time.sleep(1); st.rerun()
 
             if st.session_state.get(f'del_confirm_{uid}', False):
@@ -465,32 +569,16 @@ with tab3:
                 recs = df[['nopol'] + required_cols].to_dict('records')
                 total_recs = len(recs)
                 
-                # 2. PROSES UPLOAD (BATCHING)
-                BATCH_SIZE = 200 
-                s, f = 0, 0
-                pb = st.progress(0, f"Memproses {total_recs} data (Mode Aman: Batch {BATCH_SIZE})...")
-                last_error = ""
-                
-                for i in range(0, total_recs, BATCH_SIZE):
-                    batch = recs[i:i+BATCH_SIZE]
-                    success_batch = False
-                    
-                    # Retry Logic (5x)
-                    for attempt in range(5):
-                        try: 
-                            supabase.table('kendaraan').upsert(batch, on_conflict='nopol').execute()
-                            s += len(batch)
-                            success_batch = True
-                            break
-                        except Exception as e: 
-                            wait_time = (attempt + 1) * 2
-                            time.sleep(wait_time) 
-                            if attempt == 4: 
-                                f += len(batch)
-                                last_error = str(e)
-                    
-                    # Update Progress Bar
-                    pb.progress(min((i+BATCH_SIZE)/total_recs, 1.0))
+                # 2. PROSES UPLOAD (BATCH PARALEL & ADAPTIF)
+                pb = st.progress(0, f"Memproses {total_recs} data (Batch Paralel Adaptif)...")
+                executor = UpsertExecutor(
+                    supabase,
+                    on_progress=lambda done, total: pb.progress(min(done / total, 1.0), f"Memproses {done:,}/{total:,} data (Batch {executor.batch_size})...")
+                )
+                hasil = executor.run(recs)
+                s, f = hasil['success'], hasil['fail']
+                last_error = executor.last_error
+                print(f"📊 [DASHBOARD] Upload {total_recs} data: {hasil['duration']:.1f} detik | {executor.summary()}")
                 
                 # 3. SIMPAN HASIL KE SESSION
                 # REVISI: Ambil nama dari kolom finance jika input manual kosong
@@ -525,6 +613,7 @@ with tab3:
                         leasing=leasing_log,
                         jumlah=suc
                     )
+                    flush_log_kendaraan()
                     st.session_state['log_recorded'] = True
                     st.caption("📝 Aktivitas telah dicatat di Log Harian.")
                 except Exception as log_e:
@@ -557,14 +646,12 @@ with tab4:
 # --- TAB 5: LIVE OPS MONITORING ---
 with tab5:
     st.markdown("### 📡 REALTIME OPERATIONS CENTER (TODAY'S ACTIVITY)")
-    users_resp = supabase.table('users').select('nama_lengkap, agency, role, last_seen, status, no_hp').execute()
-    if users_resp.data:
-        df_live = pd.DataFrame(users_resp.data)
+    # Pakai data user yang sudah di-cache (tidak query ulang setiap rerun)
+    if not df_u.empty:
+        df_live = df_u.copy()
         if 'last_seen' in df_live.columns:
-            TZ = pytz.timezone('Asia/Jakarta')
-            df_live['last_seen'] = pd.to_datetime(df_live['last_seen'], errors='coerce')
-            if df_live['last_seen'].dt.tz is None: df_live['last_seen'] = df_live['last_seen'].dt.tz_localize('UTC').dt.tz_convert(TZ)
-            else: df_live['last_seen'] = df_live['last_seen'].dt.tz_convert(TZ)
+            TZ = TZ_JAKARTA
+            df_live['last_seen'] = to_jakarta(df_live['last_seen'])
             now = datetime.now(TZ)
             today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             df_display = df_live.dropna(subset=['last_seen']).copy()
@@ -589,31 +676,38 @@ with tab5:
 # --- TAB 6: BROADCAST & RETENSI (EXPIRED & ACTIVE) ---
 with tab6:
     st.markdown("### 📢 PUSAT BROADCAST & RETENSI USER")
-    st.info("Halaman ini mengambil data LANGSUNG dari server (Real-time).")
+    st.info(f"Data user di-cache {USERS_TTL} detik. Tekan REFRESH DATA SERVER untuk data terbaru.")
     
     if not BOT_TOKEN:
         st.error("⚠️ TOKEN BOT TIDAK TERDETEKSI. Broadcast tidak akan terkirim.")
 
+    # PROGRESS BROADCAST YANG SEDANG / TERAKHIR BERJALAN (fragment polling hanya jika sesi ini punya job)
+    if st.session_state.get('broadcast_job'): render_broadcast_progress()
+    running_job = active_broadcast()
+    bc_running = running_job is not None
+    if bc_running and running_job.id != st.session_state.get('broadcast_job'):
+        st.info(f"⏳ Broadcast {running_job.kind} dari sesi lain sedang berjalan ({running_job.done}/{running_job.total}). Tombol kirim dinonaktifkan sampai selesai.")
+
     # TOMBOL CLEAR STATUS & REFRESH
     cr1, cr2 = st.columns([1, 1])
     with cr1:
         if st.button("🧹 CLEAR STATUS BROADCAST", type="secondary"):
             st.session_state['broadcast_logs'] = {}
+            own = get_broadcast_jobs().get(st.session_state.get('broadcast_job'))
+            if not (own and own.running): st.session_state.pop('broadcast_job', None)
             st.rerun()
     with cr2:
         if st.button("🔄 REFRESH DATA SERVER", type="secondary"):
-            st.cache_data.clear()
+            reset_data_cache()
             st.rerun()
 
     try:
         now_str = datetime.now(TZ_JAKARTA).strftime('%Y-%m-%d')
         
-        # 1. AMBIL SEMUA DATA USER (Kecuali Banned)
-        response = supabase.table('users').select('*').neq('status', 'banned').execute()
-        all_data = response.data
+        # 1. AMBIL SEMUA DATA USER (Kecuali Banned) dari cache get_all_users
+        df_all = df_u[df_u['status'] != 'banned'].copy() if not df_u.empty else pd.DataFrame()
         
-        if all_data:
-            df_all = pd.DataFrame(all_data)
+        if not df_all.empty:
             df_all['tgl_exp_obj'] = pd.to_datetime(df_all['expiry_date'], format='mixed', errors='coerce').dt.date
             df_all['expiry_date_str'] = pd.to_datetime(df_all['expiry_date'], format='mixed', errors='coerce').dt.strftime('%Y-%m-%d')
             df_all['STATUS_BROADCAST'] = df_all['user_id'].map(st.session_state.get('broadcast_logs', {})).fillna("⏳ Menunggu")
@@ -666,13 +760,10 @@ with tab6:
 
                     with col_act2:
                         if not targets_exp.empty:
-                            if st.button(f"📢 KIRIM TAGIHAN KE {len(targets_exp)} USER", type="primary", use_container_width=True):
-                                succ_count, fail_count = 0, 0
-                                prog_bar = st.progress(0, "Mengirim Notifikasi Penagihan...")
-                                total_targets = len(targets_exp)
-                                
-                                for i, (idx, row) in enumerate(targets_exp.iterrows(), 1):
-                                    msg = (
+                            if st.button(f"📢 KIRIM TAGIHAN KE {len(targets_exp)} USER", type="primary", use_container_width=True, disabled=bc_running):
+                                messages = {}
+                                for idx, row in targets_exp.iterrows():
+                                    messages[row['user_id']] = (
                                         f"🔔 <b>PENGINGAT MASA AKTIF</b>\n\n"
                                         f"Halo <b>{row['nama_lengkap']}</b>,\n"
                                         f"Masa aktif akun One Aspal Anda telah berakhir pada tanggal <b>{row['expiry_date_str']}</b>.\n\n"
@@ -680,17 +771,10 @@ with tab6:
                                         f"Silakan hubungi Admin atau ketik /infobayar \n\n"
                                         f"<i>Tetap Semangat! 🦅</i>"
                                     )
-                                    try:
-                                        if send_telegram_message(row['user_id'], msg): 
-                                            succ_count += 1
-                                            st.session_state['broadcast_logs'][row['user_id']] = "✅ TERKIRIM"
-                                        else: 
-                                            fail_count += 1
-                                            st.session_state['broadcast_logs'][row['user_id']] = "❌ GAGAL API"
-                                    except: 
-                                        fail_count += 1; st.session_state['broadcast_logs'][row['user_id']] = "❌ ERROR"
-                                    prog_bar.progress(min(i / total_targets, 1.0))
-                                st.toast(f"Tagihan Selesai! ✅ {succ_count} | ❌ {fail_count}", icon="📨"); time.sleep(1); st.rerun()
+                                    st.session_state['broadcast_logs'][row['user_id']] = "📤 Antri"
+                                if start_broadcast(messages, "TAGIHAN"): st.toast(f"Tagihan ke {len(messages)} user dikirim di background.", icon="📨")
+                                else: st.toast("Broadcast lain sedang berjalan, coba lagi setelah selesai.", icon="⏳")
+                                st.rerun()
                         else:
                             st.button("📢 PILIH USER EXPIRED DULU", disabled=True, use_container_width=True)
                 else:
@@ -733,33 +817,23 @@ with tab6:
 
                     with col_act4:
                         if not targets_act.empty:
-                            if st.button(f"📢 KIRIM PENGUMUMAN KE {len(targets_act)} USER", type="primary", use_container_width=True):
+                            if st.button(f"📢 KIRIM PENGUMUMAN KE {len(targets_act)} USER", type="primary", use_container_width=True, disabled=bc_running):
                                 if not custom_msg.strip():
                                     st.error("❌ PESAN KOSONG! Ketik pesan pengumuman terlebih dahulu."); st.stop()
                                 
-                                succ_count, fail_count = 0, 0
-                                prog_bar = st.progress(0, "Mengirim Pengumuman...")
-                                total_targets = len(targets_act)
-                                
-                                for i, (idx, row) in enumerate(targets_act.iterrows(), 1):
+                                messages = {}
+                                for idx, row in targets_act.iterrows():
                                     # Menggabungkan sapaan dengan pesan kustom Bapak
-                                    final_msg = (
+                                    messages[row['user_id']] = (
                                         f"📢 <b>INFO B ONE ENTERPRISE</b>\n\n"
                                         f"Halo <b>{row['nama_lengkap']}</b>,\n\n"
                                         f"{custom_msg}\n\n"
                                         f"<i>Pesan Otomatis dari Command Center 🦅</i>"
                                     )
-                                    try:
-                                        if send_telegram_message(row['user_id'], final_msg): 
-                                            succ_count += 1
-                                            st.session_state['broadcast_logs'][row['user_id']] = "✅ TERKIRIM"
-                                        else: 
-                                            fail_count += 1
-                                            st.session_state['broadcast_logs'][row['user_id']] = "❌ GAGAL API"
-                                    except: 
-                                        fail_count += 1; st.session_state['broadcast_logs'][row['user_id']] = "❌ ERROR"
-                                    prog_bar.progress(min(i / total_targets, 1.0))
-                                st.toast(f"Broadcast Selesai! ✅ {succ_count} | ❌ {fail_count}", icon="📨"); time.sleep(1); st.rerun()
+                                    st.session_state['broadcast_logs'][row['user_id']] = "📤 Antri"
+                                if start_broadcast(messages, "PENGUMUMAN"): st.toast(f"Pengumuman ke {len(messages)} user dikirim di background.", icon="📨")
+                                else: st.toast("Broadcast lain sedang berjalan, coba lagi setelah selesai.", icon="⏳")
+                                st.rerun()
                         else:
                             st.button("📢 PILIH USER AKTIF DULU", disabled=True, use_container_width=True)
                 else:
@@ -774,7 +848,7 @@ with tab6:
 st.markdown("<br><hr style='border-color: #00f2ff; opacity: 0.3;'><br>", unsafe_allow_html=True)
 cf1, cf2, cf3 = st.columns([1, 2, 1])
 with cf1:
-    if st.button("🔄 REFRESH SYSTEM", key="footer_refresh"): st.cache_data.clear(); st.rerun()
+    if st.button("🔄 REFRESH SYSTEM", key="footer_refresh"): reset_data_cache(); st.rerun()
 with cf3:
     if st.button("🚪 LOGOUT SESSION", key="footer_logout"): st.session_state['authenticated'] = False; st.rerun()
 st.markdown("""<div class="footer-quote">"EAGLE ONE, STANDING BY. EYES ON THE STREET, DATA IN THE CLOUD."</div><div class="footer-text">SYSTEM INTELLIGENCE SECURED & ENCRYPTED<br>COPYRIGHT © 2026 <b>BUDIB40NK</b> | ALL RIGHTS RESERVED<br>OPERATIONAL COMMAND CENTER v10.7</div>""", unsafe_allow_html=True)
\ No newline at end of file
@@ -15,12 +15,14 @@
 import os
 import logging
 import pandas as pd
+import openpyxl
 import io
 import numpy as np
 import time
 import re
 import asyncio 
 import csv 
+import codecs
 import zipfile 
 import json
 import html
@@ -28,6 +30,11 @@ import difflib
 import pytz
 import urllib.parse
 import shutil
+import itertools
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import secrets # Pastikan import ini ada di bagian paling atas file
 from dotenv import load_dotenv
 from collections import Counter
@@ -144,6 +151,7 @@ def login_sso():
             'session_token': None,
             'session_expiry': None
         }).eq('user_id', uid).execute()
+        invalidate_user(uid)
 
         # 5. BERIKAN KARTU AKSES (Device Binding via Cookies)
         response = make_response(redirect('/dashboard'))
@@ -262,31 +270,29 @@ from telegram.ext import (
 )
 
 from supabase import create_client, Client
-from utils_log import catat_log_kendaraan
-
-# [FIX] Import ClientOptions untuk menangani Timeout
-try:
-    from supabase.lib.client_options import ClientOptions
-except ImportError:
-    from supabase import ClientOptions
+from utils_log import catat_log_kendaraan, flush_log_kendaraan
+from utils_supabase import get_client
+from utils_index import PlateIndex
+from utils_cache import TTLCache, ChatRowCache
+from utils_db import AsyncDB
+from utils_leasing import standardize_leasing_name, standardize_leasing_series
+from utils_upsert import UpsertExecutor
+from utils_header import COLUMN_ALIASES, fix_header_position, smart_rename_columns, detect_header
+from utils_upload import (
+    read_file_robust, iter_upload_frames, analyze_upload_preview, count_file_rows, UPLOAD_CHUNK_ROWS
+)
+from utils_routing import GroupRouter
+from utils_notify import NotificationDispatcher
+from utils_writebehind import WriteBehindBuffer
+from utils_quota import QuotaGuard, is_rpc_missing
+from utils_export import (
+    EXPORT_FORMATS, iter_keyset_pages, iter_keyset_desc, iter_rpc_pages, time_slices, map_ordered, fetch_rows_by_ids, export_pages
+)
+from utils_rollup import HitRollup, HIT_ROLLUP_FIELDS
+from utils_leaderboard import LeaderboardEngine, LEADERBOARD_WINDOWS, WINDOW_ALIASES
 
 from flask import jsonify
 
-# --- HELPER: INTEGRASI KEKUATAN BOT & STREAMLIT ---
-def fix_header_position(df):
-    target = COLUMN_ALIASES['nopol']
-    # 1. Cek apakah header sudah benar di kolom saat ini
-    col_vals = [normalize_text(str(x)) for x in df.columns]
-    if any(alias in col_vals for alias in target):
-        return df
-    # 2. Jika tidak, cari di 30 baris pertama
-    for i in range(min(30, len(df))): 
-        vals = [normalize_text(str(x)) for x in df.iloc[i].values]
-        if any(alias in vals for alias in target):
-            df.columns = df.iloc[i] 
-            df = df.iloc[i+1:].reset_index(drop=True) 
-            return df
-    return df
 # ==============================================================================
 # [NEW] PIC DASHBOARD: TAHAP 1 (HANYA PREVIEW, TIDAK MENYIMPAN)
 # ==============================================================================
@@ -300,14 +306,7 @@ def analyze_upload():
         df = read_file_robust(content, file.filename)
         
         # Cari Header Cerdas
-        target_aliases = COLUMN_ALIASES['nopol']
-        if not any(normalize_text(str(c)) in target_aliases for c in df.columns):
-            for i in range(min(30, len(df))):
-                row_values = [normalize_text(str(x)) for x in df.iloc[i].values]
-                if any(alias in row_values for alias in target_aliases):
-                    df.columns = df.iloc[i]
-                    df = df.iloc[i+1:].reset_index(drop=True)
-                    break
+        df = fix_header_position(df)
                     
         df, _ = smart_rename_columns(df)
         
@@ -316,7 +315,7 @@ def analyze_upload():
             
         # Ambil 5 baris pertama untuk ditampilkan
         preview_data = df.head(5).replace({np.nan: "-"}).to_dict('records')
-        return jsonify({"status": "success", "preview": preview_data, "total_rows": len(df)})
+        return jsonify({"status": "success", "preview": preview_data, "total_rows": len(df), "dialect": df.attrs.get('csv_dialect')})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -343,14 +342,7 @@ def upload_dashboard():
         df = read_file_robust(content, file.filename)
         
         # 2. KEKUATAN STREAMLIT: Cari Header di baris manapun
-        target_aliases = COLUMN_ALIASES['nopol']
-        if not any(normalize_text(str(c)) in target_aliases for c in df.columns):
-            for i in range(min(30, len(df))):
-                row_values = [normalize_text(str(x)) for x in df.iloc[i].values]
-                if any(alias in row_values for alias in target_aliases):
-                    df.columns = df.iloc[i]
-                    df = df.iloc[i+1:].reset_index(drop=True)
-                    break
+        df = fix_header_position(df)
                     
         # 3. KEKUATAN STREAMLIT: Smart Rename
         df, _ = smart_rename_columns(df)
@@ -390,27 +382,17 @@ def upload_dashboard():
         if total_recs == 0:
             return jsonify({"status": "error", "message": "Data kosong setelah dibersihkan."}), 400
 
-        # 5. KEKUATAN STREAMLIT: Batch Upsert (200 data) dengan 5x Auto-Retry
-        BATCH_SIZE = 200
-        sukses = 0
-        gagal = 0
-        
-        for i in range(0, total_recs, BATCH_SIZE):
-            batch = recs[i:i+BATCH_SIZE]
-            
-            for attempt in range(5):
-                try: 
-                    supabase.table('kendaraan').upsert(batch, on_conflict='nopol').execute()
-                    sukses += len(batch)
-                    break 
-                except Exception as e: 
-                    time.sleep((attempt + 1) * 2)
-                    if attempt == 4: 
-                        gagal += len(batch)
+        # 5. Batch Upsert Paralel (ukuran batch adaptif, retry backoff + jitter)
+        executor = UpsertExecutor(supabase_bulk, on_batch=sync_plate_index_batch)
+        hasil = executor.run(recs)
+        sukses = hasil['success']
+        gagal = hasil['fail']
+        print(f"📊 [DASHBOARD] Upload {total_recs} data: {hasil['duration']:.1f} detik | {executor.summary()}")
 
         # 6. MENGGUNAKAN UTILS_LOG DENGAN NAMA LEASING DARI FILE
         try:
             catat_log_kendaraan(sumber="DASHBOARD_PIC", leasing=nama_leasing_aktual, jumlah=sukses)
+            flush_log_kendaraan()
         except Exception as log_e:
             print(f"Peringatan Log: {log_e}")
 
@@ -506,6 +488,7 @@ def delete_asset():
             .eq('nopol', nopol) \
             .eq('finance', user_db.get('agency')) \
             .execute()
+        sync_plate_index(deleted=[d['nopol'] for d in (res.data or [])])
 
         # 2. Catat ke Audit Log (Penting untuk UU PDP)
         supabase.table('audit_logs').insert({
@@ -595,35 +578,120 @@ if not URL or not KEY or not TOKEN:
 else:
     print("✅ Credential Database & Bot: OK")
 
-try:
-    # [FIX] Set Timeout ke 300 detik (5 Menit) agar upload besar tidak putus
-    opts = ClientOptions(postgrest_client_timeout=300)
-    supabase: Client = create_client(URL, KEY, options=opts)
-    print("✅ Koneksi Supabase: BERHASIL (Timeout 300s)")
-except Exception as e:
-    print(f"⚠️ Warning ClientOptions: {e}")
-    # Fallback ke default jika library lama
-    supabase: Client = create_client(URL, KEY)
-    print("✅ Koneksi Supabase: BERHASIL (Default Mode)")
+# --- AKSES DB NON-BLOCKING (HANDLER BOT) ---
+# Query dari handler async dijalankan lewat DB.run()/DB.execute() agar event loop
+# tidak ikut terkunci. Batas thread, query paralel & timeout bisa diatur via ENV.
+DB_TIMEOUT = int(os.environ.get("DB_TIMEOUT", 20))
+DB_TIMEOUT_LONG = int(os.environ.get("DB_TIMEOUT_LONG", 600))  # Untuk export/rekap besar
+DB_BULK_HTTP_TIMEOUT = min(300, DB_TIMEOUT_LONG)
+
+# Timeout HTTP client harus <= timeout DB.run: wait_for hanya melepas future,
+# thread pool baru kembali setelah request HTTP-nya sendiri selesai / timeout.
+# Client dari registry bersama: utils_log & modul lain memakai client yang sama
+supabase: Client = get_client(URL, KEY, timeout=DB_TIMEOUT)
+# [FIX] Client terpisah dengan timeout 300 detik (5 Menit) agar upload besar &
+# query DB_TIMEOUT_LONG tidak putus
+supabase_bulk: Client = get_client(URL, KEY, timeout=DB_BULK_HTTP_TIMEOUT, name="bulk")
+print(f"✅ Koneksi Supabase: BERHASIL (Timeout {DB_TIMEOUT}s / bulk {DB_BULK_HTTP_TIMEOUT}s)")
+DB = AsyncDB(
+    supabase,
+    pool_size=int(os.environ.get("DB_POOL_SIZE", 16)),
+    max_concurrency=int(os.environ.get("DB_MAX_CONCURRENCY", 12)),
+    timeout=DB_TIMEOUT
+)
 
 print("="*50 + "\n")
 
+# --- PLATE INDEX (OPSIONAL) ---
+# Aktifkan dengan ENV PLATE_INDEX=1. Index nopol/noka/nosin di memori agar
+# pencarian tidak lagi melakukan scan 'ilike %kw%' ke seluruh tabel kendaraan.
+PLATE_INDEX = PlateIndex() if os.environ.get("PLATE_INDEX", "0") == "1" else None
+PLATE_INDEX_REFRESH = int(os.environ.get("PLATE_INDEX_REFRESH", 1800))
+
+# --- USER CACHE ---
+# Profil user dibaca di hampir setiap pesan & klik tombol. Disimpan sebentar di
+# memori (dipakai bersama handler bot & route Flask) lalu di-invalidate/patch
+# setiap kali tabel users ditulis dari proses ini.
+USER_CACHE = TTLCache(
+    maxsize=int(os.environ.get("USER_CACHE_SIZE", 5000)),
+    ttl=int(os.environ.get("USER_CACHE_TTL", 60)),
+    name="users"
+)
+
+# --- NEGATIVE CACHE (NOPOL YANG TIDAK DITEMUKAN) ---
+# Keyword yang barusan "TIDAK DITEMUKAN" disimpan sebentar bersama DATA_GENERATION
+# saat dicari. Setiap data kendaraan baru masuk (upload, /tambah, ACC) generasi naik,
+# sehingga hasil "tidak ditemukan" lama otomatis tidak berlaku lagi.
+# Data dihapus juga menaikkan generasi (dipakai HOT_ROWS di bawah).
+MISS_CACHE = TTLCache(
+    maxsize=int(os.environ.get("MISS_CACHE_SIZE", 20000)),
+    ttl=int(os.environ.get("MISS_CACHE_TTL", 120)),
+    name="miss"
+)
+DATA_GENERATION = 0
+
+# --- HOT ROWS (HASIL PENCARIAN TERAKHIR PER CHAT) ---
+# Tombol view_ (pilih dari multi hasil) & cp_ (Salin Data) dilayani dari baris yang
+# barusan dikembalikan handle_message, tanpa query ulang ke tabel kendaraan.
+HOT_ROWS = ChatRowCache(
+    max_bytes=int(os.environ.get("HOT_ROWS_MAX_MB", 32)) * 1024 * 1024,
+    ttl=int(os.environ.get("HOT_ROWS_TTL", 600)),
+    name="hot_rows"
+)
+
+# --- ROUTING GROUP NOTIFIKASI ---
+# Tabel leasing_groups & agency_groups dimuat sekali ke memori. Di-refresh saat
+# /setgroup & /setagency, atau setelah GROUP_ROUTE_TTL detik (jika diubah dari luar bot).
+GROUP_ROUTER = GroupRouter(supabase, ttl=int(os.environ.get("GROUP_ROUTE_TTL", 300)))
+
+# --- DISPATCHER NOTIFIKASI HIT ---
+# Notifikasi ke log pusat / group leasing / group agency masuk antrian dan dikirim
+# paralel di background (token bucket global & per chat, hormati 429 retry_after).
+NOTIFIER = NotificationDispatcher(
+    workers=int(os.environ.get("NOTIFY_WORKERS", 8)),
+    global_rate=int(os.environ.get("NOTIFY_GLOBAL_RATE", 30))
+)
+
+# --- WRITE-BEHIND LOG TEMUAN & PEMAKAIAN HARIAN ---
+# INSERT finding_logs & UPDATE users per hit dikumpulkan lalu dikirim bulk oleh
+# thread flusher. Antrian juga ditulis ke file spool agar tidak hilang saat restart.
+WRITER = WriteBehindBuffer(
+    supabase,
+    spool_path=os.environ.get("WB_SPOOL_PATH", "writebehind_spool.jsonl"),
+    interval=float(os.environ.get("WB_FLUSH_INTERVAL", 0.5)),
+    max_batch=int(os.environ.get("WB_MAX_BATCH", 200)),
+    max_attempts=int(os.environ.get("WB_MAX_ATTEMPTS", 3))
+)
+
+# --- KUOTA HARIAN ATOMIK ---
+# Reset + cek limit + increment lewat satu RPC (supabase/migrations/*_consume_daily_quota.sql),
+# user yang sudah mentok limit ditolak lokal lewat shadow counter.
+QUOTA = QuotaGuard(supabase)
+
+# --- RPC PENCARIAN ---
+# search_kendaraan (supabase/migrations/*_kendaraan_search.sql): index trigram pada
+# nopol_norm, exact match di urutan teratas. Jika belum terpasang -> query ilike lama.
+SEARCH_RPC = {"available": os.environ.get("SEARCH_RPC", "1") == "1"}
+
+# --- ROLLUP HIT HARIAN (/rekap, /cekagency) ---
+# Hitungan hit hari ini per (leasing, nama_pt, user_id) di memori, ditambah setiap
+# log_successful_hit. Dimuat sekali dari RPC daily_hit_rollup saat bot start.
+HIT_ROLLUP = HitRollup()
+REKAP_DETAIL_ROWS = int(os.environ.get("REKAP_DETAIL_ROWS", 300))
+
+# --- LEADERBOARD HIT (/leaderboard, sama dengan tab LEADERBOARD dashboard) ---
+LEADERBOARD = LeaderboardEngine(supabase, ttl=int(os.environ.get("LEADERBOARD_TTL", 60)))
+
+# --- EXPORT DATABASE ASET ---
+EXPORT_PAGE_ROWS = int(os.environ.get("EXPORT_PAGE_ROWS", 1000))
+TELEGRAM_FILE_LIMIT = 49 * 1024 * 1024   # Batas upload file bot Telegram (50 MB)
+
 
 # ##############################################################################
 # BAGIAN 2: KAMUS DATA
 # ##############################################################################
 
-COLUMN_ALIASES = {
-    'nopol': ['nopolisi', 'nomorpolisi', 'nopol', 'noplat', 'tnkb', 'licenseplate', 'plat', 'police_no', 'no polisi', 'plate_number', 'platenumber', 'plate_no'],
-    'type': ['type', 'tipe', 'unit', 'model', 'vehicle', 'jenis', 'deskripsiunit', 'merk', 'object', 'kendaraan', 'item', 'brand', 'tipeunit', 'unit_type', 'nama_unit'],
-    'tahun': ['tahun', 'year', 'thn', 'rakitan', 'th', 'yearofmanufacture'],
-    'warna': ['warna', 'color', 'colour', 'cat'],
-    'noka': ['noka', 'norangka', 'nomorrangka', 'chassis', 'chasis', 'vin', 'rangka', 'no rangka', 'chassis_number'],
-    'nosin': ['nosin', 'nomesin', 'nomormesin', 'engine', 'mesin', 'no mesin', 'engine_number'],
-    'finance': ['finance', 'leasing', 'lising', 'multifinance', 'mitra', 'principal', 'client'],
-    'ovd': ['ovd', 'overdue', 'dpd', 'keterlambatan', 'odh', 'hari', 'telat', 'aging', 'days_overdue', 'lates', 'over_due', 'od'],
-    'branch': ['branch', 'area', 'kota', 'pos', 'cabang', 'lokasi', 'wilayah']
-}
+# COLUMN_ALIASES (kamus alias kolom) ada di utils_header.py, dipakai bersama dashboard.py
 
 VALID_DB_COLUMNS = ['nopol', 'type', 'finance', 'tahun', 'warna', 'noka', 'nosin', 'ovd', 'branch']
 
@@ -640,6 +708,8 @@ D_NOPOL, D_CONFIRM = range(17, 19)
 U_LEASING_USER, U_LEASING_ADMIN, U_CONFIRM_UPLOAD = range(19, 22)
 # [NEW] STATE KHUSUS BUKTI BAYAR
 WAIT_BUKTI = 26
+# [NEW] STATE CEK MASSAL (DAFTAR NOPOL)
+BATCH_LIST = 27
 
 REJECT_REASON = 22
 ADMIN_ACT_REASON = 23
@@ -652,10 +722,23 @@ VAL_REJECT_REASON = 25
 # ##############################################################################
 
 async def post_init(application: Application):
+    NOTIFIER.start(application.bot)
+    restored = WRITER.start()
+    if restored: print(f"♻️ [INIT] Write-behind: {restored} catatan dari spool dikirim ulang")
+    try:
+        total = await DB.run(load_hit_rollup, timeout=DB_TIMEOUT_LONG)
+        print(f"✅ [INIT] Rollup hit harian: {total} hit hari ini")
+    except Exception as e:
+        logger.error(f"Rollup hit harian gagal dimuat: {e}")
+    if PLATE_INDEX:
+        PLATE_INDEX.start_auto_refresh(supabase, PLATE_INDEX_REFRESH)
+        print(f"✅ [INIT] Plate Index: memuat di background (refresh {PLATE_INDEX_REFRESH} detik)")
     try:
         await application.bot.set_my_commands([
             ("start", "🔄 Restart / Menu"),
             ("cekkuota", "💳 Cek Masa Aktif"),
+            ("cekmassal", "📋 Cek Banyak Nopol"),
+            ("leaderboard", "🏆 Leaderboard Temuan"),
             ("stop", "⛔ Stop Proses Upload"),
             ("infobayar", "💰 Perpanjang Langganan"),
             ("tambah", "➕ Input Manual"),
@@ -672,21 +755,61 @@ async def post_init(application: Application):
         print(f"⚠️ [WARNING] Gagal set menu saat startup karena jaringan Telegram lemot: {e}")
         print("✅ [INIT] Bot tetap dilanjutkan tanpa set menu!")
 
+async def post_shutdown(application: Application):
+    await NOTIFIER.stop()
+    await asyncio.to_thread(WRITER.stop)
+
+def sync_plate_index(upserted=None, deleted=None):
+    """Jaga PLATE_INDEX tetap segar setelah data kendaraan ditulis/dihapus."""
+    global DATA_GENERATION
+    if upserted or deleted: DATA_GENERATION += 1   # Batalkan cache "tidak ditemukan" & HOT_ROWS
+    if not PLATE_INDEX: return
+    try:
+        if upserted: PLATE_INDEX.add_rows(upserted)
+        if deleted: PLATE_INDEX.remove_nopols(deleted)
+    except Exception as e:
+        logger.error(f"Plate Index Sync Error: {e}")
+
+def sync_plate_index_batch(mode, batch, res):
+    """Callback on_batch untuk UpsertExecutor: segarkan PLATE_INDEX per batch sukses."""
+    if mode == 'DELETE': sync_plate_index(deleted=[d['nopol'] for d in (res.data or [])])
+    else: sync_plate_index(upserted=batch)
+
 def get_user(user_id):
+    cached = USER_CACHE.get(str(user_id))
+    if cached is not None: return dict(cached)
     try:
         response = supabase.table('users').select("*").eq('user_id', user_id).execute()
-        return response.data[0] if response.data else None
+        if not response.data: return None
+        USER_CACHE.set(str(user_id), response.data[0])
+        return dict(response.data[0])
     except: return None
 
-def catat_audit(user_id, action, details="-"):
+async def get_user_async(user_id):
+    """Versi non-blocking get_user untuk handler bot (timeout/error -> None)."""
+    try: return await DB.run(get_user, user_id)
+    except Exception as e:
+        logger.error(f"Get User Async Error: {e}")
+        return None
+
+def invalidate_user(user_id):
+    """Buang profil user dari USER_CACHE setelah baris users-nya diubah/dihapus."""
+    USER_CACHE.invalidate(str(user_id))
+
+def patch_user_cache(user_id, fields):
+    """Write-through: samakan field yang baru ditulis ke DB dengan isi USER_CACHE."""
+    USER_CACHE.patch(str(user_id), fields)
+
+def catat_audit(user_id, action, details="-", user=None):
     """
     Fungsi Audit Trail B-One Enterprise.
     Menarik data identitas legal (Email & No HP) dari tabel users 
     dan mencatatnya ke audit_logs sesuai kepatuhan UU PDP.
+    Jika pemanggil sudah memegang baris user, kirim lewat 'user' agar tidak query ulang.
     """
     try:
-        # 1. Ambil data profil terbaru dari fungsi di atas
-        u = get_user(user_id)
+        # 1. Pakai profil yang dikirim pemanggil, atau ambil dari fungsi di atas
+        u = user if user else get_user(user_id)
         if not u:
             return
 
@@ -759,6 +882,7 @@ def find_best_match_agency(user_input):
 def update_user_status(user_id, status):
     try:
         supabase.table('users').update({'status': status}).eq('user_id', user_id).execute()
+        patch_user_cache(user_id, {'status': status})
         return True
     except: return False
 
@@ -778,11 +902,15 @@ def check_subscription_access(user):
         today_str = now_dt.strftime('%Y-%m-%d')
         daily_usage = user.get('daily_usage', 0)
 
-        if last_usage_str != today_str:
-            supabase.table('users').update({'daily_usage': 0, 'last_usage_date': today_str}).eq('user_id', user['user_id']).execute()
+        if str(last_usage_str)[:10] != today_str:
+            # Reset harian dikerjakan RPC consume_daily_quota; UPDATE manual hanya mode lama
+            if not QUOTA.available:
+                supabase.table('users').update({'daily_usage': 0, 'last_usage_date': today_str}).eq('user_id', user['user_id']).execute()
+                patch_user_cache(user['user_id'], {'daily_usage': 0, 'last_usage_date': today_str})
             daily_usage = 0
         
-        limit = DAILY_LIMIT_KORLAP if user.get('role') == 'korlap' else DAILY_LIMIT_MATEL
+        limit = daily_limit_for(user)
+        if QUOTA.over_limit(user['user_id'], today_str, limit): return False, "DAILY_LIMIT"
         if daily_usage >= limit: return False, "DAILY_LIMIT"
 
         return True, "OK"
@@ -790,16 +918,48 @@ def check_subscription_access(user):
         print(f"Sub Check Error: {e}")
         return False, "ERROR"
 
+def daily_limit_for(user):
+    if user.get('role') == 'pic': return None
+    return DAILY_LIMIT_KORLAP if user.get('role') == 'korlap' else DAILY_LIMIT_MATEL
+
+def consume_daily_quota(user):
+    """Pakai 1 kuota cek secara atomik di server. Return (allowed, daily_usage)."""
+    today_str = datetime.now(TZ_JAKARTA).strftime('%Y-%m-%d')
+    try: res = QUOTA.consume(user['user_id'], daily_limit_for(user), today_str)
+    except Exception as e:
+        logger.error(f"Quota RPC Error: {e}")
+        res = None
+    if res is None:
+        # RPC belum terpasang / gagal: kembali ke increment lama (tidak memblokir matel)
+        increment_daily_usage(user['user_id'], user.get('daily_usage', 0))
+        return True, user.get('daily_usage', 0) + 1
+    allowed, usage = res
+    patch_user_cache(user['user_id'], {'daily_usage': usage, 'last_usage_date': today_str})
+    return allowed, usage
+
+def consume_daily_quota_many(user, count):
+    """Pakai `count` kuota sekaligus (cek massal, satu RPC). Return jumlah yang diberikan, None jika RPC belum ada."""
+    today_str = datetime.now(TZ_JAKARTA).strftime('%Y-%m-%d')
+    try: res = QUOTA.consume_many(user['user_id'], daily_limit_for(user), today_str, count)
+    except Exception as e:
+        logger.error(f"Quota RPC Error: {e}")
+        return None
+    if res is None: return None
+    granted, usage = res
+    patch_user_cache(user['user_id'], {'daily_usage': usage, 'last_usage_date': today_str})
+    return granted
+
 def increment_daily_usage(user_id, current_usage):
     try:
         # Ambil waktu sekarang format ISO lengkap (Jam:Menit:Detik)
         now_iso = datetime.now(TZ_JAKARTA).isoformat()
         
-        # Update daily usage DAN last_seen
-        supabase.table('users').update({
+        # Update daily usage DAN last_seen (via write-behind, digabung per user per flush)
+        WRITER.add_user_update(user_id, {
             'daily_usage': current_usage + 1,
             'last_seen': now_iso  # <--- INI KUNCINYA
-        }).eq('user_id', user_id).execute()
+        })
+        patch_user_cache(user_id, {'daily_usage': current_usage + 1, 'last_seen': now_iso})
     except: pass
 
 def add_subscription_days(user_id, days_to_add):
@@ -820,6 +980,7 @@ def add_subscription_days(user_id, days_to_add):
             new_expiry = now + timedelta(days=days_to_add)
             
         supabase.table('users').update({'expiry_date': new_expiry.isoformat()}).eq('user_id', user_id).execute()
+        patch_user_cache(user_id, {'expiry_date': new_expiry.isoformat()})
         return True, new_expiry
     except Exception as e:
         print(f"Topup Error: {e}")
@@ -838,152 +999,6 @@ def format_wa_link(phone_number):
         clean_hp = '62' + clean_hp[1:]
     return f'<a href="https://wa.me/{clean_hp}">{phone_number}</a>'
 
-def standardize_leasing_name(raw_name):
-    """
-    Kamus Cerdas Standarisasi Nama Leasing Indonesia (V3.0 - FINAL COMPLETE).
-    Mendeteksi Nama PT Panjang -> Mengubah ke Label Singkatan Resmi.
-    """
-    if not raw_name: return "UNKNOWN"
-    
-    text = str(raw_name).upper().strip()
-    
-    # DICTIONARY: "KATA KUNCI (NAMA PT)": "LABEL STANDAR (SINGKATAN)"
-    keywords = {
-        # === 1. GROUP JTRUST & OLYMPINDO ===
-        "JTRUST INVESTMENT": "JTII",
-        "J TRUST INVESTMENT": "JTII",
-        "JTRUST OLYMPINDO": "JTO FINANCE",
-        "OLYMPINDO": "JTO FINANCE",
-        "JTO": "JTO FINANCE",
-        
-        # === 2. GROUP ASTRA & ANAK USAHA ===
-        "FEDERAL INTERNATIONAL": "FIF GROUP",
-        "FIF": "FIF GROUP",
-        "SPEKTRA": "FIF GROUP",
-        "ASTRA SEDAYA": "ACC",
-        "ACC": "ACC",
-        "TOYOTA ASTRA": "TAF",
-        "TAF": "TAF",
-        "ASTRA MULTI": "AMF",
-        "KOMATSU": "KOMATSU",
-        "SAN FINANCE": "SANF",
-        "SURYA ARTHA": "SANF",
-        
-        # === 3. GROUP BANK & BUMN ===
-        "BCA FINANCE": "BCA FINANCE",
-        "CSUL": "CSUL FINANCE", # Ciptadana
-        "MANDIRI TUNAS": "MTF",
-        "MANDIRI UTAMA": "MUF",
-        "CIMB NIAGA": "CNAF",
-        "CNAF": "CNAF",
-        "BNI MULTI": "BNI MULTIFINANCE",
-        "BRI FINANCE": "BRI FINANCE",
-        "BRI MULTI": "BRI FINANCE",
-        "BSI OTO": "BSI OTO",
-        "SYARIAH INDONESIA": "BSI OTO",
-        "MNC FINANCE": "MNC FINANCE",
-        "MNC GUNA": "MNC FINANCE",
-        "MEGA FINANCE": "MEGA FINANCE",
-        "MEGA AUTO": "MACF",
-        "MEGA CENTRAL": "MACF",
-        "KB BUKOPIN": "BUKOPIN",
-        "BUKOPIN": "BUKOPIN",
-        
-        # === 4. GROUP SWASTA BESAR (MAJOR PLAYERS) ===
-        "ADIRA": "ADIRA",
-        "BUSSAN AUTO": "BAF",
-        "BAF": "BAF",
-        "YAMAHA": "BAF", # Sering disebut Yamaha Finance
-        "WAHANA OTTOMITRA": "WOM FINANCE",
-        "WOM": "WOM FINANCE",
-        "BFI": "BFI FINANCE",
-        "SUMMIT OTO": "OTO/SUMMIT",
-        "OTO MULTI": "OTO/SUMMIT",
-        "CLIPAN": "CLIPAN",
-        "SINAR MAS": "SINARMAS",
-        "SINARMAS": "SINARMAS",
-        "SIMAS": "SINARMAS",
-        "MANDALA": "MANDALA FINANCE", # [BARU] Wajib ada
-        
-        # === 5. DEALER & BRAND AFFILIATED ===
-        "SUZUKI": "SFI",
-        "SFI": "SFI",
-        "INDOMOBIL": "IMFI",
-        "IMFI": "IMFI",
-        "DIPO STAR": "DIPO STAR",
-        "MITSUBISHI": "DIPO STAR",
-        "HINO": "HINO FINANCE",
-        "CHAILEASE": "CHAILEASE",
-        "WULING": "WULING FINANCE", # [BARU]
-        
-        # === 6. CONSUMER & FINTECH (SERING ADA MOTOR) ===
-        "HOME CREDIT": "HCI",
-        "HCI": "HCI",
-        "AEON": "AEON CREDIT",
-        "KREDIVO": "KREDIVO",
-        "AKULAKU": "AKULAKU",
-
-        # === 7. MULTIFINANCE LAINNYA (A-Z) ===
-        "AL IJARAH": "AL IJARAH",
-        "ANDALAN": "ANDALAN FINANCE",
-        "ARTHA PRIMA": "ARTHA PRIMA",
-        "ARTHAASIA": "ARTHAASIA", # [BARU]
-        "BATAVIA": "BATAVIA PROSPERINDO",
-        "BENTARA": "BESS FINANCE",
-        "BESS": "BESS FINANCE",
-        "BIMA MULTI": "BIMA FINANCE",
-        "BUANA": "BUANA FINANCE",
-        "CAPITAL": "CAPITAL",
-        "CLEMENT": "CLEMENT", # Ejaan yang benar Clement
-        "CLEMONT": "CLEMENT",
-        "COLUMBIA": "COLUMBIA",
-        "DANASUPRA": "DANASUPRA",
-        "ESTA DANA": "ESTA DANA",
-        "FINANSIA": "KREDIT PLUS",
-        "KREDIT PLUS": "KREDIT PLUS",
-        "KPLUS": "KREDIT PLUS",
-        "GLOBALINDO": "GLOBAL FINANCE",
-        "HEXA": "HEXA",
-        "INTAN BARU": "IBF",
-        "IBF": "IBF",
-        "INTRA ASIA": "INTRA ASIA",
-        "ISTANA": "ISTANA", # IMG
-        "KEMBANG 88": "KEMBANG 88",
-        "KRESNA": "KRESNA REKSA",
-        "MAYBANK": "MAYBANK FINANCE",
-        "MITSUI": "MITSUI LEASING",
-        "MULTI INDO": "MULTI INDO",
-        "NUSA SURYA": "NSC FINANCE",
-        "NSC": "NSC FINANCE",
-        "ORICO": "ORICO BALIMOR", # [BARU] Ex Mizuho
-        "BALIMOR": "ORICO BALIMOR",
-        "PRO CAR": "PRO CAR",
-        "PRO MITRA": "PRO CAR",
-        "RADANA": "RADANA",
-        "REKSA": "REKSA FINANCE",
-        "RESURSA": "RESURSA",
-        "SMS": "SMS FINANCE",
-        "SINAR MITRA": "SMS FINANCE",
-        "SMART MULTI": "SMART FINANCE",
-        "SMART FINANCE": "SMART FINANCE",
-        "SUNINDO": "SUNINDO",
-        "SWADHARMA": "SWADHARMA",
-        "TIFA": "TIFA",
-        "TOPAZ": "TOPAZ", # [BARU]
-        "TRUST": "TRUST FINANCE",
-        "VERENA": "VERENA",
-        "WOKA": "WOKA FINANCE"
-    }
-
-    # LOGIKA PENCARIAN
-    # Kita cari string input user di dalam key dictionary
-    for key, label in keywords.items():
-        if key in text:
-            return label
-
-    # Jika nama PT sangat asing dan tidak ada di kamus,
-    # Kembalikan nama aslinya (Upper Case) agar admin sadar ada leasing baru
-    return text
 
 # [CRITICAL UPDATE] LOGIC PENCATATAN LOG DIUBAH MENERIMA USER OBJECT
 def log_successful_hit(user_db, unit_data):
@@ -1007,7 +1022,8 @@ def log_successful_hit(user_db, unit_data):
             "no_hp": user_hp,      # SEKARANG TERISI
             "nama_pt": user_agency # SEKARANG TERISI
         }
-        supabase.table('finding_logs').insert(payload).execute()
+        WRITER.add_hit(payload)
+        HIT_ROLLUP.add(datetime.now(TZ_JAKARTA).strftime('%Y-%m-%d'), payload)
         
     except Exception as e:
         print(f"⚠️ Gagal menyimpan log ke database: {e}")
@@ -1016,96 +1032,55 @@ def log_successful_hit(user_db, unit_data):
 # BAGIAN 5: ENGINE FILE
 # ##############################################################################
 
-def normalize_text(text):
-    if not isinstance(text, str): return str(text).lower()
-    return re.sub(r'[^a-zA-Z0-9]', '', text).lower()
-
-def fix_header_position(df):
-    target = COLUMN_ALIASES['nopol']
-    for i in range(min(30, len(df))): 
-        vals = [normalize_text(str(x)) for x in df.iloc[i].values]
-        if any(alias in vals for alias in target):
-            df.columns = df.iloc[i] 
-            df = df.iloc[i+1:].reset_index(drop=True) 
-            return df
-    return df
-
-def smart_rename_columns(df):
-    new_cols = {}
-    found_std = set()
-    
-    # 1. Bersihkan nama kolom dari spasi, tanda kutip, dan karakter aneh
-    df.columns = [str(c).strip().replace('"', '').replace("'", "").lower() for c in df.columns]
-    
-    for col in df.columns:
-        renamed = False
-        # Hilangkan karakter non-alfanumerik untuk pencocokan alias
-        clean_col = re.sub(r'[^a-z0-9]', '', col)
-        
-        for std_name, aliases in COLUMN_ALIASES.items():
-            # Jika kolom ini adalah standar atau ada di daftar alias, dan belum ditemukan sebelumnya
-            if (clean_col == std_name or clean_col in aliases) and std_name not in found_std:
-                new_cols[col] = std_name
-                found_std.add(std_name)
-                renamed = True
-                break
-        
-        if not renamed:
-            new_cols[col] = col
-            
-    df.rename(columns=new_cols, inplace=True)
-    return df, list(found_std)
+# Pembaca file, sniffer CSV, streaming per potongan & analisa preview ada di
+# utils_upload.py (importable, dipakai juga oleh worker process pool)
 
-def read_file_robust(content, fname):
-    """
-    Versi INTELLIGENT: 
-    Otomatis mencari separator yang benar (Koma atau Titik Koma)
-    agar tidak gagal baca kolom.
-    """
-    fname = fname.lower()
-    
-    # 1. Cek ZIP
-    if fname.endswith('.zip'):
-        with zipfile.ZipFile(io.BytesIO(content)) as z:
-            valid = [f for f in z.namelist() if f.endswith(('.csv','.xlsx','.xls'))]
-            if not valid: raise ValueError("ZIP Kosong")
-            with z.open(valid[0]) as f: 
-                content = f.read()
-                fname = valid[0].lower()
-    
-    # 2. Cek EXCEL (.xlsx / .xls)
-    if fname.endswith(('.xlsx', '.xls')):
-        try: return pd.read_excel(io.BytesIO(content), dtype=str)
-        except Exception as e: raise ValueError(f"Gagal baca Excel: {e}")
-
-    # 3. Cek CSV (SMART SEPARATOR DETECTION)
-    # Kita coba berbagai kemungkinan separator
-    separators = [';', ',', '\t', '|']
-    
-    # Percobaan 1: Encoding UTF-8 (Standar)
-    for sep in separators:
-        try:
-            df = pd.read_csv(io.BytesIO(content), sep=sep, dtype=str, on_bad_lines='skip', encoding='utf-8')
-            # [LOGIKA PINTAR] Jika kolom terdeteksi lebih dari 1, berarti separator BENAR!
-            if len(df.columns) > 1: 
-                print(f"✅ CSV Terbaca dengan separator: '{sep}'")
-                return df
-        except: continue
-
-    # Percobaan 2: Encoding Latin-1 (Jika file jadul/Windows lama)
-    for sep in separators:
-        try:
-            df = pd.read_csv(io.BytesIO(content), sep=sep, dtype=str, on_bad_lines='skip', encoding='latin1')
-            if len(df.columns) > 1: 
-                print(f"✅ CSV (Latin1) Terbaca dengan separator: '{sep}'")
-                return df
-        except: continue
+# --- PROCESS POOL PARSING ---
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", 2))
+PARSE_POOL = None
 
-    # Jika semua gagal, coba paksa baca koma sebagai fallback terakhir
+async def run_parse_job(fn, *args):
+    """Jalankan fungsi parsing berat di process pool (fallback ke thread jika pool bermasalah)."""
+    global PARSE_POOL
+    loop = asyncio.get_running_loop()
     try:
-        return pd.read_csv(io.BytesIO(content), sep=',', dtype=str, on_bad_lines='skip', encoding='utf-8')
-    except:
-        raise ValueError("Format file tidak dikenali. Pastikan Excel atau CSV yang valid.")
+        if PARSE_POOL is None:
+            # 'spawn': proses bot sudah multithread (Flask, AsyncDB, write-behind, notifier),
+            # fork bisa mewarisi lock yang sedang dipegang thread lain -> worker deadlock.
+            # Worker hanya meng-import utils_upload, bukan main.py.
+            PARSE_POOL = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return await loop.run_in_executor(PARSE_POOL, fn, *args)
+    except (BrokenProcessPool, OSError) as e:
+        logger.error(f"Parse Pool Error, fallback ke thread: {e}")
+        PARSE_POOL = None
+        return await asyncio.to_thread(fn, *args)
+
+def prepare_upload_records(df, target, code_version):
+    """Normalisasi satu potongan (leasing, nopol, kolom wajib, kode bulan) -> list dict siap kirim."""
+    if target and target != 'SKIP':
+        df['finance'] = standardize_leasing_name(target)
+    else:
+        if 'finance' in df.columns: df['finance'] = standardize_leasing_series(df['finance'])
+        else: df['finance'] = 'UNKNOWN'
+
+    if 'nopol' not in df.columns: raise ValueError("Kolom NOPOL tidak ditemukan dalam file.")
+
+    # Bersihkan Nopol
+    df['nopol'] = df['nopol'].astype(str).str.replace(r'[^a-zA-Z0-9]', '', regex=True).str.upper()
+    df = df.dropna(subset=['nopol'])
+    df = df[df['nopol'].str.len() > 2]
+    # Duplikat antar potongan aman: upsert berikutnya menimpa (sama dengan keep='last')
+    df = df.drop_duplicates(subset=['nopol'], keep='last')
+
+    # Pastikan Kolom Lengkap
+    for c in VALID_DB_COLUMNS:
+        if c not in df.columns: df[c] = None
+
+    # Masukkan Kode Bulan
+    df['data_month'] = code_version
+
+    out = df[VALID_DB_COLUMNS + ['data_month']].astype(object)
+    return out.where(out.notna(), None).to_dict('records')
 
 
 # ##############################################################################
@@ -1119,7 +1094,8 @@ async def angkat_korlap(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return await update.message.reply_text("⚠️ Format: `/angkat_korlap [ID] [KOTA]`", parse_mode='Markdown')
         target_id = int(context.args[0]); wilayah = " ".join(context.args[1:]).upper()
         data = {"role": "korlap", "wilayah_korlap": wilayah, "quota": 5000} 
-        supabase.table('users').update(data).eq('user_id', target_id).execute()
+        await DB.execute(supabase.table('users').update(data).eq('user_id', target_id))
+        patch_user_cache(target_id, data)
         await update.message.reply_text(f"✅ **SUKSES!**\nUser ID `{target_id}` sekarang adalah **KORLAP {wilayah}**.\nLimit Harian: 2000 Cek.", parse_mode='Markdown')
     except Exception as e: await update.message.reply_text(f"❌ Gagal: {e}")
 
@@ -1134,7 +1110,7 @@ async def reject_start(update, context):
 async def reject_complete(update, context):
     if update.message.text == "❌ BATAL": return await cancel(update, context)
     target_uid = context.user_data.get('reject_target_uid'); reason = update.message.text
-    try: supabase.table('users').delete().eq('user_id', target_uid).execute()
+    try: await DB.execute(supabase.table('users').delete().eq('user_id', target_uid)); invalidate_user(target_uid)
     except: pass
     try: 
         msg_user = (f"⛔ **PENDAFTARAN DITOLAK**\n\n⚠️ <b>Alasan:</b> {reason}\n\n<i>Data Anda telah dihapus. Silakan lakukan registrasi ulang dengan data yang benar via /register</i>")
@@ -1180,9 +1156,9 @@ async def admin_action_start(update, context):
 async def admin_action_complete(update, context):
     if update.message.text == "❌ BATAL": return await cancel(update, context)
     act = context.user_data.get('adm_act_type'); uid = context.user_data.get('adm_act_uid'); reason = update.message.text
-    if act == "ban": update_user_status(uid, 'rejected'); msg = f"⛔ **BANNED**\nAlasan: {reason}"
-    elif act == "unban": update_user_status(uid, 'active'); msg = f"✅ **UNBANNED**\nCatatan: {reason}"
-    elif act == "del": supabase.table('users').delete().eq('user_id', uid).execute(); msg = f"🗑️ **DELETED**\nAlasan: {reason}"
+    if act == "ban": await DB.run(update_user_status, uid, 'rejected'); msg = f"⛔ **BANNED**\nAlasan: {reason}"
+    elif act == "unban": await DB.run(update_user_status, uid, 'active'); msg = f"✅ **UNBANNED**\nCatatan: {reason}"
+    elif act == "del": await DB.execute(supabase.table('users').delete().eq('user_id', uid)); invalidate_user(uid); msg = f"🗑️ **DELETED**\nAlasan: {reason}"
     try: await context.bot.send_message(uid, msg)
     except: pass
     await update.message.reply_text(f"✅ Action {act} Sukses.", reply_markup=ReplyKeyboardRemove()); return ConversationHandler.END
@@ -1232,6 +1208,63 @@ async def admin_help(update, context):
     )
     await update.message.reply_text(msg, parse_mode='Markdown')
 
+# ==============================================================================
+# HELPER: ROLLUP HIT HARIAN (SUMBER DATA /rekap & /cekagency)
+# ==============================================================================
+def load_hit_rollup():
+    """Muat ulang HIT_ROLLUP untuk hari ini dari database (sinkron, panggil via DB.run). Return total hit."""
+    now = datetime.now(TZ_JAKARTA)
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day = now.strftime('%Y-%m-%d')
+    # Hit sesudah titik ini dicatat rollup; saat load hanya yang BELUM terkirim yang ditambahkan
+    HIT_ROLLUP.begin_load(day)
+    try:
+        # Buffer write-behind dikirim lalu flusher ditahan selama snapshot: hit yang sudah
+        # terkirim pasti ada di snapshot, sisanya masih di antrian (WRITER.is_queued)
+        with WRITER.hold():
+            try:
+                # Satu baris per (leasing, nama_pt, user_id): dipaging agar tidak terpotong max_rows
+                rows = [r for page in iter_rpc_pages(
+                    supabase, 'daily_hit_rollup', {"p_since": start_of_day.isoformat()},
+                    order=('leasing', 'nama_pt', 'user_id')
+                ) for r in page]
+            except Exception as e:
+                if not is_rpc_missing(e): raise
+                # RPC belum terpasang: hitung dari 3 kolom saja, per halaman id
+                rows = list(itertools.chain.from_iterable(iter_keyset_pages(
+                    supabase, 'finding_logs', "id, " + HIT_ROLLUP_FIELDS,
+                    apply_filters=lambda q: q.gte('created_at', start_of_day.isoformat()), key='id'
+                )))
+            return HIT_ROLLUP.load(day, rows, unflushed=WRITER.is_queued)
+    except Exception:
+        HIT_ROLLUP.cancel_load()
+        raise
+
+async def get_hit_rollup(day):
+    """Key rollup hari ini; dimuat dari database jika bot belum punya (mis. gagal saat start)."""
+    if not HIT_ROLLUP.ready(day): await DB.run(load_hit_rollup, timeout=DB_TIMEOUT_LONG)
+    return HIT_ROLLUP.keys(day)
+
+def fetch_hit_details(since_iso, user_ids, match):
+    """
+    Baris finding_logs hari ini HANYA milik user_ids (index user_id + created_at),
+    lalu disaring lagi dengan match(leasing, nama_pt) yang sama dengan rollup.
+    Return (baris TERBARU dulu, maks REKAP_DETAIL_ROWS; terpotong True jika ada yang tidak ikut).
+    """
+    # Hit yang masih di buffer write-behind dikirim dulu agar rincian sama dengan Total rollup
+    WRITER.flush()
+    out = []; truncated = False
+    for i in range(0, len(user_ids), 100):
+        res = supabase.table('finding_logs').select("nopol, unit, nama_matel, leasing, nama_pt, created_at") \
+            .in_('user_id', user_ids[i:i + 100]).gte('created_at', since_iso) \
+            .order('created_at', desc=True).limit(REKAP_DETAIL_ROWS).execute()
+        rows = res.data or []
+        if len(rows) >= REKAP_DETAIL_ROWS: truncated = True
+        out += [r for r in rows if match(r.get('leasing') or '-', r.get('nama_pt') or '-')]
+    out.sort(key=lambda r: r.get('created_at') or '', reverse=True)
+    if len(out) > REKAP_DETAIL_ROWS: out, truncated = out[:REKAP_DETAIL_ROWS], True
+    return out, truncated
+
 async def rekap_harian(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID: return
     
@@ -1239,17 +1272,14 @@ async def rekap_harian(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         now = datetime.now(TZ_JAKARTA)
-        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
         
-        # Tarik data (Data di finding_logs otomatis sudah terfilter bersih)
-        res = supabase.table('finding_logs').select("leasing").gte('created_at', start_of_day.isoformat()).execute()
-        data = res.data
+        # Hitungan diambil dari rollup memori (tidak menarik log hari ini)
+        await get_hit_rollup(now.strftime('%Y-%m-%d'))
+        counts = HIT_ROLLUP.by_leasing(now.strftime('%Y-%m-%d'))
+        total_hits = sum(counts.values())
         
-        if not data:
+        if not total_hits:
             return await msg.edit_text("📊 **REKAP HARIAN (MURNI LAPANGAN)**\n\nBelum ada unit ditemukan (HIT) hari ini.")
-
-        counts = Counter([d['leasing'] for d in data])
-        total_hits = len(data)
         
         report = (
             f"📊 **REKAP TEMUAN (HIT) HARI INI**\n"
@@ -1285,7 +1315,7 @@ def clean_pt_name(text):
 
 async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     
     # 1. CEK OTORITAS
     # Hanya Admin, Superadmin, Korlap, dan PIC yang boleh akses
@@ -1308,35 +1338,30 @@ async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_msg = await update.message.reply_text(f"⏳ **Sedang mengaudit data...**", parse_mode='Markdown')
 
     try:
-        # 3. TARIK DATA HARIAN (DATABASE)
+        # 3. ROLLUP HARIAN (MEMORI)
         now = datetime.now(TZ_JAKARTA)
         start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day = now.strftime('%Y-%m-%d')
         
-        # Ambil semua log temuan hari ini
-        res = supabase.table('finding_logs').select("*").gte('created_at', start_of_day.isoformat()).execute()
-        all_logs = res.data
+        # Key (leasing, nama_pt, user_id) -> jumlah hit hari ini
+        rollup = await get_hit_rollup(day)
         
-        if not all_logs:
+        if not rollup:
             return await status_msg.edit_text(f"📊 **REKAP HARIAN**\n\nNihil. Belum ada unit ditemukan hari ini (Global).")
 
         # 4. LOGIKA FILTERING (SESUAI JABATAN)
-        target_data = []
+        # match(leasing, nama_pt) dipakai untuk key rollup DAN baris detail
+        match = None
         header_context = "GLOBAL"
         mode_tampilan = "SUMMARY"
 
         # --- A. LOGIKA ADMIN (Bisa lihat semua) ---
         if role in ['admin', 'superadmin']:
             if not keyword: 
-                target_data = all_logs
                 header_context = "GLOBAL (ADMIN)"
             else:
-                target_data = []
                 keyword_clean = clean_pt_name(keyword)
-                for l in all_logs:
-                    l_leasing = str(l.get('leasing','')).upper()
-                    l_pt = clean_pt_name(l.get('nama_pt',''))
-                    if keyword_clean in l_leasing or keyword_clean in l_pt:
-                        target_data.append(l)
+                match = lambda l, pt: keyword_clean in str(l).upper() or keyword_clean in clean_pt_name(pt)
                 mode_tampilan = "DETAIL"
                 header_context = f"SEARCH: {keyword}"
 
@@ -1344,7 +1369,7 @@ async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif role == 'pic':
             my_leasing_std = standardize_leasing_name(my_agency)
             # Filter hanya data milik leasing dia
-            target_data = [l for l in all_logs if my_leasing_std in str(l.get('leasing','')).upper()]
+            match = lambda l, pt: my_leasing_std in str(l).upper()
             
             header_context = f"INTERNAL {my_leasing_std}"
             mode_tampilan = "DETAIL" # PIC Selalu melihat detail
@@ -1352,38 +1377,40 @@ async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # --- C. LOGIKA KORLAP (Hanya lihat tim sendiri) ---
         elif role == 'korlap':
             my_agency_clean = clean_pt_name(my_agency)
+
+            def agency_match(pt):
+                # Match nama PT (Flexible)
+                log_pt_clean = clean_pt_name(pt)
+                return my_agency_clean in log_pt_clean or log_pt_clean in my_agency_clean
             if not keyword:
-                target_data = []
-                for l in all_logs:
-                    log_pt_clean = clean_pt_name(l.get('nama_pt',''))
-                    # Match nama PT (Flexible)
-                    if my_agency_clean in log_pt_clean or log_pt_clean in my_agency_clean:
-                        target_data.append(l)
+                match = lambda l, pt: agency_match(pt)
                 header_context = f"AGENCY {my_agency}"
             else:
                 # Filter tim sendiri + leasing tertentu
-                target_data = []
-                for l in all_logs:
-                    log_pt_clean = clean_pt_name(l.get('nama_pt',''))
-                    log_leasing = str(l.get('leasing','')).upper()
-                    if (my_agency_clean in log_pt_clean or log_pt_clean in my_agency_clean) and (keyword in log_leasing):
-                        target_data.append(l)
+                match = lambda l, pt: agency_match(pt) and keyword in str(l).upper()
                 mode_tampilan = "DETAIL"
                 header_context = f"{my_agency} ({keyword})"
 
+        counts = HIT_ROLLUP.by_leasing(day, match)
+        total = sum(counts.values())
+
         # 5. RENDER TAMPILAN (FORMAT LENGKAP)
-        if not target_data:
+        if not total:
              return await status_msg.edit_text(f"🔍 **HASIL PENCARIAN KOSONG**\n\nKonteks: {header_context}\nKeyword: {keyword}\n\n_Tidak ada data yang cocok hari ini._", parse_mode='Markdown')
 
         # === TAMPILAN DETAIL (BERLAKU UNTUK ADMIN, PIC, DAN KORLAP) ===
         if mode_tampilan == "DETAIL":
+            # Baris hanya ditarik untuk user yang punya hit cocok di rollup
+            target_data, truncated = await DB.run(fetch_hit_details, start_of_day.isoformat(), HIT_ROLLUP.users(day, match), match, timeout=DB_TIMEOUT_LONG)
             rpt = (
                 f"📋 **RINCIAN TEMUAN HARIAN**\n"
                 f"🔍 **Filter:** {header_context}\n"
                 f"📅 **Tanggal:** {now.strftime('%d %b %Y')}\n"
-                f"🔥 **Total:** {len(target_data)} Unit\n"
-                f"━━━━━━━━━━━━━━━━━━\n"
+                f"🔥 **Total:** {total} Unit\n"
             )
+            if truncated or len(target_data) < total:
+                rpt += f"ℹ️ _Rincian: {len(target_data)} temuan terbaru dari {total}_\n"
+            rpt += "━━━━━━━━━━━━━━━━━━\n"
             body = ""
             for i, d in enumerate(target_data):
                 nopol = d.get('nopol', '-')
@@ -1408,17 +1435,13 @@ async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         else:
             # TAMPILAN SUMMARY (HANYA MUNCUL JIKA ADMIN KETIK /REKAP TANPA KEYWORD)
-            stats = {}
-            for x in target_data:
-                k = x.get('leasing', 'UNKNOWN')
-                stats[k] = stats.get(k, 0) + 1
-            sorted_stats = sorted(stats.items(), key=lambda item: item[1], reverse=True)
+            sorted_stats = counts.most_common()
             
             rpt = (
                 f"📊 **REKAP STATISTIK HARIAN**\n"
                 f"🏢 **Level:** {header_context}\n"
                 f"📅 **Tanggal:** {now.strftime('%d %b %Y')}\n"
-                f"🔥 **TOTAL GLOBAL:** {len(target_data)} Unit\n"
+                f"🔥 **TOTAL GLOBAL:** {total} Unit\n"
                 f"━━━━━━━━━━━━━━━━━━\n"
             )
             for k, count in sorted_stats:
@@ -1431,6 +1454,30 @@ async def rekap_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Master Rekap Error: {e}")
         await status_msg.edit_text(f"❌ Terjadi kesalahan sistem: {e}")
 
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/leaderboard [hari|minggu|bulan|semua] - Top 10 matel dengan hit terbanyak."""
+    u = await get_user_async(update.effective_user.id)
+    if not u or u.get('status') != 'active': return
+
+    arg = context.args[0].lower() if context.args else 'hari'
+    window = WINDOW_ALIASES.get(arg)
+    if not window:
+        return await update.message.reply_text("⚠️ Format: <code>/leaderboard [hari|minggu|bulan|semua]</code>", parse_mode='HTML')
+
+    try:
+        rows = await DB.run(LEADERBOARD.top, window, 10)
+    except Exception as e:
+        logger.error(f"Leaderboard Error: {e}")
+        return await update.message.reply_text("❌ Gagal memuat leaderboard, coba lagi nanti.")
+
+    msg = f"🏆 <b>LEADERBOARD {LEADERBOARD_WINDOWS[window]}</b>\n━━━━━━━━━━━━━━━━━━\n"
+    if not rows: msg += "<i>Belum ada unit ditemukan pada periode ini.</i>\n"
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    for i, r in enumerate(rows, 1):
+        msg += f"{medals.get(i, f'{i}.')} <b>{clean_text(r.get('nama_lengkap') or 'Anonim')}</b> ({clean_text(r.get('agency') or '-')}) - {r.get('hits', 0)} HIT\n"
+    msg += "━━━━━━━━━━━━━━━━━━\n💡 <i>/leaderboard minggu | bulan | semua</i>"
+    await update.message.reply_text(msg, parse_mode='HTML')
+
 # Agar /cekagency juga jalan, kita arahkan ke handler yang sama
 async def cek_agency_redirect(update, context):
     await rekap_handler(update, context)
@@ -1441,7 +1488,7 @@ async def list_users(update, context):
     await context.bot.send_chat_action(update.effective_chat.id, constants.ChatAction.TYPING)
     
     try:
-        res = supabase.table('users').select("*").execute()
+        res = await DB.execute(supabase_bulk.table('users').select("*"), timeout=DB_TIMEOUT_LONG)
         active_list = [u for u in res.data if u.get('status') == 'active']
         pic_list = [u for u in active_list if u.get('role') == 'pic']
         field_list = [u for u in active_list if u.get('role') != 'pic'] 
@@ -1499,7 +1546,7 @@ async def manage_user_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID: return
     try:
         tid = int(update.message.text.split('_')[1])
-        u = get_user(tid)
+        u = await get_user_async(tid)
         if not u: return await update.message.reply_text("❌ User tidak ditemukan.")
         role_now = u.get('role', 'matel')
         status_now = u.get('status', 'active')
@@ -1532,11 +1579,11 @@ async def rekap_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
         display_date = now.strftime('%d %B %Y')
         
         # 2. Hitung Register Hari Ini (Semua status)
-        res_today = supabase.table('users').select('user_id', count='exact').gte('created_at', f"{today_str} 00:00:00").execute()
+        res_today = await DB.execute(supabase.table('users').select('user_id', count='exact').gte('created_at', f"{today_str} 00:00:00"))
         count_today = res_today.count if res_today.count else 0
 
         # 3. Ambil Data Pending
-        res_pending = supabase.table('users').select('*').eq('status', 'pending').execute()
+        res_pending = await DB.execute(supabase.table('users').select('*').eq('status', 'pending'))
         pending_users = res_pending.data
         count_pending = len(pending_users)
 
@@ -1577,7 +1624,7 @@ async def auto_cleanup_logs(context: ContextTypes.DEFAULT_TYPE):
     try:
         cutoff_date = datetime.now(TZ_JAKARTA) - timedelta(days=5)
         cutoff_str = cutoff_date.isoformat()
-        supabase.table('finding_logs').delete().lt('created_at', cutoff_str).execute()
+        await DB.execute(supabase_bulk.table('finding_logs').delete().lt('created_at', cutoff_str), timeout=DB_TIMEOUT_LONG)
         print(f"🧹 [AUTO CLEANUP] Log lama (< {cutoff_date.strftime('%d-%b')}) berhasil dihapus.")
     except Exception as e:
         logger.error(f"❌ AUTO CLEANUP ERROR: {e}")
@@ -1585,17 +1632,18 @@ async def auto_cleanup_logs(context: ContextTypes.DEFAULT_TYPE):
 async def get_stats(update, context):
     if update.effective_user.id != ADMIN_ID: return
     try:
-        t = supabase.table('kendaraan').select("*", count="exact", head=True).execute().count
-        u = supabase.table('users').select("*", count="exact", head=True).execute().count
-        k = supabase.table('users').select("*", count="exact", head=True).eq('role', 'korlap').execute().count
-        await update.message.reply_text(f"📊 **STATS v6.0**\n📂 Data: `{t:,}`\n👥 Total User: `{u}`\n🎖️ Korlap: `{k}`", parse_mode='Markdown')
+        t = (await DB.execute(supabase_bulk.table('kendaraan').select("*", count="exact", head=True), timeout=DB_TIMEOUT_LONG)).count
+        u = (await DB.execute(supabase.table('users').select("*", count="exact", head=True))).count
+        k = (await DB.execute(supabase.table('users').select("*", count="exact", head=True).eq('role', 'korlap'))).count
+        c = USER_CACHE.stats(); mc = MISS_CACHE.stats(); hr = HOT_ROWS.stats(); db = DB.stats(); g = GROUP_ROUTER.stats(); n = NOTIFIER.stats(); w = WRITER.stats(); q = QUOTA.stats()
+        await update.message.reply_text(f"📊 **STATS v6.0**\n📂 Data: `{t:,}`\n👥 Total User: `{u}`\n🎖️ Korlap: `{k}`\n⚡ User Cache: `{c['size']}` entri | Hit `{c['hits']}` / Miss `{c['misses']}` ({c['hit_rate']}%)\n🚫 Cache Tidak Ditemukan: `{mc['size']}` entri | Hit `{mc['hits']}` ({mc['hit_rate']}%) | Gen `{DATA_GENERATION}`\n🔥 Hot Rows: `{hr['chats']}` chat | `{hr['bytes'] // 1024}` KB | Hit `{hr['hits']}` ({hr['hit_rate']}%)\n🧵 DB Async: `{db['calls']}` call | Timeout `{db['timeouts']}` | Error `{db['errors']}`\n📡 Routing Group: `{g['leasing_groups']}` leasing | `{g['agency_groups']}` agency | Memo `{g['memo']}`\n📨 Notifikasi: `{n['sent']}` terkirim | Antri `{n['queued']}` | Gagal `{n['failed']}` | Dibuang `{n['dropped']}`\n📝 Write-Behind: Antri `{w['pending']}` | Log `{w['hits']}` | User `{w['users']}` | Error `{w['errors']}` | Dead `{w['dead']}`\n🎫 Kuota RPC: `{q['rpc']}` call | Tolak Lokal `{q['rejected_local']}` | Tolak DB `{q['rejected_db']}`", parse_mode='Markdown')
     except: pass
 
 async def get_leasing_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID: return
     msg = await update.message.reply_text("⏳ **Menghitung Statistik Data...**", parse_mode='Markdown')
     try:
-        response = await asyncio.to_thread(lambda: supabase.rpc('get_leasing_summary').execute())
+        response = await DB.execute(supabase_bulk.rpc('get_leasing_summary'), timeout=DB_TIMEOUT_LONG)
         data = response.data 
         if not data: return await msg.edit_text("❌ Database Kosong atau Fungsi SQL belum dipasang.")
         total_global = sum(item['total'] for item in data)
@@ -1629,7 +1677,7 @@ async def admin_topup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID: return
     try:
         tid, days = int(context.args[0]), int(context.args[1])
-        suc, new_exp = add_subscription_days(tid, days)
+        suc, new_exp = await DB.run(add_subscription_days, tid, days)
         if suc: await update.message.reply_text(f"✅ Sukses! User {tid} aktif s/d {new_exp.strftime('%d-%m-%Y')}.")
         else: await update.message.reply_text("❌ Gagal Topup.")
     except: await update.message.reply_text("⚠️ Format: `/topup ID HARI`")
@@ -1639,7 +1687,7 @@ async def add_agency(update, context):
     try:
         name = " ".join(context.args)
         if not name: return await update.message.reply_text("⚠️ Nama Agency kosong.")
-        supabase.table('agencies').insert({"name": name}).execute()
+        await DB.execute(supabase.table('agencies').insert({"name": name}))
         await update.message.reply_text(f"✅ Agency '{name}' ditambahkan.")
     except: await update.message.reply_text("❌ Error.")
 
@@ -1651,7 +1699,7 @@ import secrets # Pastikan import ini ada di bagian paling atas file main.py
 async def request_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Men-generate Magic Link eksklusif untuk PIC Leasing yang terdaftar."""
     user_id = str(update.effective_user.id)
-    user_data = get_user(user_id)
+    user_data = await get_user_async(user_id)
     
     # 1. Validasi: Apakah User Terdaftar?
     if not user_data:
@@ -1675,10 +1723,11 @@ async def request_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 4. Simpan ke Supabase (Gembok dipasang)
     try:
         # FIX: Menggunakan kolom 'user_id' sesuai database Bapak
-        supabase.table('users').update({
+        await DB.execute(supabase.table('users').update({
             'session_token': token,
             'session_expiry': expiry_time
-        }).eq('user_id', user_id).execute()
+        }).eq('user_id', user_id))
+        patch_user_cache(user_id, {'session_token': token, 'session_expiry': expiry_time})
     except Exception as e:
         logger.error(f"Gagal update token: {e}")
         return await update.message.reply_text("⚠️ Sistem sibuk. Gagal membuat token akses.")
@@ -1704,10 +1753,11 @@ async def reset_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     try:
         # FIX: Menggunakan kolom 'user_id'
-        supabase.table('users').update({
+        await DB.execute(supabase.table('users').update({
             'session_token': None,
             'session_expiry': None
-        }).eq('user_id', user_id).execute()
+        }).eq('user_id', user_id))
+        patch_user_cache(user_id, {'session_token': None, 'session_expiry': None})
         await update.message.reply_text("✅ Sesi Dashboard berhasil di-reset. Anda sekarang bisa membuka Dashboard di perangkat/browser baru dengan mengetik /dashboard.")
     except Exception as e:
         logger.error(f"Gagal reset sesi: {e}")
@@ -1728,7 +1778,7 @@ async def contact_admin(update, context):
 
 async def support_send(update, context):
     if update.message.text == "❌ BATAL": return await cancel(update, context)
-    u = get_user(update.effective_user.id); msg_content = update.message.text
+    u = await get_user_async(update.effective_user.id); msg_content = update.message.text
     msg_admin = (f"📩 **PESAN DARI MITRA**\n━━━━━━━━━━━━━━━━━━\n👤 <b>Nama:</b> {clean_text(u.get('nama_lengkap'))}\n🏢 <b>Agency:</b> {clean_text(u.get('agency'))}\n📱 <b>ID:</b> <code>{u['user_id']}</code>\n━━━━━━━━━━━━━━━━━━\n💬 <b>Pesan:</b>\n{msg_content}\n━━━━━━━━━━━━━━━━━━\n👉 <b>Balas:</b> <code>/balas {u['user_id']} [Pesan]</code>")
     await context.bot.send_message(ADMIN_ID, msg_admin, parse_mode='HTML')
     await update.message.reply_text("✅ **Pesan Terkirim!**\nMohon tunggu balasan dari Admin.", reply_markup=ReplyKeyboardRemove()); return ConversationHandler.END
@@ -1742,7 +1792,7 @@ async def cek_user_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except: return
     
     # 2. Ambil data dari Database
-    res = supabase.table('users').select('*').eq('user_id', target_uid).execute()
+    res = await DB.execute(supabase.table('users').select('*').eq('user_id', target_uid))
     if not res.data: return await update.message.reply_text("❌ Data hilang/sudah diproses.")
     
     d = res.data[0] # Data user
@@ -1783,7 +1833,7 @@ async def cek_user_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     if not u or u['status'] != 'active': return
     
     global GLOBAL_INFO
@@ -1807,13 +1857,13 @@ async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
             .ilike('nama_pt', f"%{my_agency}%")\
             .gte('created_at', start_month)
             
-        try: total_hits = q_hits.execute().count or 0
+        try: total_hits = (await DB.execute(q_hits)).count or 0
         except: total_hits = 0
         
         # Hitung Total Anggota Tim
         q_members = supabase.table('users').select('*', count='exact', head=True)\
             .ilike('agency', f"%{my_agency}%")
-        try: total_members = q_members.execute().count or 0
+        try: total_members = (await DB.execute(q_members)).count or 0
         except: total_members = 0
 
         msg = (
@@ -1837,11 +1887,11 @@ async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # (Kode lama Komandan tetap dipakai di sini, tidak berubah)
         if is_admin:
             leasing_name = "GLOBAL (ADMIN)"
-            query_total = supabase.table('kendaraan').select('*', count='exact', head=True)
+            query_total = supabase_bulk.table('kendaraan').select('*', count='exact', head=True)
             query_hits = supabase.table('finding_logs').select('*', count='exact', head=True).gte('created_at', start_month)
         else:
             leasing_name = standardize_leasing_name(u.get('agency'))
-            query_total = supabase.table('kendaraan').select('*', count='exact', head=True).eq('finance', leasing_name)
+            query_total = supabase_bulk.table('kendaraan').select('*', count='exact', head=True).eq('finance', leasing_name)
             # Filter Cabang untuk PIC
             user_branch = str(u.get('wilayah_korlap', '')).strip().upper()
             if user_branch not in ['HO', 'PUSAT', 'NASIONAL', '']:
@@ -1850,9 +1900,9 @@ async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
             query_hits = supabase.table('finding_logs').select('*', count='exact', head=True)\
                 .ilike('leasing', f"%{leasing_name}%").gte('created_at', start_month)
 
-        try: total_unit = query_total.execute().count or 0
+        try: total_unit = (await DB.execute(query_total, timeout=DB_TIMEOUT_LONG)).count or 0
         except: total_unit = 0
-        try: total_hits = query_hits.execute().count or 0
+        try: total_hits = (await DB.execute(query_hits)).count or 0
         except: total_hits = 0
 
         msg = (
@@ -1868,8 +1918,12 @@ async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         kb = [
             [InlineKeyboardButton("📂 DOWNLOAD DATABASE ASET", callback_data="dl_assets")],
+            [InlineKeyboardButton("⚡ DOWNLOAD ASET (CSV.GZ)", callback_data="dl_assets_csv")],
             [InlineKeyboardButton("📈 DOWNLOAD LAPORAN TEMUAN", callback_data="dl_findings")]
         ]
+        if 'parquet' in EXPORT_FORMATS:
+            # Hanya jika pyarrow terpasang: format kolumnar untuk diolah tim data leasing
+            kb.insert(2, [InlineKeyboardButton("🗜️ DOWNLOAD ASET (PARQUET)", callback_data="dl_assets_parquet")])
         await update.message.reply_text(msg, parse_mode='HTML', reply_markup=InlineKeyboardMarkup(kb))
         return
 
@@ -1908,10 +1962,10 @@ async def cek_kuota(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         await update.message.reply_text(msg, parse_mode='HTML')
 
-async def download_asset_data(update, context):
+async def download_asset_data(update, context, fmt='xlsx'):
     query = update.callback_query
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     
     # 1. CEK OTORITAS
     is_admin = (user_id == ADMIN_ID) or (str(user_id) in ADMIN_IDS)
@@ -1919,6 +1973,7 @@ async def download_asset_data(update, context):
 
     if not (is_pic or is_admin): 
         return await query.answer("⛔ Akses Ditolak.", show_alert=True)
+    if fmt not in EXPORT_FORMATS: fmt = 'xlsx'
 
     # 2. DETEKSI LEASING & CABANG USER
     if is_admin: 
@@ -1946,10 +2001,12 @@ async def download_asset_data(update, context):
         parse_mode='HTML'
     )
     
+    loop = asyncio.get_running_loop()
+    # Path & sinyal batal dibuat di sini: file selalu bisa dihapus walau thread export kena timeout
+    path = os.path.join(tempfile.gettempdir(), f"temp_export_{user_id}_{int(time.time())}.{fmt}")
+    cancel = threading.Event()
     try:
-        def fetch_excel():
-            q = supabase.table('kendaraan').select('*')
-            
+        def apply_filters(q):
             # Filter Leasing (Wajib bagi Non-Admin)
             if not is_admin: 
                 q = q.eq('finance', leasing_filter)
@@ -1958,62 +2015,74 @@ async def download_asset_data(update, context):
                 # Jika BUKAN HO/Nasional, maka filter spesifik
                 if not IS_NASIONAL:
                     q = q.ilike('branch', f"%{user_branch}%")
+            return q
+
+        def report_progress(n):
+            # Dipanggil dari thread export: update pesan status tiap 20 ribu baris
+            if n % 20000 < EXPORT_PAGE_ROWS:
+                asyncio.run_coroutine_threadsafe(sts.edit_text(
+                    f"⏳ <b>MENGUNDUH DATABASE ASET</b>\n🏢 Leasing: {leasing_filter}\n"
+                    f"📍 Akses: <b>{branch_display}</b>\n📦 <i>{n:,} baris ditulis...</i>", parse_mode='HTML'), loop)
+
+        def fetch_export():
+            # Keyset pagination per nopol, ditulis langsung ke file (memori tetap datar)
+            pages = iter_keyset_pages(supabase, 'kendaraan', '*', apply_filters, key='nopol', page_size=EXPORT_PAGE_ROWS)
+            first = next(pages, None)
+            if not first: return 0
             
-            # Limit Aman
-            res = q.limit(100000).execute()
-            
-            if not res.data: return None
-            
-            df = pd.DataFrame(res.data)
-            
-            # Pilih Kolom
+            # Pilih Kolom (UNIT diambil dari 'type' jika kolom 'unit' tidak ada)
             cols = ['nopol', 'unit', 'finance', 'branch', 'tahun', 'warna', 'noka', 'nosin', 'ovd', 'nama_nasabah']
-            final_cols = [c for c in cols if c in df.columns]
-            df = df[final_cols]
+            if 'unit' not in first[0] and 'type' in first[0]: cols[1] = 'type'
+            final_cols = [c for c in cols if c in first[0]]
             
             # Rename Header
-            df.rename(columns={
-                'nopol': 'NOPOL', 'unit': 'UNIT', 'finance': 'LEASING', 
+            names = {
+                'nopol': 'NOPOL', 'unit': 'UNIT', 'type': 'UNIT', 'finance': 'LEASING', 
                 'branch': 'CABANG', 'tahun': 'TAHUN', 'warna': 'WARNA', 
                 'ovd': 'OVERDUE', 'nama_nasabah': 'NASABAH'
-            }, inplace=True)
+            }
+            headers = [names.get(c, c) for c in final_cols]
             
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Database Aset')
-                ws = writer.sheets['Database Aset']
-                header_fmt = writer.book.add_format({'bold': True, 'bg_color': '#D7E4BC', 'border': 1})
-                for col_num, value in enumerate(df.columns.values):
-                    ws.write(0, col_num, value, header_fmt)
-                ws.set_column('A:Z', 15) 
-
-            output.seek(0)
-            return output
+            return export_pages(itertools.chain([first], pages), path, final_cols, headers, fmt=fmt,
+                                sheet_name='Database Aset', on_progress=report_progress, cancel=cancel)
 
-        excel_file = await asyncio.to_thread(fetch_excel)
+        total = await DB.run(fetch_export, timeout=DB_TIMEOUT_LONG)
         
-        if not excel_file:
+        if not total:
             msg = f"⚠️ <b>DATABASE KOSONG.</b>\nTidak ada data aset untuk akses: {branch_display}."
             await sts.edit_text(msg, parse_mode='HTML')
             return
 
-        fname = f"DATABASE_{leasing_filter}_{user_branch}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        await context.bot.send_document(
-            chat_id=query.message.chat_id, 
-            document=excel_file, 
-            filename=fname, 
-            caption=f"📂 <b>DATABASE ASET SAYA</b>\n🏢 {leasing_filter}\n📍 {branch_display}"
-        )
+        if os.path.getsize(path) > TELEGRAM_FILE_LIMIT:
+            await sts.edit_text(f"⚠️ File terlalu besar untuk Telegram ({os.path.getsize(path) // (1024 * 1024)} MB, {total:,} baris).\nGunakan tombol <b>DOWNLOAD ASET (CSV.GZ)</b>.", parse_mode='HTML')
+            return
+
+        fname = f"DATABASE_{leasing_filter}_{user_branch}_{datetime.now().strftime('%Y%m%d')}.{fmt}"
+        with open(path, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=query.message.chat_id, 
+                document=f, 
+                filename=fname, 
+                caption=f"📂 <b>DATABASE ASET SAYA</b>\n🏢 {leasing_filter}\n📍 {branch_display}\n📦 {total:,} Unit",
+                parse_mode='HTML',
+                read_timeout=DB_TIMEOUT_LONG, write_timeout=DB_TIMEOUT_LONG
+            )
         await sts.delete()
 
     except Exception as e:
         logger.error(f"DL Asset Error: {e}")
         await sts.edit_text(f"❌ Error: {e}")
+    finally:
+        # Hentikan thread export (jika masih jalan setelah timeout) lalu hapus file
+        cancel.set()
+        if os.path.exists(path):
+            try: os.remove(path)
+            except: pass
 
 async def download_finding_report(update, context):
     query = update.callback_query
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     
     # 1. CEK OTORITAS
     is_admin = (user_id == ADMIN_ID) or (str(user_id) in ADMIN_IDS)
@@ -2041,153 +2110,107 @@ async def download_finding_report(update, context):
         query.message.chat_id, 
         f"⏳ <b>GENERATING REPORT: {display_name}</b>\n"
         f"📅 Periode: 1 {now.strftime('%B')} - {end_date_str}\n"
-        f"🔄 <i>Mengambil SEMUA data (Teknik Looping)...</i>", 
+        f"🔄 <i>Mengambil SEMUA data (Keyset Paralel)...</i>", 
         parse_mode='HTML'
     )
     
+    report_path = os.path.join(tempfile.gettempdir(), f"temp_report_{user_id}_{int(time.time())}.xlsx")
+    cancel = threading.Event()
     try:
-        def generate_report():
-            # --- STEP A: QUERY LOGS DENGAN LOOPING (PAGINATION) ---
-            all_logs = []
-            batch_size = 1000 # Tarik per 1000 baris
-            start_row = 0
+        def apply_filters(q):
+            if not is_admin: q = q.ilike('leasing', f"%{leasing_filter}%")
+            return q
+
+        def fetch_day(window):
+            # Satu irisan hari: keyset (created_at, id) terbaru -> terlama
+            since, until = window
+            rows = []
+            for page in iter_keyset_desc(supabase, 'finding_logs', '*', apply_filters, since=since, until=until):
+                rows.extend(page)
+            return rows
+
+        users_map = {}
+
+        def build_row(item):
+            # Format Waktu
+            raw_time = item.get('created_at', '')
+            try: 
+                dt_obj = datetime.fromisoformat(raw_time.replace('Z', '+00:00')).astimezone(TZ_JAKARTA)
+                tgl_temuan = dt_obj.strftime('%d/%m/%Y')
+                jam_temuan = dt_obj.strftime('%H:%M:%S')
+            except: 
+                tgl_temuan = raw_time
+                jam_temuan = ""
             
-            while True:
-                # 1. Bangun Query Dasar
-                q = supabase.table('finding_logs').select('*')
-                if not is_admin: q = q.ilike('leasing', f"%{leasing_filter}%")
-                q = q.gte('created_at', start_date.isoformat())
-                q = q.order('created_at', desc=True)
-                
-                # 2. Pakai Range untuk ambil batch tertentu
-                # (Misal: 0-999, lalu 1000-1999, dst)
-                res = q.range(start_row, start_row + batch_size - 1).execute()
-                data = res.data
-                
-                if not data:
-                    break # Stop jika data habis
-                
-                all_logs.extend(data) # Gabungkan ke list utama
-                
-                # Cek apakah data yg ditarik kurang dari batch (artinya ini halaman terakhir)
-                if len(data) < batch_size:
-                    break
-                    
-                start_row += batch_size # Lanjut ke halaman berikutnya
-                
-                # Safety Limit (Misal max 100rb baris biar gak crash memori)
-                if len(all_logs) >= 100000:
-                    break
-
-            if not all_logs: return None
-
-            # --- STEP B: AMBIL DATA PROFIL USER (BATCH LOOKUP) ---
-            # Kita juga harus batching lookup user-nya agar URL tidak kepanjangan error
-            all_user_ids = list(set([log['user_id'] for log in all_logs if log.get('user_id')]))
-            users_map = {}
+            # Profil User
+            uid_str = str(item.get('user_id', ''))
+            profile = users_map.get(uid_str, {})
             
-            # Pecah ID user jadi chunk kecil (misal per 100 ID)
-            chunk_size = 100
-            for i in range(0, len(all_user_ids), chunk_size):
-                chunk_ids = all_user_ids[i:i + chunk_size]
-                try:
-                    res_users = supabase.table('users')\
-                        .select('user_id, nama_lengkap, alamat, agency, no_hp')\
-                        .in_('user_id', chunk_ids)\
-                        .execute()
-                    for usr in res_users.data:
-                        users_map[str(usr['user_id'])] = usr
-                except Exception as e:
-                    logger.error(f"Error fetching user chunk: {e}")
-
-            # --- STEP C: MAPPING DATA ---
-            report_data = []
-            for item in all_logs:
-                # Format Waktu
-                raw_time = item.get('created_at', '')
-                try: 
-                    dt_obj = datetime.fromisoformat(raw_time.replace('Z', '+00:00')).astimezone(TZ_JAKARTA)
-                    tgl_temuan = dt_obj.strftime('%d/%m/%Y')
-                    jam_temuan = dt_obj.strftime('%H:%M:%S')
-                except: 
-                    tgl_temuan = raw_time
-                    jam_temuan = ""
-                
-                # Profil User
-                uid_str = str(item.get('user_id', ''))
-                profile = users_map.get(uid_str, {})
-                
-                # Logic Fallback Data
-                # 1. Nama
-                finder_name = item.get('nama_matel')
-                if not finder_name or finder_name in ['-', '']:
-                    finder_name = profile.get('nama_lengkap', 'Unknown User')
-                
-                # 2. Lokasi (Alamat)
-                lokasi = profile.get('alamat', '-')
-                    
-                # 3. Agency
-                pt_matel = item.get('nama_pt')
-                if not pt_matel or pt_matel in ['-', '']:
-                    pt_matel = profile.get('agency', '-')
-
-                # 4. No HP
-                hp = item.get('no_hp')
-                if not hp or hp in ['-', '']:
-                    hp = profile.get('no_hp', '-')
-
-                report_data.append({
-                    'TANGGAL': tgl_temuan,
-                    'JAM': jam_temuan,
-                    'NOPOL': item.get('nopol', '-'),
-                    'UNIT / TIPE': item.get('unit', '-'),
-                    'LEASING': item.get('leasing', '-'),
-                    'NAMA PENEMU': finder_name,
-                    'NO HP MATEL': hp,
-                    'AGENCY / PT MATEL': pt_matel,
-                    'LOKASI / DOMISILI': lokasi,
-                    'INPUT PENCARIAN': item.get('query_text', '-') # Tambahan info
-                })
-
-            # --- STEP D: BUAT EXCEL ---
-            df = pd.DataFrame(report_data)
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name='Laporan Temuan')
-                ws = writer.sheets['Laporan Temuan']
-                
-                # Style Header
-                format_header = writer.book.add_format({'bold': True, 'bg_color': '#D7E4BC', 'border': 1})
-                for col_num, value in enumerate(df.columns.values):
-                    ws.write(0, col_num, value, format_header)
+            # Logic Fallback Data
+            # 1. Nama
+            finder_name = item.get('nama_matel')
+            if not finder_name or finder_name in ['-', '']:
+                finder_name = profile.get('nama_lengkap', 'Unknown User')
+            
+            # 2. Lokasi (Alamat)
+            lokasi = profile.get('alamat', '-')
                 
-                # Lebar Kolom
-                ws.set_column('A:A', 12) 
-                ws.set_column('B:B', 10) 
-                ws.set_column('C:C', 12) 
-                ws.set_column('D:D', 25) 
-                ws.set_column('E:E', 15) 
-                ws.set_column('F:F', 25) 
-                ws.set_column('G:G', 15) 
-                ws.set_column('H:H', 25) 
-                ws.set_column('I:I', 35) 
-                ws.set_column('J:J', 15)
+            # 3. Agency
+            pt_matel = item.get('nama_pt')
+            if not pt_matel or pt_matel in ['-', '']:
+                pt_matel = profile.get('agency', '-')
+
+            # 4. No HP
+            hp = item.get('no_hp')
+            if not hp or hp in ['-', '']:
+                hp = profile.get('no_hp', '-')
+
+            return {
+                'TANGGAL': tgl_temuan,
+                'JAM': jam_temuan,
+                'NOPOL': item.get('nopol', '-'),
+                'UNIT / TIPE': item.get('unit', '-'),
+                'LEASING': item.get('leasing', '-'),
+                'NAMA PENEMU': finder_name,
+                'NO HP MATEL': hp,
+                'AGENCY / PT MATEL': pt_matel,
+                'LOKASI / DOMISILI': lokasi,
+                'INPUT PENCARIAN': item.get('query_text', '-') # Tambahan info
+            }
 
-            output.seek(0)
-            return output
+        def report_pages():
+            # --- STEP A: LOG PER HARI, BEBERAPA HARI DIAMBIL PARALEL (URUTAN TETAP TERBARU DULU) ---
+            for day_rows in map_ordered(fetch_day, time_slices(start_date, now + timedelta(seconds=1))):
+                if not day_rows: continue
+                # --- STEP B: PROFIL USER YANG BELUM DIKENAL (CHUNK 100 ID, PARALEL) ---
+                new_ids = {str(r['user_id']) for r in day_rows if r.get('user_id')} - users_map.keys()
+                if new_ids:
+                    try: users_map.update(fetch_rows_by_ids(supabase, 'users', 'user_id, nama_lengkap, alamat, agency, no_hp', new_ids))
+                    except Exception as e: logger.error(f"Error fetching user chunk: {e}")
+                # --- STEP C: MAPPING DATA ---
+                yield [build_row(item) for item in day_rows]
 
-        excel_file = await asyncio.to_thread(generate_report)
+        def generate_report():
+            # --- STEP D: TULIS EXCEL SECARA STREAMING (CONSTANT MEMORY) ---
+            columns = ['TANGGAL', 'JAM', 'NOPOL', 'UNIT / TIPE', 'LEASING', 'NAMA PENEMU',
+                       'NO HP MATEL', 'AGENCY / PT MATEL', 'LOKASI / DOMISILI', 'INPUT PENCARIAN']
+            return export_pages(report_pages(), report_path, columns, fmt='xlsx', sheet_name='Laporan Temuan',
+                                widths=[12, 10, 12, 25, 15, 25, 15, 25, 35, 15], cancel=cancel)
+
+        total = await DB.run(generate_report, timeout=DB_TIMEOUT_LONG)
         
-        if not excel_file:
-            await sts.edit_text(f"⚠️ <b>DATA KOSONG.</b>")
+        if not total:
+            await sts.edit_text(f"⚠️ <b>DATA KOSONG.</b>", parse_mode='HTML')
             return
             
         # --- CATAT AUDIT (UU PDP COMPLIANCE) ---
         # Kita hapus len(all_logs) agar tidak memicu error variable undefined
-        catat_audit(
+        await DB.run(
+            catat_audit,
             user_id=user_id, 
             action="DOWNLOAD_FINDING_REPORT", 
-            details=f"Pimpinan mengunduh laporan temuan bulanan ({leasing_filter})."
+            details=f"Pimpinan mengunduh laporan temuan bulanan ({leasing_filter}).",
+            user=u
         )
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M')
@@ -2196,26 +2219,35 @@ async def download_finding_report(update, context):
             f"📈 <b>LAPORAN KINERJA BULANAN</b>\n"
             f"🏢 User: {leasing_filter}\n"
             f"📅 Periode: 1 - {end_date_str}\n"
-            f"📊 Status: FULL DATA (Looping Mode)"
+            f"📊 Status: FULL DATA (Keyset Streaming)"
         )
         
-        await context.bot.send_document(
-            chat_id=query.message.chat_id, 
-            document=excel_file, 
-            filename=fname, 
-            caption=caption
-        )
+        with open(report_path, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=query.message.chat_id, 
+                document=f, 
+                filename=fname, 
+                caption=caption,
+                parse_mode='HTML',
+                read_timeout=DB_TIMEOUT_LONG, write_timeout=DB_TIMEOUT_LONG
+            )
         await sts.delete()
         
     except Exception as e:
         logger.error(f"DL Report Err: {e}")
         try: await sts.edit_text(f"❌ Error: {e}")
         except: pass
+    finally:
+        # Hentikan thread laporan (jika masih jalan setelah timeout) lalu hapus file
+        cancel.set()
+        if os.path.exists(report_path):
+            try: os.remove(report_path)
+            except: pass
 
 async def download_korlap_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     
     if u.get('role') != 'korlap':
         return await query.answer("⛔ Anda bukan Korlap.", show_alert=True)
@@ -2271,17 +2303,19 @@ async def download_korlap_report(update: Update, context: ContextTypes.DEFAULT_T
             output.seek(0)
             return output
 
-        excel_file = await asyncio.to_thread(fetch_report)
+        excel_file = await DB.run(fetch_report, timeout=DB_TIMEOUT_LONG)
         
         if not excel_file:
             await sts.edit_text("⚠️ <b>DATA KOSONG</b>\nTim Anda belum mendapatkan unit bulan ini.")
             return
 
         # --- CATAT AUDIT (UU PDP COMPLIANCE) ---
-        catat_audit(
+        await DB.run(
+            catat_audit,
             user_id=user_id, 
             action="DOWNLOAD_KORLAP_REPORT", 
-            details=f"Korlap mengunduh rekap kinerja tim agency: {u.get('agency')}."
+            details=f"Korlap mengunduh rekap kinerja tim agency: {u.get('agency')}.",
+            user=u
         )
 
         fname = f"LAPORAN_TIM_{my_agency.replace(' ','_')}_{datetime.now().strftime('%b%Y')}.xlsx"
@@ -2302,7 +2336,7 @@ async def download_korlap_report(update: Update, context: ContextTypes.DEFAULT_T
 # ==============================================================================
 async def rekap_anggota_korlap(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
 
     # 1. Validasi Keamanan (Hanya Korlap)
     if not u or u.get('role') != 'korlap':
@@ -2318,10 +2352,9 @@ async def rekap_anggota_korlap(update: Update, context: ContextTypes.DEFAULT_TYP
     try:
         # 2. Query Database (AMBIL SEMUA MATEL DULU)
         # Kita tarik semua user non-PIC agar bisa kita filter sendiri pakai Python (Fuzzy Logic)
-        res = supabase.table('users').select('*')\
+        res = await DB.execute(supabase_bulk.table('users').select('*')\
             .neq('role', 'pic')\
-            .neq('role', 'admin')\
-            .execute()
+            .neq('role', 'admin'), timeout=DB_TIMEOUT_LONG)
 
         all_matels = res.data
         if not all_matels:
@@ -2523,7 +2556,7 @@ async def handle_photo_topup(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # 3. Cek User di Database
     uid = update.effective_user.id
-    u = get_user(uid)
+    u = await get_user_async(uid)
     if not u:
         await msg_wait.edit_text("⚠️ **User Tidak Terdaftar.**\nKetik /start untuk register.")
         return ConversationHandler.END
@@ -2685,7 +2718,7 @@ async def notify_hit_to_group(context, u, d):
         if LOG_GROUP_ID == 0: return
         msg = create_notification_text(u, d, "🚨 <b>UNIT DITEMUKAN! (LOG PUSAT)</b>")
         kb = get_action_buttons(u, d) # Pakai Helper Baru
-        await context.bot.send_message(LOG_GROUP_ID, msg, reply_markup=kb, parse_mode='HTML')
+        NOTIFIER.send(LOG_GROUP_ID, msg, reply_markup=kb, parse_mode='HTML')
     except Exception as e: print(f"❌ Gagal Kirim Notif Admin Pusat: {e}")
 
 # 2. NOTIFIKASI KE GROUP LEASING (PIC)
@@ -2693,13 +2726,8 @@ async def notify_leasing_group(context, matel_user, unit_data):
     leasing_unit = str(unit_data.get('finance', '')).strip().upper()
     if len(leasing_unit) < 3: return
     try:
-        res = supabase.table('leasing_groups').select("*").execute()
-        groups = res.data
-        target_group_ids = []
-        for g in groups:
-            g_name = str(g['leasing_name']).upper()
-            if g_name in leasing_unit or leasing_unit in g_name:
-                target_group_ids.append(g['group_id'])
+        if GROUP_ROUTER.stale(): await DB.run(GROUP_ROUTER.refresh)
+        target_group_ids = GROUP_ROUTER.leasing_targets(leasing_unit)
         if not target_group_ids: return
         
         msg = create_notification_text(matel_user, unit_data, "🚨 <b>UNIT DITEMUKAN! (HIT LEASING)</b>")
@@ -2707,8 +2735,7 @@ async def notify_leasing_group(context, matel_user, unit_data):
         
         for gid in target_group_ids:
             if int(gid) == int(LOG_GROUP_ID): continue 
-            try: await context.bot.send_message(gid, msg, reply_markup=kb, parse_mode='HTML')
-            except: pass
+            NOTIFIER.send(gid, msg, reply_markup=kb, parse_mode='HTML')
     except Exception as e: logger.error(f"Error Notify Leasing: {e}")
 
 # 3. NOTIFIKASI KE GROUP AGENCY (MONITORING)
@@ -2716,17 +2743,8 @@ async def notify_agency_group(context, matel_user, unit_data):
     user_agency = str(matel_user.get('agency', '')).strip().upper()
     if len(user_agency) < 3: return
     try:
-        res = supabase.table('agency_groups').select("*").execute()
-        groups = res.data
-        target_group_ids = []
-        for g in groups:
-            g_name = str(g['agency_name']).upper()
-            is_match = g_name in user_agency or user_agency in g_name
-            if not is_match:
-                similarity = difflib.SequenceMatcher(None, g_name, user_agency).ratio()
-                if similarity > 0.8: is_match = True
-            if is_match:
-                target_group_ids.append(g['group_id'])
+        if GROUP_ROUTER.stale(): await DB.run(GROUP_ROUTER.refresh)
+        target_group_ids = GROUP_ROUTER.agency_targets(user_agency)
         if not target_group_ids: return
         
         msg = create_notification_text(matel_user, unit_data, f"👮‍♂️ <b>LAPORAN ANGGOTA ({user_agency})</b>")
@@ -2734,10 +2752,18 @@ async def notify_agency_group(context, matel_user, unit_data):
         
         for gid in target_group_ids:
             if int(gid) == int(LOG_GROUP_ID): continue
-            try: await context.bot.send_message(gid, msg, reply_markup=kb, parse_mode='HTML')
-            except: pass
+            NOTIFIER.send(gid, msg, reply_markup=kb, parse_mode='HTML')
     except Exception as e: logger.error(f"Error Notify Agency: {e}")
 
+# 4. FAN-OUT SEMUA NOTIFIKASI HIT (DIJALANKAN DI BACKGROUND, TIDAK DITUNGGU HANDLER)
+async def dispatch_hit_notifications(context, matel_user, unit_data):
+    await asyncio.gather(
+        notify_hit_to_group(context, matel_user, unit_data),
+        notify_leasing_group(context, matel_user, unit_data),
+        notify_agency_group(context, matel_user, unit_data),
+        return_exceptions=True
+    )
+
 # [V5.5] REGISTER LEASING GROUP
 async def set_leasing_group(update, context):
     if update.effective_user.id != ADMIN_ID: return
@@ -2748,8 +2774,9 @@ async def set_leasing_group(update, context):
     leasing_name = " ".join(context.args).upper()
     chat_id = update.effective_chat.id
     try:
-        supabase.table('leasing_groups').delete().eq('group_id', chat_id).execute()
-        supabase.table('leasing_groups').insert({"group_id": chat_id, "leasing_name": leasing_name}).execute()
+        await DB.execute(supabase.table('leasing_groups').delete().eq('group_id', chat_id))
+        await DB.execute(supabase.table('leasing_groups').insert({"group_id": chat_id, "leasing_name": leasing_name}))
+        await DB.run(GROUP_ROUTER.refresh)
         await update.message.reply_text(f"✅ <b>GRUP TERDAFTAR!</b>\n\nGrup ini sekarang adalah <b>OFFICIAL ALERT GROUP</b> untuk: <b>{leasing_name}</b>.\nSetiap unit '{leasing_name}' ditemukan, notifikasi akan masuk ke sini.", parse_mode='HTML')
     except Exception as e:
         await update.message.reply_text(f"❌ Gagal set grup: {e}")
@@ -2764,8 +2791,9 @@ async def set_agency_group(update, context):
     agency_name = " ".join(context.args).upper()
     chat_id = update.effective_chat.id
     try:
-        supabase.table('agency_groups').delete().eq('group_id', chat_id).execute()
-        supabase.table('agency_groups').insert({"group_id": chat_id, "agency_name": agency_name}).execute()
+        await DB.execute(supabase.table('agency_groups').delete().eq('group_id', chat_id))
+        await DB.execute(supabase.table('agency_groups').insert({"group_id": chat_id, "agency_name": agency_name}))
+        await DB.run(GROUP_ROUTER.refresh)
         await update.message.reply_text(f"✅ <b>AGENCY TERDAFTAR!</b>\n\nGrup ini sekarang adalah <b>MONITORING ROOM</b> untuk: <b>{agency_name}</b>.\nSetiap Matel dari PT ini menemukan unit, notifikasi masuk sini.", parse_mode='HTML')
     except Exception as e:
         await update.message.reply_text(f"❌ Gagal set grup: {e}")
@@ -2780,8 +2808,8 @@ BACKGROUND_TASKS = set()
 async def run_background_upload(app, chat_id, user_id, message_id, data_ctx):
     """
     Versi UPDATE v2.2 (Integrated): 
-    - Batch Size 200 (Aman untuk Supabase)
-    - Retry Logic 5x (Tahan banting koneksi)
+    - Baca file bertahap (streaming per potongan)
+    - Batch paralel & adaptif via UpsertExecutor (mulai 200, retry 5x backoff + jitter)
     - Auto Month Code (0226)
     - [NEW] Auto Log ke Tabel Riwayat Harian
     """
@@ -2819,99 +2847,64 @@ async def run_background_upload(app, chat_id, user_id, message_id, data_ctx):
             await send_update("❌ Error: File hilang dari server.")
             return
 
-        print("📂 [BG] Membaca File...")
-        with open(path, 'rb') as fr: content = fr.read()
-        
-        # Gunakan read_file_robust yang sudah support TOPAZ/ZIP
-        df = read_file_robust(content, path)
-        df = fix_header_position(df)
-        df, _ = smart_rename_columns(df)
-        
-        # Standarisasi Leasing
+        print("📂 [BG] Membaca File (Streaming)...")
         target = data_ctx.get('target_leasing')
-        if target and target != 'SKIP':
-            df['finance'] = standardize_leasing_name(target)
-        else:
-            if 'finance' in df.columns: df['finance'] = df['finance'].apply(standardize_leasing_name)
-            else: df['finance'] = 'UNKNOWN'
 
-        # Bersihkan Nopol
-        df['nopol'] = df['nopol'].astype(str).str.replace(r'[^a-zA-Z0-9]', '', regex=True).str.upper()
-        df = df.dropna(subset=['nopol'])
-        df = df[df['nopol'].str.len() > 2]
-        df = df.drop_duplicates(subset=['nopol'], keep='last')
-        
-        # Pastikan Kolom Lengkap
-        for c in VALID_DB_COLUMNS:
-            if c not in df.columns: df[c] = None
-            
-        # Masukkan Kode Bulan
-        df['data_month'] = code_version
-        
-        df = df.replace({np.nan: None})
-        
-        # Siapkan Data untuk Insert
-        cols_to_use = VALID_DB_COLUMNS + ['data_month']
-        recs = json.loads(json.dumps(df[cols_to_use].to_dict('records'), default=str))
-        
-        total_data = len(recs)
-        print(f"✅ [BG] Total Data: {total_data} (Versi: {code_version})")
-
-        if total_data == 0:
-            await send_update("⚠️ <b>FILE KOSONG / TIDAK VALID SETELAH FILTER.</b>")
-            if os.path.exists(path): os.remove(path)
-            return
+        def iter_records():
+            frames = iter_upload_frames(path)
+            try:
+                for chunk in frames:
+                    recs = prepare_upload_records(chunk, target, code_version)
+                    if recs: yield recs
+            finally:
+                frames.close()   # Tutup workbook / handle CSV walau upload berhenti di tengah
+        chunks = iter_records()
 
         # --- C. UPLOAD BATCH (BAGIAN KRUSIAL) ---
-        # Kita set 200 agar database tidak timeout (Error 57014)
-        BATCH_SIZE = 200 
+        # Batch dikirim paralel oleh UpsertExecutor. Ukuran batch mulai 200 lalu
+        # menyesuaikan latensi DB, dan otomatis mengecil jika kena timeout (57014).
+        executor = UpsertExecutor(supabase_bulk, on_batch=sync_plate_index_batch)
+        finance_filter = standardize_leasing_name(target) if (mode == 'DELETE' and target and target != 'SKIP') else None
         
-        suc = 0; fail = 0; start_time = time.time()
+        total_data = 0; suc = 0; fail = 0; start_time = time.time()
         leasing_info = clean_text(data_ctx.get('target_leasing') or 'MIX')
         action_txt = "MENGHAPUS" if mode == 'DELETE' else "MENGUPDATE"
 
         await send_update(
             f"🔄 <b>SEDANG MEMPROSES...</b>\n"
-            f"📂 Total: {total_data:,} Data\n"
             f"🗓️ <b>Versi Data: {code_version}</b>\n"
             f"📝 Mode: {action_txt}\n\n"
-            f"<i>Bot sedang bekerja... (Estimasi: {int(total_data/BATCH_SIZE*1.5)} detik)</i>"
+            f"<i>Bot sedang bekerja... (File dibaca & dikirim bertahap per {UPLOAD_CHUNK_ROWS:,} baris)</i>"
         )
 
-        for i in range(0, total_data, BATCH_SIZE):
-            await asyncio.sleep(0.01) # Jeda nafas CPU
-            batch = recs[i:i+BATCH_SIZE]
-            
-            # --- RETRY LOGIC (JARING PENGAMAN) ---
-            # Jika gagal, coba lagi sampai 5 kali
-            batch_success = False
-            for attempt in range(5):
-                try:
-                    if mode == 'DELETE':
-                        nopols = [d['nopol'] for d in batch]
-                        q = supabase.table('kendaraan').delete().in_('nopol', nopols)
-                        if target and target != 'SKIP':
-                            q = q.eq('finance', standardize_leasing_name(target))
-                        q.execute()
-                    else:
-                        # Upsert Data
-                        supabase.table('kendaraan').upsert(batch, on_conflict='nopol').execute()
-                    
-                    suc += len(batch)
-                    batch_success = True
-                    break # Berhasil! Keluar dari loop retry
+        # Potongan berikutnya di-parse di thread lain selagi potongan sekarang dikirim
+        next_chunk = asyncio.create_task(asyncio.to_thread(next, chunks, None))
+        try:
+            while True:
+                recs = await next_chunk
+                if recs is None: break
+                next_chunk = asyncio.create_task(asyncio.to_thread(next, chunks, None))
+                total_data += len(recs)
+
+                hasil = await asyncio.to_thread(executor.run, recs, mode, finance_filter)
+                suc += hasil['success']; fail += hasil['fail']
                 
-                except Exception as e:
-                    # Gagal? Tunggu sebentar lalu coba lagi
-                    await asyncio.sleep((attempt + 1) * 2)
-                    if attempt == 4: # Jika sudah 5x tetap gagal
-                        print(f"⚠️ Batch Gagal: {e}")
-            
-            if not batch_success:
-                fail += len(batch)
-            
-            # Update Log di Console
-            if i % 2000 == 0: print(f"⏳ [BG] Progress: {i}/{total_data}")
+                # Update Log di Console
+                print(f"⏳ [BG] Progress: {total_data:,} baris ({hasil['duration']:.1f} dtk, batch {hasil['batch_size']})")
+        finally:
+            # Error / cancel: tunggu prefetch yang masih jalan (generator tidak bisa ditutup
+            # saat sedang dieksekusi thread lain), lalu tutup generator & file upload
+            if not next_chunk.done():
+                try: await asyncio.shield(next_chunk)
+                except BaseException: pass
+            try: await asyncio.to_thread(chunks.close)
+            except Exception as e: print(f"⚠️ Gagal menutup file upload: {e}")
+
+        if executor.last_error: print(f"⚠️ Batch Gagal: {executor.last_error}")
+
+        if total_data == 0:
+            await send_update("⚠️ <b>FILE KOSONG / TIDAK VALID SETELAH FILTER.</b>")
+            return
 
         # --- D. LAPORAN SELESAI ---
         duration = int(time.time() - start_time)
@@ -2927,7 +2920,7 @@ async def run_background_upload(app, chat_id, user_id, message_id, data_ctx):
             f"Data <b>{leasing_info}</b> telah terupdate."
         )
         await send_update(final_rpt)
-        print(f"🏁 [BG] Done. Suc: {suc}")
+        print(f"🏁 [BG] Done. Suc: {suc} | Batch: {executor.summary()}")
 
         # --- [INTEGRASI LOG HARIAN] ---
         # Bagian ini yang kita tambahkan agar tercatat di Laporan Pagi
@@ -2938,6 +2931,7 @@ async def run_background_upload(app, chat_id, user_id, message_id, data_ctx):
                     leasing=leasing_info, 
                     jumlah=suc
                 )
+                await DB.run(flush_log_kendaraan)
             except Exception as log_err:
                 print(f"⚠️ Gagal Catat Log Harian: {log_err}")
         # ------------------------------
@@ -2975,7 +2969,7 @@ async def upload_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # 3. CEK USER
     uid = update.effective_user.id
-    u = get_user(uid)
+    u = await get_user_async(uid)
     if not u or u['status'] != 'active': 
         await status_msg.edit_text("⛔ Akses Ditolak. Akun tidak aktif.")
         return ConversationHandler.END
@@ -3002,30 +2996,36 @@ async def upload_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if is_admin:
         try:
-            # Download dan Baca File
+            # Download File
             path = f"temp_{uid}_{int(time.time())}_{fname}"
             f = await update.message.document.get_file()
             await f.download_to_drive(path)
             
-            with open(path, 'rb') as fr: content = fr.read()
-            df = read_file_robust(content, path)
-            df = fix_header_position(df)
-            df, found = smart_rename_columns(df)
+            # Analisa di process pool: hanya baca N baris awal untuk header & contoh data
+            await status_msg.edit_text("⏳ **Menganalisa File...**\n🔍 Membaca header kolom...", parse_mode='Markdown')
+            info = await run_parse_job(analyze_upload_preview, path)
             
             # Validasi Kolom NOPOL
-            if 'nopol' not in df.columns: 
+            if 'nopol' not in info['cols']: 
                 if os.path.exists(path): os.remove(path)
                 await status_msg.edit_text("❌ **ERROR:** Kolom NOPOL tidak ditemukan dalam file.")
                 return ConversationHandler.END
             
+            # Hitung total baris tanpa membangun DataFrame penuh
+            await status_msg.edit_text(f"⏳ **Menganalisa File...**\n✅ Kolom: {', '.join(info['found'])}\n🔢 Menghitung total baris...", parse_mode='Markdown')
+            total_rows = max(0, await run_parse_job(count_file_rows, path) - info['header_at'] - 1)
+            
             # Simpan Data Sementara
             context.user_data['upload_path'] = path
-            context.user_data['preview'] = df.head(1).to_dict('records')
-            context.user_data['cols'] = df.columns.tolist()
+            context.user_data['preview'] = info['preview']
+            context.user_data['cols'] = info['cols']
+            
+            d = info.get('dialect')
+            fmt_txt = f"Format: CSV (sep {d['sep']!r}, {d['encoding']})\n" if d else ""
             
             await status_msg.delete()
             await update.message.reply_text(
-                f"✅ **SCAN OK**\nCols: {', '.join(found)}\nTotal Baris: {len(df):,}\n\n👉 **Masukkan Nama Leasing** (atau pilih SKIP):", 
+                f"✅ **SCAN OK**\n{fmt_txt}Cols: {', '.join(info['found'])}\nTotal Baris: ±{total_rows:,}\n\n👉 **Masukkan Nama Leasing** (atau pilih SKIP):", 
                 reply_markup=ReplyKeyboardMarkup([["SKIP"], ["❌ BATAL"]], resize_keyboard=True)
             )
             return U_LEASING_ADMIN
@@ -3146,7 +3146,7 @@ async def upload_leasing_user(update, context):
     
     # 1. Definisikan user_id terlebih dahulu
     user_id = update.effective_user.id
-    u = get_user(user_id)
+    u = await get_user_async(user_id)
     file_id = context.user_data.get('upload_file_id')
     
     # 2. EKSTRAKSI DATA DARI VARIABEL 'u' (Ini yang hilang di kode Anda)
@@ -3222,7 +3222,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ==============================================================================
 
 async def register_start(update, context):
-    if get_user(update.effective_user.id): return await update.message.reply_text("✅ Anda sudah terdaftar.")
+    if await get_user_async(update.effective_user.id): return await update.message.reply_text("✅ Anda sudah terdaftar.")
     msg = ("🤖 **ONEASPAL REGISTRATION**\n\nSilakan pilih **Jalur Profesi** Anda:\n\n1️⃣ **MITRA LAPANGAN (MATEL)**\n_(Untuk Profcoll & Jasa Pengamanan Aset)_\n\n2️⃣ **PIC LEASING (INTERNAL)**\n_(Khusus Staff Internal Leasing/Finance)_")
     kb = [["1️⃣ MITRA LAPANGAN"], ["2️⃣ PIC LEASING"], ["❌ BATAL"]]
     await update.message.reply_text(msg, parse_mode='Markdown', reply_markup=ReplyKeyboardMarkup(kb, one_time_keyboard=True)); return R_ROLE_CHOICE
@@ -3297,7 +3297,7 @@ async def register_agency(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if role == 'matel':
         # Cari tebakan terbaik dari database
-        suggested = find_best_match_agency(raw_text)
+        suggested = await DB.run(find_best_match_agency, raw_text)
         
         # --- LOGIKA REM 80% (THE GATEKEEPER) ---
         if suggested:
@@ -3487,7 +3487,8 @@ async def register_confirm(update, context):
     
     try:
         # 1. Simpan ke Database
-        supabase.table('users').insert(data_user).execute()
+        await DB.execute(supabase.table('users').insert(data_user))
+        invalidate_user(data_user['user_id'])
         
         # 2. Tentukan Siapa yang Harus Meng-Approve
         approver_list = [] 
@@ -3496,7 +3497,7 @@ async def register_confirm(update, context):
         # Jika pendaftar adalah MATEL, cek apakah ada KORLAP di agency tersebut?
         if role_db == 'matel':
             # Pastikan fungsi helper ini ada di atas
-            korlap_data = get_korlaps_by_agency(d['r_agency'])
+            korlap_data = await DB.run(get_korlaps_by_agency, d['r_agency'])
             if korlap_data:
                 approver_list = [k['user_id'] for k in korlap_data]
                 is_routed_to_korlap = True
@@ -3572,7 +3573,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # 1. Cek User di Database
-        data = supabase.table("users").select("*").eq("user_id", user.id).execute()
+        data = await DB.execute(supabase.table("users").select("*").eq("user_id", user.id))
         
         # === SKENARIO 1: USER BARU (BELUM TERDAFTAR) ===
         if not data.data:
@@ -3669,7 +3670,7 @@ async def panduan(update, context):
     - Mitra: Tetap standar operasional lapangan.
     """
     user = update.effective_user
-    u = get_user(user.id)
+    u = await get_user_async(user.id)
     
     # === 1. PANDUAN PIC LEASING (LENGKAP & SOLID) ===
     if u and u.get('role') == 'pic': 
@@ -3772,11 +3773,12 @@ async def handle_message(update, context):
     if text == "🔄 SINKRONISASI DATA": return await upload_start(update, context)
     if text == "📂 DATABASE SAYA": return await cek_kuota(update, context)
     
-    u = get_user(update.effective_user.id)
+    u = await get_user_async(update.effective_user.id)
     if not u: return await update.message.reply_text("⛔ **AKSES DITOLAK**\nSilakan ketik /register.", parse_mode='Markdown')
     if u['status'] != 'active': return await update.message.reply_text("⏳ **AKUN PENDING**\nTunggu Admin.", parse_mode='Markdown')
     
-    is_active, reason = check_subscription_access(u)
+    try: is_active, reason = await DB.run(check_subscription_access, u)
+    except Exception: is_active, reason = False, "ERROR"
     if not is_active:
         if reason == "EXPIRED": return await update.message.reply_text("⛔ **MASA AKTIF HABIS**\nSilakan ketik /infobayar untuk perpanjang.", parse_mode='Markdown')
         elif reason == "DAILY_LIMIT": return await update.message.reply_text("⛔ **BATAS HARIAN TERCAPAI**\nAnda telah mencapai limit cek hari ini. Reset otomatis jam 00:00.", parse_mode='Markdown')
@@ -3785,22 +3787,43 @@ async def handle_message(update, context):
     kw = re.sub(r'[^a-zA-Z0-9]', '', text.upper())
     if len(kw) < 3: return await update.message.reply_text("⚠️ Minimal 3 karakter.")
     
+    # Keyword yang sama barusan tidak ditemukan & belum ada data baru -> jawab langsung
+    if MISS_CACHE.get(kw) == DATA_GENERATION:
+        return await update.message.reply_text(f"❌ <b>TIDAK DITEMUKAN</b>\n<code>{kw}</code>", parse_mode='HTML')
+    
     try:
         # === [OPERASI BYPASS ASYNCIO] ===
         # Kita bungkus tugas berat pencarian database ke dalam fungsi terpisah
         def cari_kendaraan_db():
-            return supabase.table('kendaraan').select("*").or_(f"nopol.ilike.%{kw}%,noka.eq.{kw},nosin.eq.{kw}").limit(20).execute()
+            # Jalur cepat: index di memori menjawab kunci, DB hanya ambil baris detail
+            if PLATE_INDEX and PLATE_INDEX.ready:
+                nopols = PLATE_INDEX.search(kw, limit=20)
+                if not nopols: return []
+                rows = supabase.table('kendaraan').select("*").in_('nopol', nopols).execute().data
+                # IN (...) tidak menjaga urutan: kembalikan ke urutan index (exact dulu)
+                rank = {n: i for i, n in enumerate(nopols)}
+                return sorted(rows, key=lambda r: rank.get(r.get('nopol'), len(rank)))
+            if SEARCH_RPC["available"]:
+                try: return supabase.rpc('search_kendaraan', {"kw": kw, "max_rows": 20}).execute().data
+                except Exception as e:
+                    if not is_rpc_missing(e): raise
+                    SEARCH_RPC["available"] = False
+                    logger.error(f"RPC search_kendaraan belum terpasang, kembali ke ilike: {e}")
+            return supabase.table('kendaraan').select("*").or_(f"nopol.ilike.%{kw}%,noka.eq.{kw},nosin.eq.{kw}").limit(20).execute().data
         
         # Eksekusi pencarian di "jalur/thread lain" agar bot tetap bisa bernapas
-        res = await asyncio.to_thread(cari_kendaraan_db)
+        generation = DATA_GENERATION
+        data_found = await DB.run(cari_kendaraan_db)
         # ================================
         
-        data_found = res.data
-        if not data_found: return await update.message.reply_text(f"❌ <b>TIDAK DITEMUKAN</b>\n<code>{kw}</code>", parse_mode='HTML')
+        if not data_found:
+            MISS_CACHE.set(kw, generation)
+            return await update.message.reply_text(f"❌ <b>TIDAK DITEMUKAN</b>\n<code>{kw}</code>", parse_mode='HTML')
+        HOT_ROWS.put(update.effective_chat.id, data_found, generation)
         
         final_result = None; exact_match = False
         for item in data_found:
-            clean_db_nopol = re.sub(r'[^a-zA-Z0-9]', '', item['nopol']).upper()
+            clean_db_nopol = item.get('nopol_norm') or re.sub(r'[^a-zA-Z0-9]', '', item['nopol']).upper()
             if clean_db_nopol == kw: final_result = item; exact_match = True; break
             
         # [UPDATE v10.9: LOGIKA WAJIB KONFIRMASI (ANTI FALSE-POSITIVE)]
@@ -3817,6 +3840,11 @@ async def handle_message(update, context):
         await update.message.reply_text("❌ Error DB.")
 
 async def show_unit_detail_original(update, context, d, u):
+    # --- KUOTA: reset, cek limit & increment atomik (satu RPC) ---
+    allowed, _ = await DB.run(consume_daily_quota, u)
+    if not allowed:
+        return await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ **BATAS HARIAN TERCAPAI**\nAnda telah mencapai limit cek hari ini. Reset otomatis jam 00:00.", parse_mode='Markdown')
+
     # --- LOGIKA CERDAS: DETEKSI VERSI DATA ---
     version_code = d.get('data_month')
     
@@ -3893,11 +3921,12 @@ async def show_unit_detail_original(update, context, d, u):
         parse_mode='HTML'
     )
     
-    await notify_hit_to_group(context, u, d)
-    await notify_leasing_group(context, u, d)
-    await notify_agency_group(context, u, d)
-    increment_daily_usage(u['user_id'], u.get('daily_usage', 0))
-    log_successful_hit(u, d)
+    task = asyncio.create_task(dispatch_hit_notifications(context, u, d))
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    try:
+        log_successful_hit(u, d)
+    except Exception as e: logger.error(f"Hit Log Error: {e}")
 
 async def show_multi_choice(update, context, data_list, keyword):
     global GLOBAL_INFO; info_txt = f"📢 INFO: {GLOBAL_INFO}\n\n" if GLOBAL_INFO else ""
@@ -3912,12 +3941,166 @@ async def show_multi_choice(update, context, data_list, keyword):
     await update.message.reply_text(txt, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
 
+# ==============================================================================
+# CEK MASSAL: BANYAK NOPOL SEKALIGUS (/cekmassal)
+# ==============================================================================
+# Matel patroli bisa kirim daftar nopol (baris baru / koma) atau file .txt.
+# Semua nopol dicek exact dalam satu probe index / query 'in_' per 100 nopol,
+# setiap HIT tetap memotong kuota, dicatat ke finding_logs & dikirim notifikasinya.
+
+BATCH_LOOKUP_MAX = int(os.environ.get("BATCH_LOOKUP_MAX", 300))
+BATCH_LOOKUP_CHUNK = 100
+
+def parse_plate_list(text):
+    """Teks bebas -> list nopol ternormalisasi (A-Z0-9), unik, urutan input tetap."""
+    plates = []
+    for part in re.split(r'[\n,;]+', text or ''):
+        kw = re.sub(r'[^a-zA-Z0-9]', '', part.upper())
+        if len(kw) >= 3: plates.append(kw)
+    return list(dict.fromkeys(plates))
+
+def lookup_plates_bulk(plates):
+    """Cari exact banyak nopol sekaligus. Return dict nopol ternormalisasi -> baris kendaraan."""
+    if PLATE_INDEX and PLATE_INDEX.ready:
+        raw = PLATE_INDEX.resolve_exact(plates)
+        column, values = 'nopol', list(raw.values())
+    elif SEARCH_RPC["available"]:
+        column, values = 'nopol_norm', plates   # kolom dari migration search_kendaraan
+    else:
+        column, values = 'nopol', plates
+    found = {}
+    for i in range(0, len(values), BATCH_LOOKUP_CHUNK):
+        chunk = values[i:i + BATCH_LOOKUP_CHUNK]
+        try: rows = supabase.table('kendaraan').select("*").in_(column, chunk).execute().data
+        except Exception as e:
+            if column != 'nopol_norm': raise
+            # Migration belum dijalankan: kolom nopol_norm belum ada
+            logger.error(f"Cek Massal: nopol_norm tidak tersedia, pakai kolom nopol: {e}")
+            column = 'nopol'
+            rows = supabase.table('kendaraan').select("*").in_(column, chunk).execute().data
+        for r in rows or []:
+            found[r.get('nopol_norm') or re.sub(r'[^a-zA-Z0-9]', '', str(r['nopol'])).upper()] = r
+    return found
+
+async def cek_massal_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    u = await get_user_async(update.effective_user.id)
+    if not u: return await update.message.reply_text("⛔ **AKSES DITOLAK**\nSilakan ketik /register.", parse_mode='Markdown')
+    if u['status'] != 'active': return await update.message.reply_text("⏳ **AKUN PENDING**\nTunggu Admin.", parse_mode='Markdown')
+
+    # Daftar boleh langsung ditulis setelah perintah: /cekmassal B1234ABC, D5678XY
+    body = update.message.text.split(maxsplit=1)
+    if len(body) > 1 and parse_plate_list(body[1]):
+        await run_batch_lookup(update, context, u, parse_plate_list(body[1]))
+        return ConversationHandler.END
+
+    await update.message.reply_text(
+        "📋 **CEK MASSAL NOPOL**\n━━━━━━━━━━━━━━━━━━\n"
+        f"Kirim daftar nopol (maks. {BATCH_LOOKUP_MAX}), pisahkan dengan **baris baru** atau **koma**,\n"
+        "atau kirim **file .txt** berisi daftar nopol.\n\n"
+        "❌ *Ketik /cancel untuk membatalkan.*",
+        parse_mode='Markdown'
+    )
+    return BATCH_LIST
+
+async def cek_massal_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    u = await get_user_async(update.effective_user.id)
+    if not u: return ConversationHandler.END
+    doc = update.message.document
+    if doc:
+        if not (doc.file_name or '').lower().endswith(('.txt', '.csv')) or (doc.file_size or 0) > 512 * 1024:
+            await update.message.reply_text("⚠️ Kirim file **.txt** (maks. 512 KB) atau ketik daftar nopol.", parse_mode='Markdown')
+            return BATCH_LIST
+        tg_file = await doc.get_file()
+        text = bytes(await tg_file.download_as_bytearray()).decode('utf-8', errors='replace')
+    else:
+        text = update.message.text
+    plates = parse_plate_list(text)
+    if not plates:
+        await update.message.reply_text("⚠️ Tidak ada nopol valid (minimal 3 karakter). Coba lagi atau /cancel.")
+        return BATCH_LIST
+    await run_batch_lookup(update, context, u, plates)
+    return ConversationHandler.END
+
+async def run_batch_lookup(update, context, u, plates):
+    try: is_active, reason = await DB.run(check_subscription_access, u)
+    except Exception: is_active, reason = False, "ERROR"
+    if not is_active:
+        if reason == "EXPIRED": return await update.message.reply_text("⛔ **MASA AKTIF HABIS**\nSilakan ketik /infobayar untuk perpanjang.", parse_mode='Markdown')
+        if reason == "DAILY_LIMIT": return await update.message.reply_text("⛔ **BATAS HARIAN TERCAPAI**\nAnda telah mencapai limit cek hari ini. Reset otomatis jam 00:00.", parse_mode='Markdown')
+        return await update.message.reply_text("❌ Error DB.")
+
+    skipped = max(0, len(plates) - BATCH_LOOKUP_MAX)
+    plates = plates[:BATCH_LOOKUP_MAX]
+    status = await update.message.reply_text(f"⏳ Mengecek <b>{len(plates)}</b> nopol...", parse_mode='HTML')
+
+    generation = DATA_GENERATION
+    try: found = await DB.run(lookup_plates_bulk, plates, timeout=DB_TIMEOUT_LONG)
+    except Exception as e:
+        logger.error(f"Cek Massal Error: {e}")
+        return await status.edit_text("❌ Error DB.")
+
+    # Nopol yang tidak ditemukan TIDAK masuk MISS_CACHE: cek massal hanya exact nopol,
+    # sedangkan pencarian tunggal juga mencocokkan substring, noka & nosin
+    matched = [found[kw] for kw in plates if kw in found]
+
+    # Kuota seluruh HIT dipotong sekali (satu RPC), sisa limit menentukan berapa yang ditampilkan
+    granted = await DB.run(consume_daily_quota_many, u, len(matched)) if matched else 0
+    if granted is None:
+        # RPC berhitung belum terpasang: kuota per hit seperti pencarian tunggal
+        # Pemakaian dibawa antar iterasi (u basi): mode lama menulis daily_usage absolut per hit
+        today_str = datetime.now(TZ_JAKARTA).strftime('%Y-%m-%d')
+        cur = dict(u)
+        if str(u.get('last_usage_date'))[:10] != today_str: cur['daily_usage'] = 0
+        limit = daily_limit_for(u)
+        granted = 0
+        for _ in matched:
+            # Mode lama (tanpa RPC) tidak mengecek limit di server: cek lokal per hit
+            if not QUOTA.available and limit is not None and (cur.get('daily_usage') or 0) >= limit: break
+            allowed, usage = await DB.run(consume_daily_quota, cur)
+            if not allowed: break
+            cur['daily_usage'] = usage
+            granted += 1
+    hits = matched[:granted]; quota_out = granted < len(matched)
+    for d in hits:
+        # Setiap HIT lewat jalur yang sama dengan pencarian tunggal: log & notifikasi
+        try: log_successful_hit(u, d)
+        except Exception as e: logger.error(f"Hit Log Error: {e}")
+        task = asyncio.create_task(dispatch_hit_notifications(context, u, d))
+        BACKGROUND_TASKS.add(task)
+        task.add_done_callback(BACKGROUND_TASKS.discard)
+    HOT_ROWS.put(update.effective_chat.id, hits, generation)
+
+    lines = [
+        f"📋 <b>HASIL CEK MASSAL</b>\n━━━━━━━━━━━━━━━━━━\n"
+        f"🔎 Dicek: <b>{len(plates)}</b> | 🚨 HIT: <b>{len(hits)}</b>\n"
+    ]
+    for d in hits:
+        lines.append(
+            f"🚨 <code>{clean_text(d.get('nopol'))}</code> | {clean_text(d.get('type'))} | "
+            f"{clean_text(d.get('tahun'))} | {clean_text(d.get('warna'))}\n"
+            f"     🏦 {clean_text(d.get('finance'))} | ⚠️ OVD {clean_text(d.get('ovd'))} | 🏢 {clean_text(d.get('branch'))}"
+        )
+    if not hits: lines.append("❌ Tidak ada nopol yang terdaftar.")
+    if quota_out: lines.append("\n⛔ <b>BATAS HARIAN TERCAPAI</b>, sisa daftar tidak diproses.")
+    if skipped: lines.append(f"\n⚠️ {skipped} nopol terakhir dilewati (maks. {BATCH_LOOKUP_MAX} per cek).")
+    lines.append("\n<i>Informasi ini BUKAN alat yang SAH untuk penarikan unit (Eksekusi).</i>")
+
+    # Potong per pesan agar tidak melewati batas 4096 karakter Telegram
+    chunks = [""]
+    for line in lines:
+        if len(chunks[-1]) + len(line) + 1 > 4000: chunks.append("")
+        chunks[-1] += line + "\n"
+    await status.edit_text(chunks[0], parse_mode='HTML')
+    for extra in chunks[1:]:
+        await context.bot.send_message(update.effective_chat.id, extra, parse_mode='HTML')
+
+
 # ==============================================================================
 # BAGIAN 13: HANDLER KONVERSASI
 # ==============================================================================
 
 async def add_manual_start(update, context):
-    u = get_user(update.effective_user.id)
+    u = await get_user_async(update.effective_user.id)
     if not u or u['status'] != 'active': return
     
     await update.message.reply_text(
@@ -4014,7 +4197,7 @@ async def add_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     d = context.user_data
     user = update.effective_user
-    u_db = get_user(user.id)
+    u_db = await get_user_async(user.id)
     
     # 1. SIAPKAN DATA UTAMA
     # Mapping: Branch -> No HP, OVD -> Keterangan
@@ -4034,7 +4217,8 @@ async def add_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # 2. EKSEKUSI LANGSUNG KE DATABASE (Tanpa Approval)
-        supabase.table('kendaraan').upsert(payload).execute()
+        await DB.execute(supabase.table('kendaraan').upsert(payload))
+        sync_plate_index(upserted=[payload])
         
         # 3. INFO SUKSES KE USER
         await msg_wait.edit_text(
@@ -4076,12 +4260,12 @@ async def add_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 async def lapor_delete_start(update, context):
-    if not get_user(update.effective_user.id): return
+    if not await get_user_async(update.effective_user.id): return
     msg = ("🗑️ **LAPOR UNIT SELESAI/AMAN**\n\nAdmin akan memverifikasi laporan ini sebelum data dihapus.\n\n👉 **Masukkan Nomor Polisi (Nopol) unit:**")
     await update.message.reply_text(msg, reply_markup=ReplyKeyboardMarkup([["❌ BATAL"]], resize_keyboard=True), parse_mode='Markdown'); return L_NOPOL
 async def lapor_delete_check(update, context):
     if update.message.text == "❌ BATAL": return await cancel(update, context)
-    n = update.message.text.upper().replace(" ", ""); res = supabase.table('kendaraan').select("*").eq('nopol', n).execute()
+    n = update.message.text.upper().replace(" ", ""); res = await DB.execute(supabase.table('kendaraan').select("*").eq('nopol', n))
     if not res.data: await update.message.reply_text(f"❌ Nopol `{n}` tidak ditemukan di database.", reply_markup=ReplyKeyboardRemove(), parse_mode='Markdown'); return ConversationHandler.END
     unit_data = res.data[0]; context.user_data['lapor_nopol'] = n; context.user_data['lapor_type'] = unit_data.get('type', '-'); context.user_data['lapor_finance'] = unit_data.get('finance', '-')
     await update.message.reply_text(f"✅ **Unit Ditemukan:**\n🚙 {unit_data.get('type')}\n🏦 {unit_data.get('finance')}\n\n👉 **Masukkan ALASAN penghapusan:**", parse_mode='Markdown'); return L_REASON
@@ -4092,7 +4276,7 @@ async def lapor_reason(update, context):
     await update.message.reply_text(msg, reply_markup=ReplyKeyboardMarkup([["✅ KIRIM LAPORAN", "❌ BATAL"]]), parse_mode='Markdown'); return L_CONFIRM
 async def lapor_delete_confirm(update, context):
     if update.message.text != "✅ KIRIM LAPORAN": return await cancel(update, context)
-    n = context.user_data['lapor_nopol']; reason = context.user_data['lapor_reason']; u = get_user(update.effective_user.id)
+    n = context.user_data['lapor_nopol']; reason = context.user_data['lapor_reason']; u = await get_user_async(update.effective_user.id)
     await update.message.reply_text("✅ **Laporan Terkirim!** Admin sedang meninjau.", reply_markup=ReplyKeyboardRemove(), parse_mode='Markdown')
     msg_admin = (f"🗑️ **PENGAJUAN HAPUS UNIT**\n━━━━━━━━━━━━━━━━━━\n👤 **Pelapor:** {clean_text(u.get('nama_lengkap'))}\n🏢 **Agency:** {clean_text(u.get('agency'))}\n━━━━━━━━━━━━━━━━━━\n🔢 **Nopol:** `{n}`\n🚙 **Unit:** {context.user_data['lapor_type']}\n🏦 **Leasing:** {context.user_data['lapor_finance']}\n📝 **Alasan:** {reason}\n━━━━━━━━━━━━━━━━━━")
     kb = [[InlineKeyboardButton("✅ Setujui Hapus", callback_data=f"del_acc_{n}_{u['user_id']}"), InlineKeyboardButton("❌ Tolak", callback_data=f"del_rej_{u['user_id']}")]]
@@ -4106,7 +4290,10 @@ async def delete_unit_check(update, context):
     n = update.message.text.upper().replace(" ", ""); context.user_data['del_nopol'] = n
     await update.message.reply_text(f"Hapus `{n}`?", reply_markup=ReplyKeyboardMarkup([["✅ YA", "❌ BATAL"]])); return D_CONFIRM
 async def delete_unit_confirm(update, context):
-    if update.message.text == "✅ YA": supabase.table('kendaraan').delete().eq('nopol', context.user_data['del_nopol']).execute(); await update.message.reply_text("✅ Terhapus.", reply_markup=ReplyKeyboardRemove())
+    if update.message.text == "✅ YA":
+        await DB.execute(supabase.table('kendaraan').delete().eq('nopol', context.user_data['del_nopol']))
+        sync_plate_index(deleted=[context.user_data['del_nopol']])
+        await update.message.reply_text("✅ Terhapus.", reply_markup=ReplyKeyboardRemove())
     return ConversationHandler.END
 
 async def stop_upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -4131,10 +4318,13 @@ async def callback_handler(update, context):
     # 2. VIEW DETAIL UNIT
     elif data.startswith("view_"):
         nopol_target = data.replace("view_", "")
-        u = get_user(update.effective_user.id)
-        res = supabase.table('kendaraan').select("*").eq('nopol', nopol_target).execute()
-        if res.data: 
-            await show_unit_detail_original(update, context, res.data[0], u)
+        u = await get_user_async(update.effective_user.id)
+        row = HOT_ROWS.get(update.effective_chat.id, nopol_target, DATA_GENERATION)
+        if row is None:
+            res = await DB.execute(supabase.table('kendaraan').select("*").eq('nopol', nopol_target))
+            row = res.data[0] if res.data else None
+        if row: 
+            await show_unit_detail_original(update, context, row, u)
         else: 
             await query.edit_message_text("❌ Data unit sudah tidak tersedia.")
     
@@ -4149,7 +4339,7 @@ async def callback_handler(update, context):
             await query.edit_message_caption("❌ DITOLAK.")
         else:
             days = int(days_str)
-            suc, new_exp = add_subscription_days(uid, days)
+            suc, new_exp = await DB.run(add_subscription_days, uid, days)
             
             if suc:
                 exp_str = new_exp.strftime('%d %b %Y')
@@ -4180,7 +4370,7 @@ async def callback_handler(update, context):
                 
                 # Laporan Chat ke Admin (Sesuai Request + Agency)
                 try:
-                    user_info = get_user(uid)
+                    user_info = await get_user_async(uid)
                     nama_user = user_info.get('nama_lengkap', 'Unknown')
                     nama_agency = user_info.get('agency', 'Tidak Ada/Mandiri')
                     
@@ -4227,14 +4417,16 @@ async def callback_handler(update, context):
     # 5. ADMIN USER MANAGEMENT
     elif data.startswith("adm_promote_"):
         uid = int(data.split("_")[2])
-        supabase.table('users').update({'role': 'korlap'}).eq('user_id', uid).execute()
+        await DB.execute(supabase.table('users').update({'role': 'korlap'}).eq('user_id', uid))
+        patch_user_cache(uid, {'role': 'korlap'})
         await query.edit_message_text(f"✅ User {uid} DIPROMOSIKAN jadi KORLAP.")
         try: await context.bot.send_message(uid, "🎉 **SELAMAT!** Anda telah diangkat menjadi **KORLAP**.")
         except: pass
         
     elif data.startswith("adm_demote_"): 
         uid = int(data.split("_")[2])
-        supabase.table('users').update({'role': 'matel'}).eq('user_id', uid).execute()
+        await DB.execute(supabase.table('users').update({'role': 'matel'}).eq('user_id', uid))
+        patch_user_cache(uid, {'role': 'matel'})
         await query.edit_message_text(f"⬇️ User {uid} DITURUNKAN jadi MATEL.")
         
     elif data == "close_panel": 
@@ -4243,7 +4435,7 @@ async def callback_handler(update, context):
     # 6. APPROVE REGISTER (appu_)
     elif data.startswith("appu_"): 
         target_uid = int(data.split("_")[1])
-        target_user = get_user(target_uid) # Ambil data pendaftaran dulu
+        target_user = await get_user_async(target_uid) # Ambil data pendaftaran dulu
         
         if not target_user:
             await query.answer("❌ Data user tidak ditemukan.")
@@ -4262,10 +4454,11 @@ async def callback_handler(update, context):
             success_msg = f"✅ <b>User {target_uid} DIAKTIFKAN</b>\n━━━━━━━━━━━━━━━\n🎁 Trial: 3 Hari/72 Jam (s/d {exp_display})"
         
         # 1. Update Database
-        supabase.table('users').update({
+        await DB.execute(supabase.table('users').update({
             'status': 'active',
             'expiry_date': final_expiry.isoformat()
-        }).eq('user_id', target_uid).execute()
+        }).eq('user_id', target_uid))
+        patch_user_cache(target_uid, {'status': 'active', 'expiry_date': final_expiry.isoformat()})
         
         # 2. Feedback ke Admin (Satu kali saja agar tidak error)
         try:
@@ -4318,7 +4511,8 @@ async def callback_handler(update, context):
     elif data.startswith("reju_"):
         target_uid = int(data.split("_")[1])
         # Hapus User
-        supabase.table('users').delete().eq('user_id', target_uid).execute()
+        await DB.execute(supabase.table('users').delete().eq('user_id', target_uid))
+        invalidate_user(target_uid)
         
         try:
             await query.edit_message_caption(f"❌ User {target_uid} DITOLAK & DIHAPUS.")
@@ -4332,14 +4526,16 @@ async def callback_handler(update, context):
     # COPY TEXT BUTTON (Clean Version)
     elif data.startswith("cp_"):
         nopol_target = data.replace("cp_", "")
-        u = get_user(update.effective_user.id)
+        u = await get_user_async(update.effective_user.id)
         if not u: return
         try:
-            res = supabase.table('kendaraan').select("*").eq('nopol', nopol_target).execute()
-            if not res.data:
-                await query.answer("❌ Data unit tidak ditemukan.", show_alert=True)
-                return
-            d = res.data[0]
+            d = HOT_ROWS.get(update.effective_chat.id, nopol_target, DATA_GENERATION)
+            if d is None:
+                res = await DB.execute(supabase.table('kendaraan').select("*").eq('nopol', nopol_target))
+                if not res.data:
+                    await query.answer("❌ Data unit tidak ditemukan.", show_alert=True)
+                    return
+                d = res.data[0]
             
             # Format Text (Sudah sesuai standar WA)
             share_text = (
@@ -4379,7 +4575,8 @@ async def callback_handler(update, context):
         item = context.bot_data.get(f"prop_{nopol}")
         if item:
             try:
-                supabase.table('kendaraan').upsert(item).execute()
+                await DB.execute(supabase.table('kendaraan').upsert(item))
+                sync_plate_index(upserted=[item])
                 del context.bot_data[f"prop_{nopol}"]
                 await query.edit_message_text(f"✅ Data `{nopol}` DISETUJUI & Sudah Tayang di Database.")
                 try:
@@ -4415,7 +4612,8 @@ async def callback_handler(update, context):
         
         try:
             # 1. Hapus dari Database
-            supabase.table('kendaraan').delete().eq('nopol', nopol_target).execute()
+            await DB.execute(supabase.table('kendaraan').delete().eq('nopol', nopol_target))
+            sync_plate_index(deleted=[nopol_target])
             
             # 2. Feedback Visual ke Admin (Pop-up)
             await query.answer("✅ Unit Berhasil Dihapus!", show_alert=True)
@@ -4453,6 +4651,13 @@ async def callback_handler(update, context):
         # Download Database Aset (PIC/Admin)
         await download_asset_data(update, context)
         
+    elif data == "dl_assets_csv":
+        # Versi cepat & ringan untuk portofolio besar
+        await download_asset_data(update, context, fmt='csv.gz')
+        
+    elif data == "dl_assets_parquet":
+        await download_asset_data(update, context, fmt='parquet')
+        
     elif data == "dl_findings":
         # Download Laporan Temuan (PIC/Admin)
         await download_finding_report(update, context)
@@ -4488,7 +4693,7 @@ if __name__ == '__main__':
     from telegram.ext import ApplicationBuilder
 
     print("🚀 ONEASPAL BOT v6.60 (FINAL FIX) STARTING...")
-    app = ApplicationBuilder().token(TOKEN).read_timeout(30).write_timeout(30).connect_timeout(30).post_init(post_init).build()
+    app = ApplicationBuilder().token(TOKEN).read_timeout(30).write_timeout(30).connect_timeout(30).post_init(post_init).post_shutdown(post_shutdown).build()
     
     # ==========================================================================
     # 1. STOP COMMAND (EMERGENCY)
@@ -4549,6 +4754,19 @@ if __name__ == '__main__':
         fallbacks=[CommandHandler('cancel', cancel), MessageHandler(filters.Regex('^❌ BATAL$'), cancel)]
     ))
 
+    # C2. CEK MASSAL NOPOL (Teks daftar / file .txt)
+    # --------------------------------------------------------------------------
+    app.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('cekmassal', cek_massal_start)],
+        states={
+            BATCH_LIST: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, cek_massal_receive),
+                MessageHandler(filters.Document.ALL, cek_massal_receive)
+            ]
+        },
+        fallbacks=[CommandHandler('cancel', cancel), MessageHandler(filters.Regex('^❌ BATAL$'), cancel)]
+    ))
+
     # D. FITUR ADMIN LAINNYA
     # --------------------------------------------------------------------------
     app.add_handler(ConversationHandler(
@@ -4615,6 +4833,7 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler('rekapanggota', rekap_anggota_korlap))
     app.add_handler(CommandHandler("rekap_member", rekap_member))
     app.add_handler(CommandHandler("cekagency", rekap_handler))
+    app.add_handler(CommandHandler('leaderboard', leaderboard_command))
     app.add_handler(MessageHandler(filters.Regex(r'(?i)^/rekap'), rekap_handler))    
     app.add_handler(CommandHandler('users', list_users))
     app.add_handler(CommandHandler('angkat_korlap', angkat_korlap)) 
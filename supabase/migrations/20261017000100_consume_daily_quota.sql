@@ -0,0 +1,49 @@
+-- =============================================================================
+-- KUOTA HARIAN ATOMIK (dipakai main.py -> QuotaGuard.consume)
+-- =============================================================================
+-- Reset harian, cek limit & increment daily_usage dalam SATU statement UPDATE.
+-- Row lock dari UPDATE membuat pencarian paralel user yang sama tidak saling
+-- menimpa hitungan (dulu: baca daily_usage -> reset -> tulis current_usage + 1).
+--
+--   select * from consume_daily_quota(123456789, 500, '2026-10-17');
+--   -> allowed = true  : kuota terpakai 1, daily_usage = nilai baru
+--   -> allowed = false : limit tercapai, daily_usage = nilai sekarang (tidak berubah)
+-- p_limit NULL = tanpa batas (role pic).
+-- last_usage_date dibandingkan sebagai ::date agar benar untuk kolom date, text,
+-- timestamp maupun timestamptz (sama seperti str(...)[:10] di check_subscription_access).
+
+create or replace function public.consume_daily_quota(
+    p_user_id bigint,
+    p_limit integer,
+    p_today date
+)
+returns table (allowed boolean, daily_usage integer)
+language plpgsql
+as $$
+begin
+    return query
+    update public.users u
+       set daily_usage = case
+                             when u.last_usage_date::date is distinct from p_today then 1
+                             else coalesce(u.daily_usage, 0) + 1
+                         end,
+           last_usage_date = p_today,
+           last_seen = now()
+     where u.user_id = p_user_id
+       and (
+            p_limit is null
+            or u.last_usage_date::date is distinct from p_today
+            or coalesce(u.daily_usage, 0) < p_limit
+       )
+    returning true, u.daily_usage::integer;
+
+    if not found then
+        return query
+        select false,
+               case when u.last_usage_date::date is distinct from p_today then 0
+                    else coalesce(u.daily_usage, 0)::integer end
+          from public.users u
+         where u.user_id = p_user_id;
+    end if;
+end;
+$$;
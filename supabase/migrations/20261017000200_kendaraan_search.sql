@@ -0,0 +1,48 @@
+-- =============================================================================
+-- PENCARIAN KENDARAAN: NOPOL TERNORMALISASI + INDEX TRIGRAM + RPC search_kendaraan
+-- =============================================================================
+-- Query lama 'nopol.ilike.%kw%' tidak bisa memakai index B-tree (selalu seq scan)
+-- dan nopol di DB masih bisa mengandung spasi, sehingga bot membersihkannya lagi
+-- di Python untuk setiap hasil. Di sini:
+--   * nopol_norm  : kolom generated (A-Z0-9 saja, huruf besar), selalu sinkron
+--   * GIN pg_trgm : LIKE '%kw%' pada nopol_norm memakai index (min. 3 karakter)
+--   * B-tree      : exact match nopol_norm, noka, nosin
+--   * search_kendaraan(kw) : satu RPC, exact match nopol diurutkan paling atas
+--
+-- CATATAN: ADD COLUMN ... STORED menulis ulang tabel (lock). Jalankan di luar jam sibuk.
+-- Nama objek sengaja tanpa prefix schema agar file ini juga bisa diputar ulang ke
+-- schema uji (lihat benchmarks/bench_search_plan.sql).
+
+create extension if not exists pg_trgm;
+
+alter table kendaraan
+    add column if not exists nopol_norm text
+    generated always as (upper(regexp_replace(coalesce(nopol, ''), '[^A-Za-z0-9]', '', 'g'))) stored;
+
+create index if not exists kendaraan_nopol_norm_idx on kendaraan (nopol_norm);
+create index if not exists kendaraan_nopol_norm_trgm_idx on kendaraan using gin (nopol_norm gin_trgm_ops);
+create index if not exists kendaraan_noka_idx on kendaraan (noka);
+create index if not exists kendaraan_nosin_idx on kendaraan (nosin);
+
+-- Pola LIKE dibangun dari parameter, jadi dipakai EXECUTE agar planner selalu
+-- membuat rencana untuk nilai kw yang sebenarnya (bukan generic plan).
+create or replace function search_kendaraan(kw text, max_rows integer default 20)
+returns setof kendaraan
+language plpgsql
+stable
+as $$
+declare
+    v_kw text := upper(regexp_replace(coalesce(kw, ''), '[^A-Za-z0-9]', '', 'g'));
+begin
+    if length(v_kw) < 3 then
+        return;
+    end if;
+
+    return query execute
+        'select k.* from kendaraan k
+          where k.nopol_norm like $1 or k.noka = $2 or k.nosin = $2
+          order by (k.nopol_norm = $2) desc, length(k.nopol_norm), k.nopol
+          limit $3'
+    using '%' || v_kw || '%', v_kw, max_rows;
+end;
+$$;
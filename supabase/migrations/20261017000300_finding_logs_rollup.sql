@@ -0,0 +1,28 @@
+-- =============================================================================
+-- ROLLUP HIT HARIAN (dipakai main.py -> load_hit_rollup, /rekap & /cekagency)
+-- =============================================================================
+-- Bot menyimpan hitungan hit hari berjalan per (leasing, nama_pt, user_id) di
+-- memori. Fungsi ini hanya dipanggil saat bot start / hari belum termuat, dan
+-- mengembalikan hasil GROUP BY (puluhan baris) alih-alih seluruh log hari ini.
+-- Tampilan detail menarik baris per user_id hari ini lewat index user_id + created_at.
+--
+-- Hasil bisa > 1000 baris (max_rows API): client mengambilnya per range.
+--
+--   select * from daily_hit_rollup('2026-10-17T00:00:00+07:00');
+
+create index if not exists finding_logs_created_at_idx
+    on public.finding_logs (created_at);
+
+create index if not exists finding_logs_user_created_idx
+    on public.finding_logs (user_id, created_at);
+
+create or replace function public.daily_hit_rollup(p_since timestamptz)
+returns table (leasing text, nama_pt text, user_id bigint, hits bigint)
+language sql
+stable
+as $$
+    select f.leasing::text, f.nama_pt::text, f.user_id::bigint, count(*)::bigint
+      from public.finding_logs f
+     where f.created_at >= p_since
+     group by 1, 2, 3;
+$$;
@@ -0,0 +1,40 @@
+-- =============================================================================
+-- METRIK DASHBOARD (dipakai dashboard.py -> get_hit_counts, get_activity_metrics)
+-- =============================================================================
+-- Dulu dashboard menarik SELURUH finding_logs.user_id dan SELURUH users.last_seen
+-- (dua kali) di setiap rerun lalu menghitungnya di pandas. Sekarang hitungan
+-- dilakukan di database dan yang dikirim hanya hasil agregatnya.
+--
+--   select * from user_hit_counts();
+--   -> satu baris per user: jumlah hit + (created_at, id) hit terakhir (watermark incremental)
+--
+--   select * from user_activity_metrics(now() - interval '30 minutes', '2026-10-17T00:00:00+07:00');
+--   -> live (aktif < 30 menit) & dau (aktif sejak 00:00 WIB) dalam satu scan
+
+create index if not exists users_last_seen_idx
+    on public.users (last_seen);
+
+drop function if exists public.user_hit_counts();
+
+create or replace function public.user_hit_counts()
+returns table (user_id bigint, hits bigint, last_at timestamptz, last_id bigint)
+language sql
+stable
+as $$
+    select f.user_id::bigint, count(*)::bigint, max(f.created_at),
+           (array_agg(f.id order by f.created_at desc, f.id desc))[1]::bigint
+      from public.finding_logs f
+     where f.user_id is not null
+     group by f.user_id;
+$$;
+
+create or replace function public.user_activity_metrics(p_live_since timestamptz, p_day_start timestamptz)
+returns table (live bigint, dau bigint)
+language sql
+stable
+as $$
+    select count(*) filter (where u.last_seen >= p_live_since)::bigint,
+           count(*) filter (where u.last_seen >= p_day_start)::bigint
+      from public.users u
+     where u.last_seen >= least(p_live_since, p_day_start);
+$$;
@@ -0,0 +1,28 @@
+-- =============================================================================
+-- LEADERBOARD HIT (dipakai utils_leaderboard -> dashboard tab LEADERBOARD & /leaderboard)
+-- =============================================================================
+-- Top-N user (selain PIC leasing) berdasarkan jumlah hit sejak p_since.
+-- p_since NULL = seumur hidup. Yang dikirim ke client hanya p_limit baris.
+-- Jendela hari/minggu/bulan memakai index finding_logs (created_at).
+--
+--   select * from leaderboard_hits('2026-10-12T00:00:00+07:00', 10);
+
+create or replace function public.leaderboard_hits(p_since timestamptz default null, p_limit integer default 10)
+returns table (user_id bigint, nama_lengkap text, agency text, hits bigint)
+language sql
+stable
+as $$
+    with h as (
+        select f.user_id, count(*) as hits
+          from public.finding_logs f
+         where f.user_id is not null
+           and (p_since is null or f.created_at >= p_since)
+         group by f.user_id
+    )
+    select u.user_id::bigint, u.nama_lengkap::text, u.agency::text, h.hits::bigint
+      from h
+      join public.users u on u.user_id = h.user_id
+     where coalesce(u.role, '') <> 'pic'
+     order by h.hits desc, u.user_id
+     limit greatest(coalesce(p_limit, 10), 1);
+$$;
@@ -0,0 +1,23 @@
+-- =============================================================================
+-- LOG BROADCAST DASHBOARD (dipakai utils_broadcast.BroadcastJob)
+-- =============================================================================
+-- Satu baris per penerima per job broadcast (tagihan expired / pengumuman),
+-- ditulis bertahap (batch) oleh job yang berjalan di background.
+--   status: sent | blocked (user memblokir bot) | failed (chat tidak valid) | error (gagal sementara)
+--
+--   select status, count(*) from broadcast_logs where job_id = '...' group by 1;
+
+create table if not exists public.broadcast_logs (
+    id bigserial primary key,
+    job_id text not null,
+    kind text,
+    user_id bigint,
+    status text not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists broadcast_logs_job_idx
+    on public.broadcast_logs (job_id);
+
+create index if not exists broadcast_logs_user_created_idx
+    on public.broadcast_logs (user_id, created_at desc);
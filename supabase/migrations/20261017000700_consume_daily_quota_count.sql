@@ -0,0 +1,50 @@
+-- =============================================================================
+-- KUOTA HARIAN BERHITUNG (dipakai main.py -> run_batch_lookup / QuotaGuard.consume_many)
+-- =============================================================================
+-- Overload consume_daily_quota dengan p_count: cek massal memakai N kuota dalam
+-- SATU panggilan, bukan satu RPC per HIT. Kuota diberikan sebanyak yang masih
+-- tersisa (least(p_count, p_limit - pemakaian)), sekaligus dalam satu row lock.
+--
+--   select * from consume_daily_quota(123456789, 500, '2026-10-17', 12);
+--   -> granted     : kuota yang benar-benar terpakai (0 .. p_count)
+--   -> daily_usage : nilai baru setelah dipakai
+-- p_limit NULL = tanpa batas (role pic). Versi 3 argumen tetap dipakai pencarian tunggal.
+
+create or replace function public.consume_daily_quota(
+    p_user_id bigint,
+    p_limit integer,
+    p_today date,
+    p_count integer
+)
+returns table (granted integer, daily_usage integer)
+language plpgsql
+as $$
+declare
+    v_used integer;
+    v_granted integer;
+begin
+    select case when u.last_usage_date::date is distinct from p_today then 0
+                else coalesce(u.daily_usage, 0) end
+      into v_used
+      from public.users u
+     where u.user_id = p_user_id
+       for update;
+
+    if not found then
+        return;
+    end if;
+
+    v_granted := greatest(0, case when p_limit is null then p_count
+                                  else least(p_count, p_limit - v_used) end);
+
+    if v_granted > 0 then
+        update public.users u
+           set daily_usage = v_used + v_granted,
+               last_usage_date = p_today,
+               last_seen = now()
+         where u.user_id = p_user_id;
+    end if;
+
+    return query select v_granted, (v_used + v_granted)::integer;
+end;
+$$;
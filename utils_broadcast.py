@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from utils_notify import TokenBucket
+
+# ==============================================================================
+# MESIN BROADCAST TELEGRAM (HTTPX ASYNC + TOKEN BUCKET + CHECKPOINT)
+# ==============================================================================
+# Dipakai daily_broadcast.py (dan broadcast dashboard). Satu AsyncClient dengan
+# pool koneksi (HTTP/2 jika paket h2 terpasang) dipakai bersama oleh beberapa
+# worker. Laju kirim dibatasi token bucket global (default 20 pesan/detik, di bawah
+# batas ~30/detik bot Telegram), balasan 429 dihormati lewat retry_after. Setiap penerima yang sudah
+# selesai dicatat ke file checkpoint, jadi broadcast yang terputus bisa diulang
+# tanpa mengirim dobel.
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API = "https://api.telegram.org"
+BROADCAST_RATE = 20          # Pesan per detik (konservatif, batas bot Telegram ~30/detik)
+BROADCAST_CONCURRENCY = 16   # Request paralel (= ukuran pool koneksi)
+MAX_ATTEMPTS = 5
+
+
+class BroadcastCheckpoint:
+    """
+    File JSONL: baris pertama {"key": ..., "text": pesan}, berikutnya {"id": chat_id, "s": status}.
+    Jika key berbeda (broadcast baru), file lama diabaikan & ditimpa.
+    Pesan ikut disimpan: broadcast yang dilanjutkan mengirim teks yang SAMA
+    walau data sumbernya sudah berubah.
+    """
+
+    def __init__(self, path, key, text=None):
+        self.path = path
+        self.key = key
+        self.text = text
+        self.done = {}
+        self._f = None
+
+    def _header(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                head = json.loads(f.readline())
+            return head if head.get("key") == self.key else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def saved_text(self):
+        """Pesan dari checkpoint dengan key yang sama (None jika belum ada)."""
+        head = self._header()
+        return head.get("text") if head else None
+
+    def open(self):
+        head = self._header()
+        if head is not None:
+            if head.get("text") is not None: self.text = head["text"]
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            if lines:
+                for line in lines[1:]:
+                    try: rec = json.loads(line)
+                    except ValueError: continue   # Baris terakhir terpotong saat crash
+                    self.done[str(rec["id"])] = rec.get("s")
+                self._f = open(self.path, 'a', encoding='utf-8')
+                return self
+        self._f = open(self.path, 'w', encoding='utf-8')
+        self._f.write(json.dumps({"key": self.key, "text": self.text}) + "\n")
+        self._f.flush()
+        return self
+
+    def mark(self, chat_id, status):
+        self.done[str(chat_id)] = status
+        if self._f is None: return
+        self._f.write(json.dumps({"id": chat_id, "s": status}) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f: self._f.close()
+        self._f = None
+
+
+def _make_client(concurrency, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+    except ImportError:   # Paket h2 tidak terpasang: tetap pooled, HTTP/1.1 keep-alive
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+async def _send_one(client, url, payload, bucket, max_attempts):
+    """Return status akhir: 'sent', 'blocked' (403), 'failed' (400 / gagal permanen), 'error' (sementara)."""
+    for attempt in range(max_attempts):
+        wait = bucket.delay()
+        if wait > 0: await asyncio.sleep(wait)
+        try:
+            r = await client.post(url, json=payload)
+        except httpx.HTTPError as e:
+            logger.error(f"Broadcast ke {payload['chat_id']} error jaringan: {e}")
+            await asyncio.sleep(min(30, 2 ** attempt))
+            continue
+        if r.status_code == 200: return 'sent'
+        if r.status_code == 429:
+            try: retry = float(r.json().get('parameters', {}).get('retry_after', 1))
+            except ValueError: retry = 1.0
+            # Tahan seluruh bucket: semua worker ikut menunggu, bukan hanya chat ini
+            bucket.block(retry)
+            continue
+        if r.status_code == 403: return 'blocked'     # User memblokir bot / akun dihapus
+        if r.status_code == 400: return 'failed'      # chat_id tidak valid
+        await asyncio.sleep(min(30, 2 ** attempt))    # 5xx: coba lagi
+    return 'error'
+
+
+async def broadcast_message(token, chat_ids, text, parse_mode='HTML', rate=BROADCAST_RATE,
+                            concurrency=BROADCAST_CONCURRENCY, checkpoint=None, on_progress=None,
+                            on_result=None, should_stop=None, max_attempts=MAX_ATTEMPTS, timeout=10.0):
+    """
+    Kirim `text` ke semua chat_ids. Return dict jumlah per status (+ 'skipped' dari checkpoint).
+    text        : string yang sama untuk semua, atau callable(chat_id) -> string (pesan personal)
+    checkpoint  : BroadcastCheckpoint yang sudah di-open (opsional)
+    on_progress : callback(selesai, total, stats) setiap penerima selesai
+    on_result   : callback(chat_id, status) setiap penerima selesai
+    should_stop : callable() -> True untuk menghentikan broadcast (sisa antrian tidak dikirim)
+    """
+    stats = {'sent': 0, 'blocked': 0, 'failed': 0, 'error': 0, 'skipped': 0}
+    todo = []
+    for cid in chat_ids:
+        if checkpoint and str(cid) in checkpoint.done: stats['skipped'] += 1
+        else: todo.append(cid)
+    total = len(todo)
+    if not todo: return stats
+
+    url = f"{TELEGRAM_API}/bot{token}/sendMessage"
+    bucket = TokenBucket(rate, rate)
+    queue = asyncio.Queue()
+    for cid in todo: queue.put_nowait(cid)
+    done = 0
+
+    async def worker(client):
+        nonlocal done
+        while True:
+            if should_stop and should_stop(): return
+            try: cid = queue.get_nowait()
+            except asyncio.QueueEmpty: return
+            payload = {"chat_id": cid, "text": text(cid) if callable(text) else text, "parse_mode": parse_mode}
+            try: status = await _send_one(client, url, payload, bucket, max_attempts)
+            except Exception as e:
+                logger.error(f"Broadcast ke {cid} gagal: {e}")
+                status = 'error'
+            stats[status] += 1
+            # 'error' (sementara) tidak dicatat: akan dicoba lagi saat broadcast diulang
+            if checkpoint and status != 'error': checkpoint.mark(cid, status)
+            if on_result: on_result(cid, status)
+            done += 1
+            if on_progress: on_progress(done, total, stats)
+
+    async with _make_client(concurrency, timeout) as client:
+        await asyncio.gather(*(worker(client) for _ in range(min(concurrency, total))))
+    return stats
+
+
+class BroadcastJob:
+    """
+    Broadcast yang berjalan di thread background (dashboard tidak ikut menunggu).
+    Status per penerima ditulis bertahap ke tabel broadcast_logs.
+
+    Pemakaian:
+        job = BroadcastJob(TOKEN, {user_id: pesan, ...}, client=supabase, kind='TAGIHAN').start()
+        job.progress()    # {'status', 'done', 'total', 'sent', ...} untuk polling UI
+        job.cancel()
+    """
+
+    def __init__(self, token, messages, client=None, kind='', log_table='broadcast_logs',
+                 rate=BROADCAST_RATE, concurrency=BROADCAST_CONCURRENCY, log_batch=200):
+        self.id = uuid.uuid4().hex[:12]
+        self.token = token
+        self.messages = dict(messages)
+        self.client = client
+        self.kind = kind
+        self.log_table = log_table
+        self.rate = rate
+        self.concurrency = concurrency
+        self.log_batch = log_batch
+        self.total = len(self.messages)
+        self.done = 0
+        self.stats = {}
+        self.results = {}            # chat_id -> status akhir
+        self.status = 'pending'
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._log_buf = []
+        self._log_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bclog")
+        self._log_ok = client is not None
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"broadcast-{self.id}", daemon=True).start()
+        return self
+
+    def cancel(self):
+        self._stop.set()
+
+    def _run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        try:
+            self.stats = asyncio.run(broadcast_message(
+                self.token, list(self.messages), self.messages.get,
+                rate=self.rate, concurrency=self.concurrency,
+                on_progress=self._on_progress, on_result=self._on_result, should_stop=self._stop.is_set
+            ))
+            self.status = 'cancelled' if self._stop.is_set() else 'done'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+            logger.error(f"Broadcast job {self.id} gagal: {e}")
+        finally:
+            self._queue_logs()
+            self._log_pool.shutdown(wait=True)
+            self.finished_at = time.time()
+
+    def _on_progress(self, done, total, stats):
+        self.done = done
+        self.stats = dict(stats)
+
+    def _on_result(self, chat_id, status):
+        self.results[chat_id] = status
+        if not self._log_ok: return
+        try: uid = int(chat_id)
+        except (TypeError, ValueError): uid = None
+        self._log_buf.append({"job_id": self.id, "kind": self.kind, "user_id": uid, "status": status})
+        if len(self._log_buf) >= self.log_batch: self._queue_logs()
+
+    def _queue_logs(self):
+        if not self._log_buf: return
+        batch, self._log_buf = self._log_buf, []
+        # Insert di thread terpisah agar pengiriman pesan tidak ikut menunggu database
+        self._log_pool.submit(self._write_logs, batch)
+
+    def _write_logs(self, batch):
+        if not self._log_ok: return
+        try:
+            self.client.table(self.log_table).insert(batch).execute()
+        except Exception as e:
+            # Tabel belum dibuat / DB bermasalah: status tetap tersedia di memori (job.results)
+            self._log_ok = False
+            logger.error(f"Gagal menulis {self.log_table} (job {self.id}): {e}")
+
+    @property
+    def running(self):
+        return self.status in ('pending', 'running')
+
+    def progress(self):
+        elapsed = (self.finished_at or time.time()) - (self.started_at or time.time())
+        # 'error' = jumlah gagal sementara (dari stats), 'reason' = pesan jika job gagal total
+        return {"sent": 0, "blocked": 0, "failed": 0, "error": 0, **self.stats,
+                "id": self.id, "kind": self.kind, "status": self.status, "done": self.done,
+                "total": self.total, "elapsed": elapsed, "reason": self.error}
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================================================================
+# CACHE TTL + LRU (DIPAKAI BERSAMA OLEH HANDLER BOT & ROUTE FLASK)
+# ==============================================================================
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache key -> value dengan batas umur (TTL) dan batas jumlah entri (LRU).
+    Aman dipakai lintas thread (event loop bot, thread Flask, thread upload).
+    """
+
+    def __init__(self, maxsize=5000, ttl=60, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] < now:
+                if item is not _MISSING: del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def patch(self, key, fields):
+        """Write-through: perbarui sebagian field value (dict) yang sudah ada di cache."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or not isinstance(item[1], dict): return False
+            self._data[key] = (item[0], {**item[1], **fields})
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+        }
+
+
+def _row_bytes(row):
+    """Perkiraan kasar ukuran satu baris dict di memori (kunci + nilai string)."""
+    return 64 + sum(len(str(k)) + len(str(v)) + 16 for k, v in row.items())
+
+
+class ChatRowCache:
+    """
+    Cache baris hasil pencarian per chat (LRU per chat + batas total byte).
+    Dipakai tombol view_ / cp_ agar baris yang barusan tampil tidak di-query ulang.
+    Setiap entri chat ditandai generation; beda generation = dianggap basi.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=600, rows_per_chat=20, name="rows"):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.rows_per_chat = rows_per_chat
+        self.name = name
+        self._data = OrderedDict()   # chat_id -> (expires_at, generation, {key: row}, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(nopol):
+        return str(nopol).replace(" ", "").upper()
+
+    def put(self, chat_id, rows, generation=0):
+        rows = rows[:self.rows_per_chat]
+        entry = {self._key(r.get('nopol')): r for r in rows if r.get('nopol')}
+        size = sum(_row_bytes(r) for r in entry.values())
+        with self._lock:
+            old = self._data.pop(chat_id, None)
+            if old: self.bytes -= old[3]
+            self._data[chat_id] = (time.monotonic() + self.ttl, generation, entry, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._data:
+                _, (_, _, _, b) = self._data.popitem(last=False)
+                self.bytes -= b
+
+    def get(self, chat_id, nopol, generation=0):
+        with self._lock:
+            item = self._data.get(chat_id)
+            if item is None or item[0] < time.monotonic() or item[1] != generation:
+                if item is not None:
+                    del self._data[chat_id]; self.bytes -= item[3]
+                self.misses += 1
+                return None
+            row = item[2].get(self._key(nopol))
+            if row is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(chat_id)
+            self.hits += 1
+            return row
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "chats": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+        }
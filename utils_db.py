@@ -0,0 +1,71 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+# AKSES DATABASE NON-BLOCKING UNTUK EVENT LOOP BOT
+# ==============================================================================
+# Client supabase-py bersifat sinkron. Kalau dipanggil langsung di dalam
+# handler 'async def', satu query lambat membekukan seluruh bot. Semua query
+# dari handler dilewatkan ke sini: dijalankan di thread pool terbatas, dibatasi
+# jumlah query paralelnya, dan diberi batas waktu per panggilan.
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDB:
+    """
+    Pembungkus async untuk client Supabase sinkron.
+
+    Pemakaian:
+        res = await DB.execute(supabase.table('users').select('*').eq('user_id', uid))
+        u = await DB.run(get_user, uid)
+        file = await DB.run(generate_report, timeout=600)
+
+    Catatan: timeout hanya membuat pemanggil berhenti menunggu, thread pool tetap
+    terpakai sampai request HTTP selesai. Pasang timeout HTTP client (postgrest)
+    yang tidak lebih lama dari timeout di sini agar thread benar-benar kembali.
+    """
+
+    def __init__(self, client, pool_size=16, max_concurrency=12, timeout=20):
+        self.client = client
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+        self._sem = None
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _semaphore(self):
+        # Dibuat saat pertama dipakai agar menempel ke event loop milik bot
+        if self._sem is None: self._sem = asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Jalankan fungsi sinkron (query DB) di thread pool. timeout=0 -> tanpa batas."""
+        limit = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            self.calls += 1
+            fut = loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(fut, limit) if limit else await fut
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.error(f"DB Timeout ({limit}s): {getattr(fn, '__name__', fn)}")
+                raise
+            except Exception:
+                self.errors += 1
+                raise
+
+    async def execute(self, query, timeout=None):
+        """Eksekusi query builder postgrest (tanpa .execute()) secara non-blocking."""
+        return await self.run(query.execute, timeout=timeout)
+
+    def stats(self):
+        return {"calls": self.calls, "timeouts": self.timeouts, "errors": self.errors}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
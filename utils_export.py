@@ -0,0 +1,236 @@
+import csv
+import gzip
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import xlsxwriter
+
+# ==============================================================================
+# EXPORT STREAMING: KEYSET PAGINATION -> FILE (XLSX / CSV.GZ / PARQUET)
+# ==============================================================================
+# Tabel besar (mis. 400 ribu aset satu leasing) tidak lagi ditarik sekaligus ke
+# DataFrame. Baris diambil per halaman berurutan kunci (WHERE key > terakhir),
+# langsung ditulis ke file di disk, sehingga memori tetap datar berapa pun
+# jumlah barisnya.
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PAGE_SIZE = 1000          # Samakan dengan max_rows API Supabase
+XLSX_MAX_ROWS = 1048575          # Batas baris data per sheet Excel (tanpa header)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet opsional (pyarrow tidak wajib terpasang)
+    pa = pq = None
+
+EXPORT_FORMATS = ('xlsx', 'csv.gz') + (('parquet',) if pq else ())
+FETCH_WORKERS = 4
+_END = object()
+
+
+class ExportCancelled(Exception):
+    """Export dihentikan lewat event cancel (mis. handler bot kena timeout)."""
+
+
+def iter_keyset_pages(client, table, columns, apply_filters=None, key='nopol', page_size=EXPORT_PAGE_SIZE):
+    """Generator halaman baris (list dict) berurutan `key`, tanpa OFFSET."""
+    last = None
+    while True:
+        q = client.table(table).select(columns)
+        if apply_filters: q = apply_filters(q)
+        if last is not None: q = q.gt(key, last)
+        rows = q.order(key).limit(page_size).execute().data or []
+        if not rows: return
+        yield rows
+        if len(rows) < page_size: return
+        last = rows[-1][key]
+
+
+def iter_rpc_pages(client, fn, params=None, order=(), page_size=EXPORT_PAGE_SIZE):
+    """
+    Generator halaman hasil RPC (fungsi set-returning). max_rows API juga memotong
+    hasil RPC, jadi hasil diurutkan `order` (kolom unik/komposit) lalu diambil per range.
+    """
+    start = 0
+    while True:
+        q = client.rpc(fn, params or {})
+        for col in order: q = q.order(col)
+        rows = q.range(start, start + page_size - 1).execute().data or []
+        if not rows: return
+        yield rows
+        if len(rows) < page_size: return
+        start += page_size
+
+
+def iter_keyset_desc(client, table, columns, apply_filters=None, since=None, until=None,
+                     ts='created_at', pk='id', page_size=EXPORT_PAGE_SIZE):
+    """
+    Generator halaman baris terbaru -> terlama dengan keyset (created_at, id).
+    Tidak memakai range()/OFFSET, jadi halaman ke-100 sama cepatnya dengan halaman pertama.
+    """
+    last = None
+    while True:
+        q = client.table(table).select(columns)
+        if apply_filters: q = apply_filters(q)
+        if since: q = q.gte(ts, since)
+        if until: q = q.lt(ts, until)
+        if last: q = q.or_(f'{ts}.lt."{last[0]}",and({ts}.eq."{last[0]}",{pk}.lt.{last[1]})')
+        rows = q.order(ts, desc=True).order(pk, desc=True).limit(page_size).execute().data or []
+        if not rows: return
+        yield rows
+        if len(rows) < page_size: return
+        last = (rows[-1][ts], rows[-1][pk])
+
+
+def time_slices(start, end, step=timedelta(days=1)):
+    """Potong rentang waktu [start, end) jadi irisan (since, until) ISO, TERBARU dulu."""
+    out = []
+    cur = start
+    while cur < end:
+        nxt = min(cur + step, end)
+        out.append((cur.isoformat(), nxt.isoformat()))
+        cur = nxt
+    return out[::-1]
+
+
+def map_ordered(fn, items, workers=FETCH_WORKERS):
+    """
+    Jalankan fn(item) paralel di thread pool, hasil di-yield SESUAI urutan items.
+    Paling banyak `workers` item diproses di depan, jadi memori tetap terbatas.
+    """
+    it = iter(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        pending = deque(pool.submit(fn, x) for _, x in zip(range(workers), it))
+        while pending:
+            result = pending.popleft().result()
+            nxt = next(it, _END)
+            if nxt is not _END: pending.append(pool.submit(fn, nxt))
+            yield result
+
+
+def fetch_rows_by_ids(client, table, columns, ids, key='user_id', chunk=100, workers=FETCH_WORKERS):
+    """Ambil baris untuk banyak id (chunk 100 id per query, beberapa chunk paralel) -> dict str(id) -> baris."""
+    ids = list(ids)
+    chunks = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+
+    def load(part):
+        # Satu chunk gagal tidak membatalkan chunk lain: id chunk itu saja yang tidak ada di hasil
+        try: return client.table(table).select(columns).in_(key, part).execute().data or []
+        except Exception as e:
+            logger.error(f"fetch_rows_by_ids {table}: {len(part)} id gagal diambil: {e}")
+            return []
+    out = {}
+    for rows in map_ordered(load, chunks, workers):
+        for r in rows: out[str(r[key])] = r
+    return out
+
+
+class _XlsxSink:
+    def __init__(self, path, headers, sheet_name, widths=None):
+        # constant_memory: setiap baris langsung di-flush ke file sementara xlsxwriter
+        self.wb = xlsxwriter.Workbook(path, {'constant_memory': True, 'strings_to_urls': False,
+                                             'nan_inf_to_errors': True})
+        self.header_fmt = self.wb.add_format({'bold': True, 'bg_color': '#D7E4BC', 'border': 1})
+        self.headers = headers
+        self.sheet_name = sheet_name
+        self.widths = widths
+        self.sheets = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheets += 1
+        name = self.sheet_name if self.sheets == 1 else f"{self.sheet_name[:26]} ({self.sheets})"
+        self.ws = self.wb.add_worksheet(name)
+        for c in range(len(self.headers)):
+            self.ws.set_column(c, c, self.widths[c] if self.widths else 15)
+        for c, h in enumerate(self.headers): self.ws.write(0, c, h, self.header_fmt)
+        self.row = 1
+
+    def write(self, values):
+        if self.row > XLSX_MAX_ROWS: self._new_sheet()
+        self.ws.write_row(self.row, 0, values)
+        self.row += 1
+
+    def close(self):
+        self.wb.close()
+
+
+class _CsvGzSink:
+    def __init__(self, path, headers):
+        self.f = gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+        self.w = csv.writer(self.f)
+        self.w.writerow(headers)
+
+    def write(self, values):
+        self.w.writerow(values)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetSink:
+    def __init__(self, path, headers):
+        self.headers = headers
+        self.schema = pa.schema([(h, pa.string()) for h in headers])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        self.buf = []
+
+    def write(self, values):
+        # Skema parquet seluruhnya string: angka ikut dijadikan teks
+        self.buf.append([v if isinstance(v, str) else str(v) for v in values])
+        if len(self.buf) >= 50000: self._flush()
+
+    def _flush(self):
+        if not self.buf: return
+        cols = list(zip(*self.buf))
+        self.writer.write_table(pa.table({h: list(cols[i]) for i, h in enumerate(self.headers)}, schema=self.schema))
+        self.buf = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def _cell(v):
+    # Angka tetap angka (sel numerik di Excel), selain itu teks
+    if v is None: return ""
+    if isinstance(v, (int, float)) and not isinstance(v, bool): return v
+    return str(v)
+
+
+def export_pages(pages, path, columns, headers=None, fmt='xlsx', sheet_name='Sheet1', on_progress=None,
+                 widths=None, cancel=None):
+    """
+    Tulis halaman baris ke `path` secara incremental. Return jumlah baris.
+    columns : kunci dict yang diambil per baris (urutan kolom file)
+    headers : judul kolom di file (default = columns)
+    cancel  : threading.Event opsional, dicek setiap halaman -> ExportCancelled
+    Jika gagal / dibatalkan, file setengah jadi di `path` dihapus.
+    """
+    headers = headers or columns
+    if fmt == 'xlsx': sink = _XlsxSink(path, headers, sheet_name, widths)
+    elif fmt == 'csv.gz': sink = _CsvGzSink(path, headers)
+    elif fmt == 'parquet' and pq: sink = _ParquetSink(path, headers)
+    else: raise ValueError(f"Format export tidak didukung: {fmt}")
+    total = 0
+    ok = False
+    try:
+        for rows in pages:
+            if cancel is not None and cancel.is_set(): raise ExportCancelled(f"Export {path} dibatalkan")
+            for r in rows: sink.write([_cell(r.get(c)) for c in columns])
+            total += len(rows)
+            if on_progress: on_progress(total)
+        ok = True
+    finally:
+        try: sink.close()
+        except Exception as e:
+            if ok: raise
+            logger.error(f"Export {path} gagal ditutup: {e}")
+        if not ok and os.path.exists(path):
+            try: os.remove(path)
+            except OSError: pass
+    return total
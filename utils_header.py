@@ -0,0 +1,100 @@
+import re
+
+# ==============================================================================
+# DETEKSI HEADER & STANDARISASI NAMA KOLOM (DIPAKAI BOT, PORTAL FLASK & STREAMLIT)
+# ==============================================================================
+# Dulu ada tiga salinan berbeda (main.py, route Flask, dashboard.py) yang memanggil
+# df.iloc[i] per baris & memindai tiap list alias per kolom. Sekarang semua alias
+# dinormalisasi SEKALI ke hash map alias -> nama standar, dan header dicari dari
+# sampel kecil baris teratas saja.
+
+COLUMN_ALIASES = {
+    'nopol': ['nopolisi', 'nomorpolisi', 'nopol', 'noplat', 'tnkb', 'licenseplate', 'plat', 'police_no', 'no polisi', 'plate_number', 'platenumber', 'plate_no'],
+    'type': ['type', 'tipe', 'unit', 'model', 'vehicle', 'jenis', 'deskripsiunit', 'merk', 'object', 'kendaraan', 'item', 'brand', 'tipeunit', 'unit_type', 'nama_unit'],
+    'tahun': ['tahun', 'year', 'thn', 'rakitan', 'th', 'yearofmanufacture'],
+    'warna': ['warna', 'color', 'colour', 'cat'],
+    'noka': ['noka', 'norangka', 'nomorrangka', 'chassis', 'chasis', 'vin', 'rangka', 'no rangka', 'chassis_number'],
+    'nosin': ['nosin', 'nomesin', 'nomormesin', 'engine', 'mesin', 'no mesin', 'engine_number'],
+    'finance': ['finance', 'leasing', 'lising', 'multifinance', 'mitra', 'principal', 'client'],
+    'ovd': ['ovd', 'overdue', 'dpd', 'keterlambatan', 'odh', 'hari', 'telat', 'aging', 'days_overdue', 'lates', 'over_due', 'od'],
+    'branch': ['branch', 'area', 'kota', 'pos', 'cabang', 'lokasi', 'wilayah']
+}
+
+HEADER_SCAN_ROWS = 30
+
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]')
+
+
+def normalize_text(text):
+    return _NON_ALNUM.sub('', str(text)).lower()
+
+
+def _build_alias_map():
+    # Alias dinormalisasi dengan aturan yang sama dengan sel file ('No Polisi' -> 'nopolisi').
+    # Jika satu alias muncul di dua kolom standar, yang tertulis lebih dulu menang.
+    amap = {}
+    for std_name, aliases in COLUMN_ALIASES.items():
+        amap.setdefault(std_name, std_name)
+        for alias in aliases: amap.setdefault(normalize_text(alias), std_name)
+    return amap
+
+
+ALIAS_MAP = _build_alias_map()
+NOPOL_KEYS = frozenset(k for k, v in ALIAS_MAP.items() if v == 'nopol')
+
+
+def _row_has_nopol(values):
+    for v in values:
+        if v is None: continue
+        if normalize_text(v) in NOPOL_KEYS: return True
+    return False
+
+
+def find_header_row(raw, max_rows=HEADER_SCAN_ROWS):
+    """
+    Untuk DataFrame mentah (dibaca header=None): index baris header.
+    Baris 0 dipakai jika sudah berisi kolom nopol, selain itu cari di max_rows baris
+    berikutnya. Tidak ketemu -> 0 (perilaku default pandas).
+    """
+    sample = raw.head(max_rows + 1).to_numpy(dtype=object)
+    for i, row in enumerate(sample):
+        if _row_has_nopol(row): return i
+    return 0
+
+
+def canonical_columns(names):
+    """List nama kolom mentah -> (nama kolom baru, list kolom standar yang dikenali). Panjang list tetap."""
+    out, found = [], []
+    for name in names:
+        col = str(name).strip().replace('\ufeff', '').replace('"', '').replace("'", "").lower()
+        std = ALIAS_MAP.get(normalize_text(col))
+        if std and std not in found:
+            out.append(std); found.append(std)
+        else:
+            out.append(col)
+    return out, found
+
+
+def fix_header_position(df):
+    """Jika header asli bukan baris pertama file, pindahkan header ke baris yang berisi kolom nopol."""
+    # 1. Cek apakah header sudah benar di kolom saat ini
+    if _row_has_nopol(df.columns): return df
+    # 2. Jika tidak, cari di 30 baris pertama
+    for i, row in enumerate(df.head(HEADER_SCAN_ROWS).to_numpy(dtype=object)):
+        if _row_has_nopol(row):
+            df.columns = df.iloc[i]
+            return df.iloc[i+1:].reset_index(drop=True)
+    return df
+
+
+def smart_rename_columns(df):
+    """Standarkan nama kolom via ALIAS_MAP -> (df, list kolom standar yang dikenali)."""
+    df.columns, found = canonical_columns(df.columns)
+    return df.loc[:, ~df.columns.duplicated()], found
+
+
+def detect_header(raw):
+    """DataFrame mentah -> (index baris header, nama kolom standar, kolom dikenali)."""
+    header_at = find_header_row(raw)
+    columns, found = canonical_columns(raw.iloc[header_at].tolist())
+    return header_at, columns, found
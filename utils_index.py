@@ -0,0 +1,287 @@
+import re
+import threading
+import time
+from array import array
+
+# ==============================================================================
+# PLATE INDEX: MESIN PENCARIAN NOPOL/NOKA/NOSIN DI MEMORI (OPSIONAL)
+# ==============================================================================
+# Menyimpan kunci nopol/noka/nosin yang sudah dinormalisasi untuk seluruh tabel
+# kendaraan. Pencarian exact & substring dijawab lokal (mikrodetik), database
+# hanya dipanggil untuk mengambil baris detail final berdasarkan nopol.
+
+_RE_NON_ALNUM = re.compile(r'[^A-Z0-9]')
+_EMPTY_VALUES = {'', '-', 'NAN', 'NONE', 'NULL'}
+
+
+def normalize_key(value):
+    """Samakan format kunci: huruf besar, hanya A-Z & 0-9."""
+    if value is None: return ""
+    return _RE_NON_ALNUM.sub('', str(value).upper())
+
+
+def _trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def _put_multi(d, key, row_id):
+    """Satu kunci noka/nosin bisa dimiliki lebih dari satu baris."""
+    cur = d.get(key)
+    if cur is None: d[key] = row_id
+    elif isinstance(cur, int): d[key] = (cur, row_id) if cur != row_id else cur
+    elif row_id not in cur: d[key] = cur + (row_id,)
+
+
+def _drop_multi(d, key, row_id):
+    cur = d.get(key)
+    if cur is None: return
+    if isinstance(cur, int):
+        if cur == row_id: del d[key]
+        return
+    rest = tuple(x for x in cur if x != row_id)
+    if not rest: del d[key]
+    elif len(rest) == 1: d[key] = rest[0]
+    else: d[key] = rest
+
+
+def _iter_multi(value):
+    if value is None: return ()
+    if isinstance(value, int): return (value,)
+    return value
+
+
+class _Snapshot:
+    """Struktur data index (diganti utuh saat rebuild agar pencarian tidak terganggu)."""
+
+    def __init__(self):
+        self.keys = []        # id -> nopol ternormalisasi (None = sudah dihapus)
+        self.raw = {}         # id -> nopol asli di DB (hanya jika beda dengan key)
+        self.id_of = {}       # nopol ternormalisasi -> id
+        self.grams = {}       # trigram -> array('I') berisi id (posting list)
+        self.noka = {}        # noka ternormalisasi -> id / tuple id
+        self.nosin = {}       # nosin ternormalisasi -> id / tuple id
+        self.extra = {}       # id -> (noka, nosin) agar bisa dihapus bersih
+        self.dead = 0
+
+    def add(self, nopol_raw, noka=None, nosin=None):
+        key = normalize_key(nopol_raw)
+        if len(key) < 3: return
+        k_noka = normalize_key(noka)
+        k_nosin = normalize_key(nosin)
+        if k_noka in _EMPTY_VALUES or len(k_noka) < 3: k_noka = ""
+        if k_nosin in _EMPTY_VALUES or len(k_nosin) < 3: k_nosin = ""
+        raw_str = str(nopol_raw)
+
+        row_id = self.id_of.get(key)
+        if row_id is not None:
+            # Nopol sama (upload ulang): trigram tidak berubah, cukup perbarui raw & noka/nosin
+            # di slot yang sama, jadi tidak ada posting ganda / slot mati baru
+            if raw_str != key: self.raw[row_id] = raw_str
+            else: self.raw.pop(row_id, None)
+            if self.extra.get(row_id, ("", "")) == (k_noka, k_nosin): return
+            old_noka, old_nosin = self.extra.pop(row_id, ("", ""))
+            if old_noka: _drop_multi(self.noka, old_noka, row_id)
+            if old_nosin: _drop_multi(self.nosin, old_nosin, row_id)
+        else:
+            row_id = len(self.keys)
+            self.keys.append(key)
+            self.id_of[key] = row_id
+            if raw_str != key: self.raw[row_id] = raw_str
+
+            for g in _trigrams(key):
+                posting = self.grams.get(g)
+                if posting is None: self.grams[g] = posting = array('I')
+                posting.append(row_id)
+
+        if k_noka: _put_multi(self.noka, k_noka, row_id)
+        if k_nosin: _put_multi(self.nosin, k_nosin, row_id)
+        if k_noka or k_nosin: self.extra[row_id] = (k_noka, k_nosin)
+
+    def remove_id(self, row_id):
+        key = self.keys[row_id]
+        if key is None: return
+        self.keys[row_id] = None
+        self.raw.pop(row_id, None)
+        if self.id_of.get(key) == row_id: del self.id_of[key]
+        k_noka, k_nosin = self.extra.pop(row_id, ("", ""))
+        if k_noka: _drop_multi(self.noka, k_noka, row_id)
+        if k_nosin: _drop_multi(self.nosin, k_nosin, row_id)
+        self.dead += 1
+
+    def raw_of(self, row_id):
+        return self.raw.get(row_id, self.keys[row_id])
+
+    def live_rows(self):
+        for row_id, key in enumerate(self.keys):
+            if key is None: continue
+            k_noka, k_nosin = self.extra.get(row_id, ("", ""))
+            yield self.raw_of(row_id), k_noka, k_nosin
+
+
+class PlateIndex:
+    """
+    Index pencarian kendaraan di memori.
+    - Exact: dict nopol/noka/nosin -> id.
+    - Substring nopol: posting list trigram (array 'I' yang ringkas),
+      kandidat dari posting terpendek lalu diverifikasi `kw in key`.
+    Semua mutasi & pencarian dijaga satu lock (Flask thread + event loop bot).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snap = _Snapshot()
+        self._ready = False
+        self._loading = False
+        self._journal = None      # Mutasi selama build berjalan, diputar ulang ke snapshot baru
+        self.loaded_at = None
+        self.last_load_seconds = 0.0
+
+    # --- STATUS ---
+    @property
+    def ready(self):
+        return self._ready
+
+    def __len__(self):
+        with self._lock:
+            return len(self._snap.id_of)
+
+    # --- PENCARIAN ---
+    def search(self, keyword, limit=20):
+        """
+        Padanan lokal dari `nopol.ilike.%kw%,noka.eq.kw,nosin.eq.kw`.
+        Mengembalikan list nopol ASLI (sesuai DB) untuk diambil detailnya.
+        Urutan: exact nopol, exact noka/nosin, lalu substring nopol.
+        """
+        kw = normalize_key(keyword)
+        if len(kw) < 3: return []
+
+        with self._lock:
+            s = self._snap
+            found = []
+            seen = set()
+
+            def take(row_id):
+                if row_id in seen or s.keys[row_id] is None: return False
+                seen.add(row_id); found.append(s.raw_of(row_id))
+                return len(found) >= limit
+
+            exact = s.id_of.get(kw)
+            if exact is not None and take(exact): return found
+            for row_id in _iter_multi(s.noka.get(kw)):
+                if take(row_id): return found
+            for row_id in _iter_multi(s.nosin.get(kw)):
+                if take(row_id): return found
+
+            postings = []
+            for g in _trigrams(kw):
+                p = s.grams.get(g)
+                if p is None: return found
+                postings.append(p)
+            shortest = min(postings, key=len)
+            keys = s.keys
+            for row_id in shortest:
+                key = keys[row_id]
+                if key is not None and kw in key and take(row_id):
+                    break
+            return found
+
+    def resolve_exact(self, keywords):
+        """Banyak nopol sekaligus (satu kali lock) -> dict kunci ternormalisasi -> nopol ASLI."""
+        out = {}
+        with self._lock:
+            s = self._snap
+            for kw in keywords:
+                key = normalize_key(kw)
+                row_id = s.id_of.get(key)
+                if row_id is not None and s.keys[row_id] is not None: out[key] = s.raw_of(row_id)
+        return out
+
+    # --- MUTASI (DIPANGGIL DARI JALUR UPLOAD / HAPUS) ---
+    def add_rows(self, rows):
+        """Upsert: rows berupa dict yang minimal punya 'nopol' (noka/nosin opsional)."""
+        items = [(r['nopol'], r.get('noka'), r.get('nosin')) for r in rows if r and r.get('nopol')]
+        with self._lock:
+            for item in items: self._snap.add(*item)
+            if self._journal is not None: self._journal.append(('add', items))
+
+    def remove_nopols(self, nopols):
+        nopols = list(nopols)
+        with self._lock:
+            if self._journal is not None: self._journal.append(('del', nopols))
+            s = self._snap
+            for n in nopols:
+                row_id = s.id_of.get(normalize_key(n))
+                if row_id is not None: s.remove_id(row_id)
+            # Pemadatan: jika lebih dari separuh slot mati, bangun ulang dari memori
+            if s.dead > 1000 and s.dead * 2 > len(s.keys):
+                fresh = _Snapshot()
+                for raw, k_noka, k_nosin in s.live_rows():
+                    fresh.add(raw, k_noka, k_nosin)
+                self._snap = fresh
+
+    # --- BUILD / LOAD ---
+    def build(self, rows):
+        """Bangun index baru dari iterable rows lalu tukar secara atomik."""
+        with self._lock: self._journal = []
+        try:
+            fresh = _Snapshot()
+            for r in rows:
+                if r and r.get('nopol'):
+                    fresh.add(r['nopol'], r.get('noka'), r.get('nosin'))
+            with self._lock:
+                # Upload / hapus yang terjadi selama rows dibaca mungkin belum ikut: ulangi di snapshot baru
+                for op, items in self._journal:
+                    if op == 'add':
+                        for item in items: fresh.add(*item)
+                    else:
+                        for n in items:
+                            row_id = fresh.id_of.get(normalize_key(n))
+                            if row_id is not None: fresh.remove_id(row_id)
+                self._snap = fresh
+                self._ready = True
+                self.loaded_at = time.time()
+        finally:
+            with self._lock: self._journal = None
+
+    def load_from_db(self, client, page_size=1000):
+        """
+        Tarik kolom kunci saja dari tabel kendaraan dengan keyset pagination
+        (ORDER BY nopol, nopol > last) agar tidak melambat di offset besar.
+        """
+        if self._loading: return
+        self._loading = True
+        started = time.time()
+        try:
+            def iter_rows():
+                last = None
+                while True:
+                    q = client.table('kendaraan').select('nopol, noka, nosin').order('nopol')
+                    if last is not None: q = q.gt('nopol', last)
+                    data = q.limit(page_size).execute().data
+                    if not data: break
+                    yield from data
+                    last = data[-1]['nopol']
+                    if len(data) < page_size: break
+
+            self.build(iter_rows())
+            self.last_load_seconds = time.time() - started
+            print(f"✅ [INDEX] Plate index siap: {len(self):,} nopol ({self.last_load_seconds:.1f} detik)")
+        except Exception as e:
+            print(f"⚠️ [INDEX] Gagal memuat plate index: {e}")
+        finally:
+            self._loading = False
+
+    def start_auto_refresh(self, client, interval_seconds=1800):
+        """
+        Muat index di thread background lalu bangun ulang secara berkala.
+        Rebuild berkala menangkap perubahan dari proses lain (mis. dashboard Streamlit)
+        yang tidak lewat hook add_rows/remove_nopols di bot.
+        """
+        def loop():
+            while True:
+                self.load_from_db(client)
+                time.sleep(interval_seconds)
+
+        t = threading.Thread(target=loop, daemon=True, name="plate-index-refresh")
+        t.start()
+        return t
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytz
+
+from utils_export import fetch_rows_by_ids, iter_keyset_pages
+from utils_quota import is_rpc_missing
+
+# ==============================================================================
+# LEADERBOARD HIT (HARI INI / MINGGU INI / BULAN INI / SEUMUR HIDUP)
+# ==============================================================================
+# Dipakai bersama oleh dashboard (tab LEADERBOARD) dan bot (/leaderboard).
+# Agregasi dilakukan di database lewat RPC leaderboard_hits, yang dikirim hanya
+# top-N baris. Hasil disimpan sebentar (ttl) agar klik berulang tidak query lagi.
+
+TZ_JAKARTA = pytz.timezone('Asia/Jakarta')
+
+LEADERBOARD_WINDOWS = {
+    'today': "HARI INI",
+    'week': "MINGGU INI",
+    'month': "BULAN INI",
+    'lifetime': "SEPANJANG MASA",
+}
+# Alias argumen command bot (/leaderboard minggu)
+WINDOW_ALIASES = {
+    'hari': 'today', 'harian': 'today', 'today': 'today',
+    'minggu': 'week', 'mingguan': 'week', 'week': 'week',
+    'bulan': 'month', 'bulanan': 'month', 'month': 'month',
+    'semua': 'lifetime', 'all': 'lifetime', 'lifetime': 'lifetime',
+}
+
+
+def window_start(window, now=None):
+    """Awal jendela waktu (WIB). None untuk lifetime."""
+    now = now or datetime.now(TZ_JAKARTA)
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'today': return day
+    if window == 'week': return day - timedelta(days=day.weekday())   # Senin 00:00
+    if window == 'month': return day.replace(day=1)
+    if window == 'lifetime': return None
+    raise ValueError(f"Jendela leaderboard tidak dikenal: {window}")
+
+
+class LeaderboardEngine:
+    """
+    Pemakaian:
+        BOARD = LeaderboardEngine(supabase, ttl=60)
+        rows = BOARD.top('week', 10)     # sinkron, panggil via DB.run dari handler bot
+        # -> [{'user_id', 'nama_lengkap', 'agency', 'hits'}, ...] urut hits terbanyak
+    """
+
+    def __init__(self, client, ttl=60, rpc='leaderboard_hits'):
+        self.client = client
+        self.ttl = ttl
+        self.rpc = rpc
+        self.available = True
+        self._cache = {}   # (window, limit, since) -> (waktu, rows)
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.hits = 0
+
+    def top(self, window='lifetime', limit=10):
+        since = window_start(window)
+        key = (window, limit, since.isoformat() if since else None)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self.hits += 1
+                return cached[1]
+        rows = self._query(key[2], limit)
+        with self._lock:
+            # Jendela lama (kemarin / minggu lalu) tidak dipakai lagi
+            self._cache = {k: v for k, v in self._cache.items() if k[2] == key[2] or k[0] != window}
+            self._cache[key] = (time.monotonic(), rows)
+        return rows
+
+    def _query(self, since, limit):
+        self.queries += 1
+        if self.available:
+            try:
+                res = self.client.rpc(self.rpc, {"p_since": since, "p_limit": limit}).execute()
+                return res.data or []
+            except Exception as e:
+                if not is_rpc_missing(e): raise
+                self.available = False
+        return self._fallback(since, limit)
+
+    def _fallback(self, since, limit):
+        """RPC belum terpasang: hitung user_id per halaman, lalu ambil profil top user saja."""
+        counts = Counter()
+        flt = (lambda q: q.gte('created_at', since)) if since else None
+        for page in iter_keyset_pages(self.client, 'finding_logs', 'id, user_id', apply_filters=flt, key='id'):
+            counts.update(r['user_id'] for r in page if r.get('user_id') is not None)
+        out = []
+        # Ambil kandidat lebih banyak dari limit karena PIC dibuang setelah profil dimuat
+        ranked = counts.most_common()
+        for i in range(0, len(ranked), limit * 2):
+            part = ranked[i:i + limit * 2]
+            users = fetch_rows_by_ids(self.client, 'users', 'user_id, nama_lengkap, agency, role', [uid for uid, _ in part])
+            for uid, n in part:
+                u = users.get(str(uid))
+                if not u or u.get('role') == 'pic': continue
+                out.append({'user_id': uid, 'nama_lengkap': u.get('nama_lengkap'), 'agency': u.get('agency'), 'hits': n})
+                if len(out) >= limit: return out
+        return out
+
+    def stats(self):
+        return {"queries": self.queries, "cache_hits": self.hits, "rpc": self.available}
@@ -0,0 +1,187 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# STANDARISASI NAMA LEASING (KAMUS + MATCHER TERKOMPILASI)
+# ==============================================================================
+# Kamus Cerdas Standarisasi Nama Leasing Indonesia (V3.0 - FINAL COMPLETE).
+# URUTAN KAMUS = PRIORITAS: jika beberapa kata kunci terkandung di nama PT,
+# label dari kata kunci yang tertulis PALING ATAS yang dipakai.
+
+# DICTIONARY: "KATA KUNCI (NAMA PT)": "LABEL STANDAR (SINGKATAN)"
+LEASING_KEYWORDS = {
+    # === 1. GROUP JTRUST & OLYMPINDO ===
+    "JTRUST INVESTMENT": "JTII",
+    "J TRUST INVESTMENT": "JTII",
+    "JTRUST OLYMPINDO": "JTO FINANCE",
+    "OLYMPINDO": "JTO FINANCE",
+    "JTO": "JTO FINANCE",
+    
+    # === 2. GROUP ASTRA & ANAK USAHA ===
+    "FEDERAL INTERNATIONAL": "FIF GROUP",
+    "FIF": "FIF GROUP",
+    "SPEKTRA": "FIF GROUP",
+    "ASTRA SEDAYA": "ACC",
+    "ACC": "ACC",
+    "TOYOTA ASTRA": "TAF",
+    "TAF": "TAF",
+    "ASTRA MULTI": "AMF",
+    "KOMATSU": "KOMATSU",
+    "SAN FINANCE": "SANF",
+    "SURYA ARTHA": "SANF",
+    
+    # === 3. GROUP BANK & BUMN ===
+    "BCA FINANCE": "BCA FINANCE",
+    "CSUL": "CSUL FINANCE", # Ciptadana
+    "MANDIRI TUNAS": "MTF",
+    "MANDIRI UTAMA": "MUF",
+    "CIMB NIAGA": "CNAF",
+    "CNAF": "CNAF",
+    "BNI MULTI": "BNI MULTIFINANCE",
+    "BRI FINANCE": "BRI FINANCE",
+    "BRI MULTI": "BRI FINANCE",
+    "BSI OTO": "BSI OTO",
+    "SYARIAH INDONESIA": "BSI OTO",
+    "MNC FINANCE": "MNC FINANCE",
+    "MNC GUNA": "MNC FINANCE",
+    "MEGA FINANCE": "MEGA FINANCE",
+    "MEGA AUTO": "MACF",
+    "MEGA CENTRAL": "MACF",
+    "KB BUKOPIN": "BUKOPIN",
+    "BUKOPIN": "BUKOPIN",
+    
+    # === 4. GROUP SWASTA BESAR (MAJOR PLAYERS) ===
+    "ADIRA": "ADIRA",
+    "BUSSAN AUTO": "BAF",
+    "BAF": "BAF",
+    "YAMAHA": "BAF", # Sering disebut Yamaha Finance
+    "WAHANA OTTOMITRA": "WOM FINANCE",
+    "WOM": "WOM FINANCE",
+    "BFI": "BFI FINANCE",
+    "SUMMIT OTO": "OTO/SUMMIT",
+    "OTO MULTI": "OTO/SUMMIT",
+    "CLIPAN": "CLIPAN",
+    "SINAR MAS": "SINARMAS",
+    "SINARMAS": "SINARMAS",
+    "SIMAS": "SINARMAS",
+    "MANDALA": "MANDALA FINANCE", # [BARU] Wajib ada
+    
+    # === 5. DEALER & BRAND AFFILIATED ===
+    "SUZUKI": "SFI",
+    "SFI": "SFI",
+    "INDOMOBIL": "IMFI",
+    "IMFI": "IMFI",
+    "DIPO STAR": "DIPO STAR",
+    "MITSUBISHI": "DIPO STAR",
+    "HINO": "HINO FINANCE",
+    "CHAILEASE": "CHAILEASE",
+    "WULING": "WULING FINANCE", # [BARU]
+    
+    # === 6. CONSUMER & FINTECH (SERING ADA MOTOR) ===
+    "HOME CREDIT": "HCI",
+    "HCI": "HCI",
+    "AEON": "AEON CREDIT",
+    "KREDIVO": "KREDIVO",
+    "AKULAKU": "AKULAKU",
+
+    # === 7. MULTIFINANCE LAINNYA (A-Z) ===
+    "AL IJARAH": "AL IJARAH",
+    "ANDALAN": "ANDALAN FINANCE",
+    "ARTHA PRIMA": "ARTHA PRIMA",
+    "ARTHAASIA": "ARTHAASIA", # [BARU]
+    "BATAVIA": "BATAVIA PROSPERINDO",
+    "BENTARA": "BESS FINANCE",
+    "BESS": "BESS FINANCE",
+    "BIMA MULTI": "BIMA FINANCE",
+    "BUANA": "BUANA FINANCE",
+    "CAPITAL": "CAPITAL",
+    "CLEMENT": "CLEMENT", # Ejaan yang benar Clement
+    "CLEMONT": "CLEMENT",
+    "COLUMBIA": "COLUMBIA",
+    "DANASUPRA": "DANASUPRA",
+    "ESTA DANA": "ESTA DANA",
+    "FINANSIA": "KREDIT PLUS",
+    "KREDIT PLUS": "KREDIT PLUS",
+    "KPLUS": "KREDIT PLUS",
+    "GLOBALINDO": "GLOBAL FINANCE",
+    "HEXA": "HEXA",
+    "INTAN BARU": "IBF",
+    "IBF": "IBF",
+    "INTRA ASIA": "INTRA ASIA",
+    "ISTANA": "ISTANA", # IMG
+    "KEMBANG 88": "KEMBANG 88",
+    "KRESNA": "KRESNA REKSA",
+    "MAYBANK": "MAYBANK FINANCE",
+    "MITSUI": "MITSUI LEASING",
+    "MULTI INDO": "MULTI INDO",
+    "NUSA SURYA": "NSC FINANCE",
+    "NSC": "NSC FINANCE",
+    "ORICO": "ORICO BALIMOR", # [BARU] Ex Mizuho
+    "BALIMOR": "ORICO BALIMOR",
+    "PRO CAR": "PRO CAR",
+    "PRO MITRA": "PRO CAR",
+    "RADANA": "RADANA",
+    "REKSA": "REKSA FINANCE",
+    "RESURSA": "RESURSA",
+    "SMS": "SMS FINANCE",
+    "SINAR MITRA": "SMS FINANCE",
+    "SMART MULTI": "SMART FINANCE",
+    "SMART FINANCE": "SMART FINANCE",
+    "SUNINDO": "SUNINDO",
+    "SWADHARMA": "SWADHARMA",
+    "TIFA": "TIFA",
+    "TOPAZ": "TOPAZ", # [BARU]
+    "TRUST": "TRUST FINANCE",
+    "VERENA": "VERENA",
+    "WOKA": "WOKA FINANCE"
+}
+
+_LEASING_PRIORITY = {key: i for i, key in enumerate(LEASING_KEYWORDS)}
+_LEASING_LABELS = list(LEASING_KEYWORDS.values())
+
+# Satu regex untuk seluruh kamus. Alternasi dibungkus lookahead agar finditer
+# mencoba SETIAP posisi (termasuk kata kunci yang saling tumpang tindih); di tiap
+# posisi alternasi mengembalikan kata kunci berprioritas tertinggi yang cocok.
+# Minimum prioritas dari semua posisi == hasil loop 'for key in keywords' lama.
+_LEASING_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(key) for key in LEASING_KEYWORDS) + "))"
+)
+
+
+@lru_cache(maxsize=20000)
+def _match_leasing(text):
+    best = None
+    for m in _LEASING_PATTERN.finditer(text):
+        prio = _LEASING_PRIORITY[m.group(1)]
+        if best is None or prio < best:
+            best = prio
+            if best == 0: break
+    # Jika nama PT sangat asing dan tidak ada di kamus,
+    # Kembalikan nama aslinya (Upper Case) agar admin sadar ada leasing baru
+    return text if best is None else _LEASING_LABELS[best]
+
+
+def standardize_leasing_name(raw_name):
+    """
+    Mendeteksi Nama PT Panjang -> Mengubah ke Label Singkatan Resmi.
+    Hasil per teks di-memo (lru_cache), jadi nama yang berulang tidak dicocokkan ulang.
+    """
+    if not raw_name: return "UNKNOWN"
+    return _match_leasing(str(raw_name).upper().strip())
+
+
+def standardize_leasing_series(series):
+    """
+    Versi kolom DataFrame: hanya nilai UNIK yang distandarisasi, lalu dipetakan
+    balik ke seluruh baris. Hasil identik dengan series.apply(standardize_leasing_name).
+    """
+    codes, uniques = pd.factorize(series)
+    labels = np.array([standardize_leasing_name(v) for v in uniques] + [None], dtype=object)
+    out = labels[codes]
+    # Baris kosong (kode -1): None -> "UNKNOWN", NaN -> "NAN", sama seperti apply()
+    empty = codes == -1
+    if empty.any(): out[empty] = [standardize_leasing_name(v) for v in series.to_numpy()[empty]]
+    return pd.Series(out, index=series.index, name=series.name)
@@ -1,29 +1,43 @@
-import os
-from supabase import create_client
+import atexit
+import threading
 from dotenv import load_dotenv
 
+from utils_supabase import get_client
+
 # Load Environment Variables
 load_dotenv()
 
+# --- BUFFER LOG RIWAYAT UPLOAD ---
+# catat_log_kendaraan hanya menambah ke buffer (jumlah per sumber+leasing digabung),
+# flush_log_kendaraan mengirim semuanya dalam SATU insert saat upload selesai.
+_PENDING = {}
+_LOCK = threading.Lock()
+
 def catat_log_kendaraan(sumber, leasing, jumlah):
-    """Mencatat riwayat penambahan data kendaraan ke database log."""
-    # Menyesuaikan dengan variabel di main.py Komandan
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_KEY")
-    
-    if not url or not key:
-        print("❌ LOG ERROR: SUPABASE_URL atau SUPABASE_KEY tidak ditemukan.")
-        return
-        
+    """Mencatat riwayat penambahan data kendaraan (masuk buffer, kirim dengan flush_log_kendaraan)."""
+    k = (sumber, str(leasing).upper())
+    with _LOCK:
+        _PENDING[k] = _PENDING.get(k, 0) + int(jumlah)
+
+def flush_log_kendaraan():
+    """Kirim semua log di buffer ke tabel riwayat_upload_kendaraan. Return jumlah baris."""
+    with _LOCK:
+        pending = dict(_PENDING)
+        _PENDING.clear()
+    if not pending: return 0
+
+    payload = [{"sumber": s, "leasing": l, "jumlah": j} for (s, l), j in pending.items()]
     try:
-        supabase = create_client(url, key)
-        payload = {
-            "sumber": sumber,
-            "leasing": str(leasing).upper(),
-            "jumlah": int(jumlah)
-        }
-        # Mengirim ke tabel riwayat_upload_kendaraan
-        supabase.table("riwayat_upload_kendaraan").insert(payload).execute()
-        print(f"📝 Log Recorded: {leasing} (+{jumlah}) via {sumber}")
+        # Client Supabase bersama (tidak membuat koneksi baru per log)
+        get_client().table("riwayat_upload_kendaraan").insert(payload).execute()
+        for p in payload: print(f"📝 Log Recorded: {p['leasing']} (+{p['jumlah']}) via {p['sumber']}")
+        return len(payload)
     except Exception as e:
-        print(f"⚠️ Log Error: {e}")
\ No newline at end of file
+        print(f"⚠️ Log Error: {e}")
+        # Kembalikan ke buffer agar ikut terkirim di flush berikutnya
+        with _LOCK:
+            for k, j in pending.items(): _PENDING[k] = _PENDING.get(k, 0) + j
+        return 0
+
+# Jaga-jaga: log yang belum sempat di-flush tetap dikirim saat proses berhenti
+atexit.register(flush_log_kendaraan)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+# ==============================================================================
+# DISPATCHER NOTIFIKASI TELEGRAM (ANTRIAN + RATE LIMIT)
+# ==============================================================================
+# Notifikasi hit (log pusat, group leasing, group agency) tidak lagi dikirim satu
+# per satu di dalam handler. Pesan dimasukkan ke antrian lalu dikirim paralel oleh
+# beberapa worker, dibatasi token bucket global (~30 pesan/detik) & per chat
+# (group: ~20 pesan/menit). Balasan 429 dihormati lewat retry_after.
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket sederhana: rate token per detik, maksimal capacity token tersimpan."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self):
+        """Ambil satu token. Return lama menunggu (detik) sebelum token itu boleh dipakai."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, seconds):
+        """Dipanggil saat Telegram membalas 429: tahan bucket selama retry_after."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def _retry_seconds(err):
+    ra = err.retry_after
+    return ra.total_seconds() if hasattr(ra, 'total_seconds') else float(ra)
+
+
+class NotificationDispatcher:
+    """
+    Pemakaian:
+        NOTIFIER = NotificationDispatcher(workers=8)
+        NOTIFIER.start(application.bot)                  # di post_init
+        NOTIFIER.send(chat_id, text, parse_mode='HTML')  # tidak menunggu Telegram
+        await NOTIFIER.stop()                            # di post_shutdown (kirim sisa antrian)
+    """
+
+    def __init__(self, workers=8, global_rate=30, chat_rate=20 / 60, chat_burst=3,
+                 max_queue=10000, max_retries=3, max_chats=5000):
+        self.workers = max(1, workers)
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.max_queue = max_queue
+        self._chats = OrderedDict()   # chat_id -> TokenBucket (LRU)
+        self._queue = None
+        self._tasks = []
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.throttled = 0
+
+    def start(self, bot):
+        self.bot = bot
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def send(self, chat_id, text, **kwargs):
+        """Masukkan pesan ke antrian. False jika dispatcher belum jalan / antrian penuh."""
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((chat_id, text, kwargs, 0, False))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"Antrian notifikasi penuh, pesan ke {chat_id} dibuang")
+            return False
+
+    def _chat_bucket(self, chat_id):
+        b = self._chats.get(chat_id)
+        if b is None:
+            b = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > self.max_chats: self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return b
+
+    async def _worker(self):
+        while True:
+            chat_id, text, kwargs, attempt, reserved = await self._queue.get()
+            try:
+                await self._deliver(chat_id, text, kwargs, attempt, reserved)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Notifikasi ke {chat_id} gagal: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id, text, kwargs, attempt, reserved):
+        bucket = self._chat_bucket(chat_id)
+        wait = 0.0 if reserved else max(bucket.delay(), self.global_bucket.delay())
+        if wait > 0:
+            self.throttled += 1
+            if wait > 1:
+                # Chat ini sedang penuh (mis. log pusat saat ramai): jangan tahan worker,
+                # jadwalkan ulang dengan token yang sudah dipesan
+                asyncio.get_running_loop().call_later(wait, self._requeue, (chat_id, text, kwargs, attempt, True))
+                return
+            await asyncio.sleep(wait)
+        try:
+            await self.bot.send_message(chat_id, text, **kwargs)
+            self.sent += 1
+        except RetryAfter as e:
+            secs = _retry_seconds(e)
+            bucket.block(secs)
+            if attempt + 1 >= self.max_retries: raise
+            # Worker tidak ikut tidur: pesan dijadwalkan ulang setelah retry_after
+            asyncio.get_running_loop().call_later(secs, self._requeue, (chat_id, text, kwargs, attempt + 1, False))
+        except (Forbidden, BadRequest):
+            raise   # Bot dikeluarkan dari grup / chat tidak valid: tidak perlu diulang
+        except NetworkError:
+            if attempt + 1 >= self.max_retries: raise
+            asyncio.get_running_loop().call_later(2 ** attempt, self._requeue, (chat_id, text, kwargs, attempt + 1, False))
+
+    def _requeue(self, job):
+        if self._queue is None:   # Dispatcher sudah dihentikan
+            self.dropped += 1
+            return
+        try: self._queue.put_nowait(job)
+        except asyncio.QueueFull: self.dropped += 1
+
+    async def stop(self, timeout=10):
+        if self._queue is None: return
+        try: await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError: logger.error(f"Notifikasi tersisa saat shutdown: {self._queue.qsize()}")
+        for t in self._tasks: t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []; self._queue = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "sent": self.sent, "failed": self.failed,
+            "dropped": self.dropped, "throttled": self.throttled,
+        }
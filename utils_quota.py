@@ -0,0 +1,105 @@
+import logging
+import threading
+
+# ==============================================================================
+# KUOTA HARIAN: RPC ATOMIK + SHADOW COUNTER LOKAL
+# ==============================================================================
+# Reset harian, cek limit & increment dilakukan server-side oleh fungsi SQL
+# consume_daily_quota (supabase/migrations). Hasil terakhir tiap user disimpan
+# di shadow counter agar user yang sudah mentok limit langsung ditolak tanpa
+# query sampai hari berganti.
+
+logger = logging.getLogger(__name__)
+
+
+def is_rpc_missing(err):
+    """PGRST202 = fungsi belum dipasang di database (migration belum dijalankan)."""
+    text = str(err)
+    return 'PGRST202' in text or 'Could not find the function' in text
+
+
+class QuotaGuard:
+    """
+    Pemakaian:
+        QUOTA = QuotaGuard(supabase)
+        if QUOTA.over_limit(user_id, '2026-10-17', 500): tolak()
+        hasil = QUOTA.consume(user_id, 500, '2026-10-17')   # sinkron, panggil via DB.run
+        # -> (allowed, daily_usage) atau None jika RPC belum tersedia
+        hasil = QUOTA.consume_many(user_id, 500, '2026-10-17', 12)   # cek massal, satu RPC
+        # -> (granted, daily_usage) atau None jika RPC versi p_count belum tersedia
+    """
+
+    def __init__(self, client, rpc='consume_daily_quota'):
+        self.client = client
+        self.rpc = rpc
+        self.available = True
+        self.counted = True     # Overload consume_daily_quota(..., p_count) terpasang
+        self._day = None
+        self._usage = {}        # user_id -> daily_usage terakhir yang diketahui (hari _day)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rejected_local = 0
+        self.rejected_db = 0
+
+    def _roll(self, day):
+        if day != self._day:
+            self._day = day
+            self._usage.clear()
+
+    def over_limit(self, user_id, day, limit):
+        """Tolak cepat dari shadow counter (tanpa query). limit None = tanpa batas."""
+        if limit is None: return False
+        with self._lock:
+            self._roll(day)
+            usage = self._usage.get(user_id)
+        if usage is not None and usage >= limit:
+            self.rejected_local += 1
+            return True
+        return False
+
+    def consume(self, user_id, limit, day):
+        if not self.available: return None
+        try:
+            res = self.client.rpc(self.rpc, {"p_user_id": user_id, "p_limit": limit, "p_today": day}).execute()
+        except Exception as e:
+            if is_rpc_missing(e):
+                self.available = False
+                logger.error(f"RPC {self.rpc} belum terpasang, kuota kembali ke mode lama: {e}")
+                return None
+            raise
+        self.calls += 1
+        row = (res.data or [{}])[0]
+        allowed = bool(row.get('allowed', True))
+        usage = int(row.get('daily_usage') or 0)
+        with self._lock:
+            self._roll(day)
+            # Setelah limit tercapai, shadow counter ditandai penuh agar cek berikutnya lokal
+            self._usage[user_id] = usage if allowed or limit is None else max(usage, limit)
+        if not allowed: self.rejected_db += 1
+        return allowed, usage
+
+    def consume_many(self, user_id, limit, day, count):
+        """Pakai `count` kuota sekaligus, diberikan sebanyak sisa limit."""
+        if not self.available or not self.counted: return None
+        try:
+            res = self.client.rpc(self.rpc, {"p_user_id": user_id, "p_limit": limit, "p_today": day, "p_count": count}).execute()
+        except Exception as e:
+            if is_rpc_missing(e):
+                # Hanya versi p_count yang belum ada: versi 1 kuota tetap dipakai
+                self.counted = False
+                logger.error(f"RPC {self.rpc}(p_count) belum terpasang, cek massal memakai kuota per hit: {e}")
+                return None
+            raise
+        self.calls += 1
+        row = (res.data or [{}])[0]
+        granted = int(row.get('granted', count) or 0)
+        usage = int(row.get('daily_usage') or 0)
+        with self._lock:
+            self._roll(day)
+            self._usage[user_id] = usage if granted >= count or limit is None else max(usage, limit)
+        if granted < count: self.rejected_db += 1
+        return granted, usage
+
+    def stats(self):
+        return {"users": len(self._usage), "rpc": self.calls, "available": self.available,
+                "rejected_local": self.rejected_local, "rejected_db": self.rejected_db}
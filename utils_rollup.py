@@ -0,0 +1,100 @@
+import threading
+from collections import Counter
+
+# ==============================================================================
+# ROLLUP HIT HARIAN DI MEMORI (UNTUK /rekap, /cekagency)
+# ==============================================================================
+# Setiap hit yang dicatat (log_successful_hit) juga menambah counter
+# (leasing, nama_pt, user_id) untuk hari itu. Tampilan summary cukup membaca
+# counter ini; tampilan detail memakai key-nya untuk tahu user mana yang relevan
+# lalu hanya menarik baris milik user tersebut dari finding_logs.
+# Saat bot start di tengah hari, counter dimuat sekali dari RPC daily_hit_rollup.
+
+HIT_ROLLUP_FIELDS = "leasing, nama_pt, user_id"
+
+
+class HitRollup:
+    """
+    Pemakaian:
+        ROLLUP = HitRollup()
+        ROLLUP.begin_load(day)            # lalu ambil snapshot database...
+        ROLLUP.load(day, rows, unflushed) # rows: dict leasing/nama_pt/user_id(/hits)
+        ROLLUP.add(day, payload)          # dipanggil setiap hit
+        ROLLUP.by_leasing(day)            # Counter leasing -> jumlah
+        ROLLUP.keys(day)                  # {(leasing, nama_pt, user_id): jumlah}
+    Hanya satu hari (hari berjalan) yang disimpan.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.day = None
+        self.loaded = False
+        self._counts = Counter()
+        self._loading = None          # Hari yang sedang dimuat dari database
+        self._pending = []            # (key, payload) hit yang masuk selama load berjalan
+
+    def _roll(self, day):
+        if day != self.day:
+            # Hari baru saat proses sudah berjalan: mulai dari nol, tidak perlu load
+            self.loaded = self.day is not None and self.loaded
+            self.day = day
+            self._counts = Counter()
+
+    def ready(self, day):
+        with self._lock:
+            self._roll(day)
+            return self.loaded
+
+    def begin_load(self, day):
+        """Panggil SEBELUM snapshot database diambil: hit sesudahnya ditampung untuk load()."""
+        with self._lock:
+            self._loading = day
+            self._pending = []
+
+    def cancel_load(self):
+        with self._lock:
+            self._loading = None
+            self._pending = []
+
+    def load(self, day, rows, unflushed=None):
+        """
+        unflushed(payload) -> True jika baris hit itu BELUM ada di database saat snapshot.
+        Hanya hit tersebut yang ditambahkan ke snapshot (yang sudah terkirim sudah terhitung).
+        None = semua hit selama load dianggap belum ada di snapshot.
+        """
+        counts = Counter()
+        for r in rows:
+            counts[(r.get('leasing') or '-', r.get('nama_pt') or '-', r.get('user_id'))] += int(r.get('hits', 1))
+        with self._lock:
+            if self._loading == day:
+                for key, payload in self._pending:
+                    if unflushed is None or unflushed(payload): counts[key] += 1
+            self._loading = None
+            self._pending = []
+            self.day = day
+            self._counts = counts
+            self.loaded = True
+        return sum(counts.values())
+
+    def add(self, day, payload):
+        key = (payload.get('leasing') or '-', payload.get('nama_pt') or '-', payload.get('user_id'))
+        with self._lock:
+            self._roll(day)
+            self._counts[key] += 1
+            if self._loading == day: self._pending.append((key, payload))
+
+    def keys(self, day):
+        with self._lock:
+            self._roll(day)
+            return dict(self._counts)
+
+    def by_leasing(self, day, match=None):
+        """Counter leasing -> jumlah hit. match(leasing, nama_pt) opsional untuk menyaring key."""
+        out = Counter()
+        for (leasing, pt, _), n in self.keys(day).items():
+            if match is None or match(leasing, pt): out[leasing] += n
+        return out
+
+    def users(self, day, match):
+        """user_id yang punya hit dengan key cocok match(leasing, nama_pt)."""
+        return sorted({uid for (leasing, pt, uid) in self.keys(day) if uid is not None and match(leasing, pt)})
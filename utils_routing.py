@@ -0,0 +1,94 @@
+import difflib
+import threading
+import time
+
+# ==============================================================================
+# ROUTING NOTIFIKASI HIT -> GROUP LEASING / GROUP AGENCY
+# ==============================================================================
+# Dulu setiap unit ditemukan, notify_leasing_group & notify_agency_group
+# mendownload seluruh tabel leasing_groups / agency_groups lalu mencocokkan
+# nama satu per satu (substring + difflib). Sekarang kedua tabel dimuat sekali
+# ke memori, di-refresh saat /setgroup & /setagency (atau setelah TTL), dan hasil
+# pencocokan per nama leasing/agency disimpan sehingga fan-out cukup lookup dict.
+
+AGENCY_SIMILARITY = 0.8
+
+
+class GroupRouter:
+    """
+    Peta nama leasing/agency -> tuple group_id tujuan notifikasi.
+
+    Pemakaian:
+        ROUTER = GroupRouter(supabase, ttl=300)
+        if ROUTER.stale(): ROUTER.refresh()          # sinkron, panggil via DB.run
+        gids = ROUTER.leasing_targets("BCA FINANCE")
+        gids = ROUTER.agency_targets("PT ELANG PERKASA")
+    """
+
+    def __init__(self, client, ttl=300, max_memo=4096):
+        self.client = client
+        self.ttl = ttl
+        self.max_memo = max_memo
+        self._lock = threading.Lock()
+        # (daftar leasing, daftar agency, memo leasing, memo agency) diganti utuh saat refresh
+        self._state = ((), (), {}, {})
+        self.loaded_at = 0.0
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # --- MUAT ULANG DARI DATABASE (SINKRON) ---
+    def refresh(self):
+        leasing = self.client.table('leasing_groups').select("group_id, leasing_name").execute().data or []
+        agency = self.client.table('agency_groups').select("group_id, agency_name").execute().data or []
+        state = (
+            tuple((str(g['leasing_name']).upper(), g['group_id']) for g in leasing),
+            tuple((str(g['agency_name']).upper(), g['group_id']) for g in agency),
+            {}, {}
+        )
+        with self._lock:
+            self._state = state
+            self.loaded_at = time.monotonic()
+            self.refreshes += 1
+        return len(state[0]), len(state[1])
+
+    def stale(self):
+        return not self.loaded_at or (self.ttl and time.monotonic() - self.loaded_at > self.ttl)
+
+    # --- PENCOCOKAN NAMA (HASIL DISIMPAN PER NAMA UNIK) ---
+    def _lookup(self, memo, key, match):
+        gids = memo.get(key)
+        if gids is not None:
+            self.hits += 1
+            return gids
+        self.misses += 1
+        gids = tuple(dict.fromkeys(match(key)))
+        if len(memo) >= self.max_memo: memo.clear()
+        memo[key] = gids
+        return gids
+
+    def leasing_targets(self, leasing_unit):
+        """Nama finance unit (UPPER) -> group_id leasing yang namanya saling substring."""
+        groups, _, memo, _ = self._state
+        return self._lookup(memo, leasing_unit, lambda name: [
+            gid for g_name, gid in groups if g_name in name or name in g_name
+        ])
+
+    def agency_targets(self, user_agency):
+        """Nama agency matel (UPPER) -> group_id agency (substring atau kemiripan > 0.8)."""
+        _, groups, _, memo = self._state
+
+        def match(name):
+            for g_name, gid in groups:
+                if g_name in name or name in g_name or \
+                        difflib.SequenceMatcher(None, g_name, name).ratio() > AGENCY_SIMILARITY:
+                    yield gid
+        return self._lookup(memo, user_agency, match)
+
+    def stats(self):
+        leasing, agency, memo_l, memo_a = self._state
+        return {
+            "leasing_groups": len(leasing), "agency_groups": len(agency),
+            "memo": len(memo_l) + len(memo_a), "hits": self.hits, "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
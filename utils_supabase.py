@@ -0,0 +1,45 @@
+import os
+import threading
+
+from supabase import create_client
+
+try:
+    from supabase.lib.client_options import ClientOptions
+except ImportError:
+    from supabase import ClientOptions
+
+# ==============================================================================
+# REGISTRY CLIENT SUPABASE (SATU CLIENT PER PROSES)
+# ==============================================================================
+# Membuat client Supabase berarti membuat session HTTP & koneksi TLS baru. Modul
+# (utils_log, daily_broadcast, main, dashboard) cukup memanggil get_client(),
+# client yang sama dipakai ulang selama proses hidup.
+
+_CLIENTS = {}
+_LOCK = threading.Lock()
+
+
+def get_client(url=None, key=None, timeout=None, name="default"):
+    """
+    Client Supabase bersama untuk (url, key, name, timeout). Default url/key dari ENV
+    SUPABASE_URL & SUPABASE_KEY. timeout (detik, HTTP postgrest) ikut menjadi kunci
+    registry: pemanggil dengan timeout berbeda mendapat client sendiri, tidak diam-diam
+    memakai timeout pemanggil pertama. timeout=None memakai client mana pun yang sudah
+    ada untuk (url, key, name), atau membuat client dengan timeout default library.
+    """
+    url = url or os.environ.get("SUPABASE_URL")
+    key = key or os.environ.get("SUPABASE_KEY")
+    if not url or not key: raise ValueError("SUPABASE_URL atau SUPABASE_KEY tidak ditemukan.")
+    with _LOCK:
+        client = _CLIENTS.get((url, key, name, timeout))
+        if client is None and timeout is None:
+            client = next((c for (u, k, n, _), c in _CLIENTS.items() if (u, k, n) == (url, key, name)), None)
+        if client is None:
+            try:
+                opts = ClientOptions(postgrest_client_timeout=timeout) if timeout else None
+                client = create_client(url, key, options=opts) if opts else create_client(url, key)
+            except Exception:
+                # Library lama tanpa ClientOptions: pakai default
+                client = create_client(url, key)
+            _CLIENTS[(url, key, name, timeout)] = client
+        return client
@@ -0,0 +1,198 @@
+import codecs
+import csv
+import io
+import os
+import zipfile
+
+import openpyxl
+import pandas as pd
+
+from utils_header import detect_header
+
+# ==============================================================================
+# ENGINE FILE UPLOAD (CSV / XLSX / XLS / ZIP)
+# ==============================================================================
+# Dipisah dari main.py agar bisa di-import oleh worker process pool (spawn)
+# tanpa ikut menjalankan bot, Flask & koneksi database.
+
+def read_file_robust(content, fname):
+    """
+    Versi INTELLIGENT: 
+    Otomatis mencari separator yang benar (Koma atau Titik Koma)
+    agar tidak gagal baca kolom.
+    """
+    fname = fname.lower()
+    
+    # 1. Cek ZIP
+    if fname.endswith('.zip'):
+        with zipfile.ZipFile(io.BytesIO(content)) as z:
+            valid = [f for f in z.namelist() if f.endswith(('.csv','.xlsx','.xls'))]
+            if not valid: raise ValueError("ZIP Kosong")
+            with z.open(valid[0]) as f: 
+                content = f.read()
+                fname = valid[0].lower()
+    
+    # 2. Cek EXCEL (.xlsx / .xls)
+    if fname.endswith(('.xlsx', '.xls')):
+        try: return pd.read_excel(io.BytesIO(content), dtype=str)
+        except Exception as e: raise ValueError(f"Gagal baca Excel: {e}")
+
+    # 3. Cek CSV (SNIFFING SEKALI JALAN)
+    # Separator & encoding ditebak dari beberapa KB awal, lalu file di-parse SEKALI
+    # dengan engine C (dulu: sampai 9x parse penuh untuk tiap kombinasi).
+    dialect = sniff_csv(content[:CSV_SNIFF_BYTES])
+    try:
+        df = _read_csv_dialect(io.BytesIO(content), dialect)
+    except UnicodeDecodeError:
+        # Karakter non-UTF8 baru muncul setelah bagian sampel
+        dialect['encoding'] = 'latin1'
+        df = _read_csv_dialect(io.BytesIO(content), dialect)
+    except Exception:
+        raise ValueError("Format file tidak dikenali. Pastikan Excel atau CSV yang valid.")
+
+    df.attrs['csv_dialect'] = dialect
+    print(f"✅ CSV Terbaca dengan separator: {dialect['sep']!r} | encoding: {dialect['encoding']}")
+    return df
+
+# --- CSV SNIFFER ---
+CSV_SEPARATORS = [';', ',', '\t', '|']  # Urutan = prioritas jika sama-sama cocok
+CSV_SNIFF_BYTES = 65536
+
+def sniff_csv(sample):
+    """
+    Tebak encoding & separator dari potongan awal file CSV (bytes).
+    Return dict {'sep', 'encoding'} untuk dipakai pd.read_csv & laporan diagnosa upload.
+    """
+    # Buang baris terakhir yang mungkin terpotong
+    if len(sample) >= CSV_SNIFF_BYTES and b'\n' in sample: sample = sample[:sample.rindex(b'\n')]
+
+    if sample.startswith(codecs.BOM_UTF8): encoding = 'utf-8-sig'
+    else:
+        try: sample.decode('utf-8'); encoding = 'utf-8'
+        except UnicodeDecodeError: encoding = 'latin1'
+
+    lines = [l for l in sample.decode(encoding, errors='replace').splitlines() if l.strip()][:100]
+    if not lines: return {'sep': ',', 'encoding': encoding}
+
+    # Separator benar = header terpecah >1 kolom & jumlah kolom tiap baris paling konsisten
+    best_sep, best_score = None, -1.0
+    for sep in CSV_SEPARATORS:
+        counts = [len(r) for r in csv.reader(lines, delimiter=sep)]
+        if counts[0] < 2: continue
+        score = sum(1 for c in counts if c == counts[0]) / len(counts)
+        if score > best_score: best_sep, best_score = sep, score
+    return {'sep': best_sep or ',', 'encoding': encoding}
+
+def _read_csv_dialect(src, dialect, **kwargs):
+    return pd.read_csv(src, sep=dialect['sep'], encoding=dialect['encoding'], dtype=str,
+                       on_bad_lines='skip', engine='c', **kwargs)
+
+# --- ENGINE FILE STREAMING (UPLOAD BESAR) ---
+# read_file_robust memuat seluruh file ke satu DataFrame (cocok untuk preview).
+# Untuk proses upload, file dibaca per potongan agar memori tetap kecil berapapun
+# ukuran file-nya, dan potongan pertama sudah bisa dikirim ke DB lebih dulu.
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", 20000))
+
+def _cell_to_str(v):
+    # Samakan dengan pd.read_excel(dtype=str): 2019.0 -> "2019", kosong -> None
+    if v is None: return None
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    return str(v)
+
+def _open_upload_file(path):
+    """Buka file upload -> (file object biner, nama file asli, ZipFile/None). ZIP -> member pertama."""
+    fname = path.lower()
+    if fname.endswith('.zip'):
+        zf = zipfile.ZipFile(path)
+        valid = [f for f in zf.namelist() if f.endswith(('.csv','.xlsx','.xls'))]
+        if not valid:
+            zf.close()
+            raise ValueError("ZIP Kosong")
+        return zf.open(valid[0]), valid[0].lower(), zf
+    return open(path, 'rb'), fname, None
+
+def _iter_raw_chunks(path, chunksize):
+    """Yield DataFrame mentah (tanpa header, semua teks) per potongan dari CSV/XLSX/XLS/ZIP."""
+    fobj, fname, zf = _open_upload_file(path)
+    try:
+        if fname.endswith('.xlsx'):
+            wb = openpyxl.load_workbook(fobj, read_only=True, data_only=True)
+            try:
+                rows = []
+                for r in wb.worksheets[0].iter_rows(values_only=True):
+                    rows.append([_cell_to_str(v) for v in r])
+                    if len(rows) >= chunksize:
+                        yield pd.DataFrame(rows); rows = []
+                if rows: yield pd.DataFrame(rows)
+            finally: wb.close()
+        elif fname.endswith('.xls'):
+            # Format lama tidak bisa dibaca bertahap, tapi tetap dikirim per potongan
+            df = pd.read_excel(fobj, dtype=str, header=None)
+            for i in range(0, len(df), chunksize): yield df.iloc[i:i+chunksize]
+        else:
+            dialect = sniff_csv(fobj.read(CSV_SNIFF_BYTES)); fobj.seek(0)
+            print(f"✅ [STREAM] CSV separator: {dialect['sep']!r} | encoding: {dialect['encoding']}")
+            reader = _read_csv_dialect(fobj, dialect, header=None, encoding_errors='replace', chunksize=chunksize)
+            for df in reader:
+                df.attrs['csv_dialect'] = dialect
+                yield df
+    finally:
+        fobj.close()
+        if zf: zf.close()
+
+def iter_upload_frames(path, chunksize=UPLOAD_CHUNK_ROWS):
+    """
+    Yield DataFrame per potongan dengan header sudah dibetulkan (logika fix_header_position)
+    dan nama kolom sudah distandarkan (smart_rename_columns).
+    """
+    columns = None
+    for raw in _iter_raw_chunks(path, chunksize):
+        if columns is None:
+            header_at, columns, _ = detect_header(raw)
+            raw = raw.iloc[header_at+1:]
+        # Samakan lebar potongan dengan header (baris Excel bisa beda panjang)
+        raw = raw.reset_index(drop=True).reindex(columns=range(len(columns)))
+        raw.columns = columns
+        yield raw.loc[:, ~raw.columns.duplicated()]
+
+# --- ANALISA CEPAT UNTUK PREVIEW UPLOAD (DIJALANKAN DI PROCESS POOL main.py) ---
+PREVIEW_ROWS = int(os.environ.get("PREVIEW_ROWS", 200))
+
+def analyze_upload_preview(path, n_rows=PREVIEW_ROWS):
+    """Baca hanya N baris pertama: posisi header, kolom yang dikenali & 1 baris contoh."""
+    chunks = _iter_raw_chunks(path, n_rows)
+    try: raw = next(chunks, None)
+    finally: chunks.close()
+    if raw is None or raw.empty: return {"header_at": 0, "cols": [], "found": [], "preview": [], "dialect": None}
+    dialect = raw.attrs.get('csv_dialect')
+    header_at, columns, found = detect_header(raw)
+    body = raw.iloc[header_at+1:].reset_index(drop=True).reindex(columns=range(len(columns)))
+    body.columns = columns
+    body = body.loc[:, ~body.columns.duplicated()].astype(object)
+    preview = body.head(1).where(body.head(1).notna(), None).to_dict('records')
+    return {"header_at": header_at, "cols": columns, "found": found, "preview": preview, "dialect": dialect}
+
+def count_file_rows(path):
+    """Hitung jumlah baris fisik file tanpa membangun DataFrame (CSV: hitung newline, XLSX: dimensi sheet)."""
+    fobj, fname, zf = _open_upload_file(path)
+    try:
+        if fname.endswith('.xlsx'):
+            wb = openpyxl.load_workbook(fobj, read_only=True)
+            try:
+                ws = wb.worksheets[0]
+                # Dimensi dari metadata sheet; jika kosong/tidak wajar, hitung baris satu per satu
+                if ws.max_row and ws.max_row > 1: return ws.max_row
+                return sum(1 for _ in ws.iter_rows(values_only=True))
+            finally: wb.close()
+        if fname.endswith('.xls'):
+            return len(pd.read_excel(fobj, header=None, dtype=str))
+        n = 0; last = b''
+        while True:
+            block = fobj.read(1 << 20)
+            if not block: break
+            n += block.count(b'\n'); last = block
+        if last and not last.endswith(b'\n'): n += 1
+        return n
+    finally:
+        fobj.close()
+        if zf: zf.close()
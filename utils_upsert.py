@@ -0,0 +1,144 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ==============================================================================
+# EKSEKUTOR UPSERT PARALEL + UKURAN BATCH ADAPTIF
+# ==============================================================================
+# Dipakai bersama oleh upload bot (run_background_upload), upload dashboard PIC
+# (Flask) dan tombol EKSEKUSI UPDATE di Streamlit. Beberapa batch dikirim
+# bersamaan, gagal -> retry dengan jeda eksponensial + jitter, dan ukuran batch
+# naik/turun mengikuti latensi nyata serta error statement timeout (57014).
+
+UPSERT_WORKERS = int(os.environ.get("UPSERT_WORKERS", 4))
+UPSERT_BATCH = int(os.environ.get("UPSERT_BATCH", 200))
+UPSERT_MIN_BATCH = int(os.environ.get("UPSERT_MIN_BATCH", 50))
+UPSERT_MAX_BATCH = int(os.environ.get("UPSERT_MAX_BATCH", 1000))
+UPSERT_TARGET_LATENCY = float(os.environ.get("UPSERT_TARGET_LATENCY", 3.0))
+
+
+def is_statement_timeout(err):
+    """Postgres 57014 = 'canceling statement due to statement timeout'."""
+    code = getattr(err, 'code', None)
+    if code is None and getattr(err, 'args', None) and isinstance(err.args[0], dict):
+        code = err.args[0].get('code')
+    return str(code) == '57014' or '57014' in str(err) or 'statement timeout' in str(err).lower()
+
+
+class UpsertExecutor:
+    """
+    Kirim list record ke tabel Supabase dalam batch paralel.
+
+    Pemakaian:
+        ex = UpsertExecutor(supabase, on_batch=lambda mode, batch, res: ...)
+        hasil = ex.run(recs)                                  # UPSERT
+        hasil = ex.run(recs, mode='DELETE', finance='ACC')    # DELETE per nopol
+    Satu objek boleh dipakai berkali-kali (mis. per potongan file): ukuran batch
+    hasil adaptasi & statistik dibawa ke panggilan berikutnya.
+    Callback on_batch / on_progress selalu dipanggil dari thread pemanggil run().
+    """
+
+    def __init__(self, client, table='kendaraan', on_conflict='nopol',
+                 batch_size=UPSERT_BATCH, min_batch=UPSERT_MIN_BATCH, max_batch=UPSERT_MAX_BATCH,
+                 workers=UPSERT_WORKERS, max_retries=5, base_delay=1.0, max_delay=30.0,
+                 target_latency=UPSERT_TARGET_LATENCY, on_batch=None, on_progress=None):
+        self.client = client
+        self.table = table
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.target_latency = target_latency
+        self.on_batch = on_batch
+        self.on_progress = on_progress
+        self.success = 0
+        self.fail = 0
+        self.timings = []      # (jumlah_baris, detik, sukses?)
+        self.last_error = ""
+
+    # --- SATU BATCH (DIJALANKAN DI THREAD WORKER) ---
+    def _send(self, batch, mode, finance):
+        if mode == 'DELETE':
+            q = self.client.table(self.table).delete().in_(self.on_conflict, [d[self.on_conflict] for d in batch])
+            if finance: q = q.eq('finance', finance)
+            return q.execute()
+        return self.client.table(self.table).upsert(batch, on_conflict=self.on_conflict).execute()
+
+    def _run_batch(self, batch, mode, finance):
+        """Return (ok, rows_ok, hasil_per_sub_batch, kena_57014, error_terakhir)."""
+        timeout_hit = False; err = None
+        for attempt in range(self.max_retries):
+            t0 = time.perf_counter()
+            try:
+                res = self._send(batch, mode, finance)
+                self.timings.append((len(batch), time.perf_counter() - t0, True))
+                return True, len(batch), [(batch, res)], timeout_hit, None
+            except Exception as e:
+                self.timings.append((len(batch), time.perf_counter() - t0, False))
+                err = e
+                if is_statement_timeout(e):
+                    timeout_hit = True
+                    # Batch terlalu berat: belah dua & kirim ulang masing-masing
+                    if len(batch) > self.min_batch:
+                        mid = len(batch) // 2
+                        ok_a, n_a, out_a, _, err_a = self._run_batch(batch[:mid], mode, finance)
+                        ok_b, n_b, out_b, _, err_b = self._run_batch(batch[mid:], mode, finance)
+                        return ok_a and ok_b, n_a + n_b, out_a + out_b, True, err_b or err_a
+                if attempt < self.max_retries - 1:
+                    # Exponential backoff + full jitter agar worker tidak retry serempak
+                    time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))))
+        return False, 0, [], timeout_hit, err
+
+    # --- PENGATUR UKURAN BATCH ---
+    def _adapt(self, latency, timeout_hit, ok):
+        if timeout_hit or not ok or latency > self.target_latency:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.max_batch, int(self.batch_size * 1.25) + 1)
+
+    def run(self, records, mode='UPSERT', finance=None, should_stop=None):
+        total = len(records)
+        done = 0; pos = 0; suc = 0; fail = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upsert") as pool:
+            inflight = {}
+            while pos < total or inflight:
+                while pos < total and len(inflight) < self.workers and not (should_stop and should_stop()):
+                    batch = records[pos:pos + self.batch_size]; pos += len(batch)
+                    inflight[pool.submit(self._timed_batch, batch, mode, finance)] = batch
+                if not inflight: break
+                finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    batch = inflight.pop(fut)
+                    ok, rows_ok, outputs, timeout_hit, err, latency = fut.result()
+                    self._adapt(latency, timeout_hit, ok)
+                    suc += rows_ok; fail += len(batch) - rows_ok; done += len(batch)
+                    if err is not None and not ok: self.last_error = str(err)
+                    if self.on_batch:
+                        for sub, res in outputs: self.on_batch(mode, sub, res)
+                    if self.on_progress: self.on_progress(done, total)
+        self.success += suc; self.fail += fail
+        return {"success": suc, "fail": fail, "total": total,
+                "duration": time.perf_counter() - start, "batch_size": self.batch_size}
+
+    def _timed_batch(self, batch, mode, finance):
+        t0 = time.perf_counter()
+        ok, rows_ok, outputs, timeout_hit, err = self._run_batch(batch, mode, finance)
+        return ok, rows_ok, outputs, timeout_hit, err, time.perf_counter() - t0
+
+    def summary(self):
+        """Ringkasan timing per batch untuk laporan/console."""
+        ok_times = sorted(t for _, t, ok in self.timings if ok)
+        if not ok_times:
+            return {"batches": len(self.timings), "avg": 0.0, "p95": 0.0, "batch_size": self.batch_size}
+        return {
+            "batches": len(self.timings),
+            "avg": round(sum(ok_times) / len(ok_times), 3),
+            "p95": round(ok_times[min(len(ok_times) - 1, int(len(ok_times) * 0.95))], 3),
+            "batch_size": self.batch_size,
+        }
@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# ==============================================================================
+# WRITE-BEHIND: LOG TEMUAN (finding_logs) & PEMAKAIAN HARIAN (users)
+# ==============================================================================
+# Setiap hit dulu langsung INSERT ke finding_logs dan UPDATE ke users. Sekarang
+# keduanya hanya dicatat ke buffer memori + file spool lokal, lalu dikirim oleh
+# thread flusher setiap beberapa ratus milidetik: log temuan sebagai satu bulk
+# INSERT, update user digabung jadi satu UPDATE per user per flush. Isi spool
+# diputar ulang saat bot start, jadi data tidak hilang walau proses restart.
+# Baris yang ditolak database secara permanen (constraint / tipe data) dicoba
+# satu per satu; setelah max_attempts gagal dipindah ke file dead-letter
+# (spool_path + ".dead") agar tidak memblokir antrian selamanya.
+
+logger = logging.getLogger(__name__)
+
+# Kode error Postgres/PostgREST yang tidak akan berhasil walau diulang:
+# 22xxx data tidak valid, 23xxx constraint, 42xxx kolom/tabel/syntax, PGRST1xx/2xx request/schema
+PERMANENT_ERROR_PREFIXES = ('22', '23', '42', 'PGRST1', 'PGRST2')
+
+
+def is_permanent_error(err):
+    """True jika error dari database (bukan jaringan / timeout / 5xx) sehingga percuma diulang utuh."""
+    code = getattr(err, 'code', None)
+    if not code and isinstance(getattr(err, 'args', None), tuple) and err.args and isinstance(err.args[0], dict):
+        code = err.args[0].get('code')
+    return bool(code) and str(code).startswith(PERMANENT_ERROR_PREFIXES)
+
+
+def _row_key(kind, data):
+    return kind + json.dumps(data, sort_keys=True, default=str)
+
+
+class WriteBehindBuffer:
+    """
+    Pemakaian:
+        WRITER = WriteBehindBuffer(supabase, spool_path="writebehind_spool.jsonl")
+        WRITER.start()                                       # replay spool + thread flusher
+        WRITER.add_hit({...payload finding_logs...})
+        WRITER.add_user_update(user_id, {'daily_usage': 5, 'last_seen': now_iso})
+        WRITER.flush()                                       # paksa kirim (shutdown / sebelum rekap)
+    """
+
+    def __init__(self, client, spool_path, interval=0.5, max_batch=200, update_workers=4, max_attempts=3):
+        self.client = client
+        self.spool_path = spool_path
+        self.interval = interval
+        self.max_batch = max_batch
+        self.update_workers = max(1, update_workers)
+        self.max_attempts = max(1, max_attempts)
+        self.dead_path = spool_path + ".dead"
+        self._hits = []              # payload finding_logs yang belum terkirim
+        self._users = {}             # user_id -> field users (digabung, nilai terakhir menang)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._spool = None
+        self._thread = None
+        self._attempts = {}          # _row_key -> jumlah gagal permanen berturut-turut
+        self.flushed_hits = 0
+        self.flushed_users = 0
+        self.errors = 0
+        self.dead = 0
+
+    # --- SPOOL LOKAL ---
+    def _open_spool(self):
+        self._spool = open(self.spool_path, 'a', encoding='utf-8')
+
+    def _spool_write(self, kind, data):
+        if self._spool is None: return
+        try:
+            self._spool.write(json.dumps({"k": kind, "d": data}, default=str) + "\n")
+            self._spool.flush()
+        except Exception as e:
+            logger.error(f"Spool write-behind gagal ditulis: {e}")
+
+    def _rewrite_spool(self):
+        """Tulis ulang spool berisi antrian yang masih tertunda (dipanggil dengan _lock dipegang)."""
+        if self._spool is None: return
+        tmp = self.spool_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for p in self._hits: f.write(json.dumps({"k": "hit", "d": p}, default=str) + "\n")
+            for uid, fields in self._users.items(): f.write(json.dumps({"k": "user", "d": [uid, fields]}, default=str) + "\n")
+        self._spool.close()
+        os.replace(tmp, self.spool_path)
+        self._open_spool()
+
+    def _dead_letter(self, kind, data, err):
+        """Simpan baris yang gagal permanen ke file dead-letter (dibuang dari antrian)."""
+        self.dead += 1
+        logger.error(f"Write-behind {kind} dibuang ke {self.dead_path} setelah {self.max_attempts}x gagal: {err}")
+        try:
+            with open(self.dead_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"k": kind, "d": data, "e": str(err), "t": time.time()}, default=str) + "\n")
+        except Exception as e:
+            logger.error(f"Dead-letter write-behind gagal ditulis: {e}")
+
+    def _failed_permanent(self, kind, data, err):
+        """Hitung percobaan gagal. Return True jika masih boleh diulang, False jika sudah dibuang."""
+        key = _row_key(kind, data)
+        n = self._attempts.get(key, 0) + 1
+        if n < self.max_attempts:
+            self._attempts[key] = n
+            return True
+        self._attempts.pop(key, None)
+        self._dead_letter(kind, data, err)
+        return False
+
+    def _replay_spool(self):
+        if not os.path.exists(self.spool_path): return 0
+        n = 0
+        with open(self.spool_path, encoding='utf-8') as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except ValueError: continue   # baris terakhir terpotong saat crash
+                if rec.get("k") == "hit": self._hits.append(rec["d"])
+                elif rec.get("k") == "user": self._merge_user(*rec["d"])
+                n += 1
+        return n
+
+    # --- API PENCATATAN (NON-BLOCKING) ---
+    def _merge_user(self, user_id, fields):
+        cur = self._users.get(user_id)
+        self._users[user_id] = {**cur, **fields} if cur else dict(fields)
+
+    def add_hit(self, payload):
+        with self._lock:
+            self._hits.append(payload)
+            self._spool_write("hit", payload)
+            full = len(self._hits) >= self.max_batch
+        if full: self._wake.set()
+
+    def add_user_update(self, user_id, fields):
+        with self._lock:
+            self._merge_user(user_id, fields)
+            self._spool_write("user", [user_id, fields])
+
+    def pending(self):
+        return len(self._hits) + len(self._users)
+
+    def is_queued(self, payload):
+        """True jika payload hit (objek yang sama dengan add_hit) belum terkirim ke database."""
+        with self._lock:
+            return any(p is payload for p in self._hits)
+
+    @contextmanager
+    def hold(self):
+        """
+        Flush lalu tahan thread flusher selama blok berjalan: tidak ada INSERT dari
+        proses ini, jadi snapshot yang diambil di dalam blok memuat tepat semua hit
+        yang sudah terkirim, dan is_queued() menandai sisanya.
+        """
+        self.flush()
+        with self._flush_lock:
+            yield self
+
+    # --- FLUSH KE DATABASE ---
+    def _update_user(self, item):
+        uid, fields = item
+        self.client.table('users').update(fields).eq('user_id', uid).execute()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                hits, self._hits = self._hits, []
+                users, self._users = self._users, {}
+            if not hits and not users: return 0
+            failed_hits = []; failed_users = {}; dropped = 0
+            for i in range(0, len(hits), self.max_batch):
+                chunk = hits[i:i + self.max_batch]
+                try:
+                    self.client.table('finding_logs').insert(chunk).execute()
+                    self.flushed_hits += len(chunk)
+                    if self._attempts:
+                        for p in chunk: self._attempts.pop(_row_key("hit", p), None)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Write-behind finding_logs gagal ({len(chunk)} baris): {e}")
+                    if not is_permanent_error(e):
+                        failed_hits += chunk   # Jaringan / timeout / 5xx: ulang utuh di flush berikutnya
+                        continue
+                    # Satu baris rusak menggagalkan seluruh chunk: kirim satu per satu
+                    for p in chunk:
+                        retry, n = self._insert_one(p)
+                        if retry: failed_hits.append(p)
+                        dropped += n
+            if users:
+                with ThreadPoolExecutor(max_workers=min(self.update_workers, len(users))) as pool:
+                    for item, err in zip(users.items(), pool.map(self._safe_update, users.items())):
+                        if err is None:
+                            self.flushed_users += 1
+                            if self._attempts: self._attempts.pop(_row_key("user", list(item)), None)
+                        elif not is_permanent_error(err) or self._failed_permanent("user", list(item), err):
+                            failed_users[item[0]] = item[1]
+                        else: dropped += 1
+            with self._lock:
+                # Yang gagal dikembalikan ke depan antrian, update baru tetap menang
+                self._hits = failed_hits + self._hits
+                for uid, fields in failed_users.items():
+                    self._users[uid] = {**fields, **self._users.get(uid, {})}
+                try: self._rewrite_spool()
+                except Exception as e: logger.error(f"Spool write-behind gagal ditulis ulang: {e}")
+            return len(hits) + len(users) - len(failed_hits) - len(failed_users) - dropped
+
+    def _insert_one(self, payload):
+        """Insert satu baris. Return (perlu_diulang, jumlah_dibuang)."""
+        try:
+            self.client.table('finding_logs').insert(payload).execute()
+            self.flushed_hits += 1
+            self._attempts.pop(_row_key("hit", payload), None)
+            return False, 0
+        except Exception as e:
+            self.errors += 1
+            if not is_permanent_error(e): return True, 0
+            if self._failed_permanent("hit", payload, e): return True, 0
+            return False, 1
+
+    def _safe_update(self, item):
+        try:
+            self._update_user(item)
+            return None
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Write-behind users {item[0]} gagal: {e}")
+            return e
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            errors_before = self.errors
+            try: self.flush()
+            except Exception as e: logger.error(f"Write-behind flush error: {e}")
+            # Database sedang bermasalah: beri jeda sebelum mencoba lagi
+            if self.errors > errors_before: time.sleep(min(5, self.interval * 4))
+
+    def start(self):
+        with self._lock:
+            restored = self._replay_spool()
+            self._open_spool()
+        self._thread = threading.Thread(target=self._loop, name="writebehind", daemon=True)
+        self._thread.start()
+        return restored
+
+    def stop(self):
+        self._stop.set(); self._wake.set()
+        if self._thread: self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self):
+        return {"pending": self.pending(), "hits": self.flushed_hits,
+                "users": self.flushed_users, "errors": self.errors, "dead": self.dead}